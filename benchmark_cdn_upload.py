@@ -0,0 +1,91 @@
+"""
+Benchmark dos envios em lote para o CDN, contra o ImageKit local (imagekit_stub.py)
+Compara o fluxo anterior (requests.post sequencial em base64, uma conexão por
+arquivo) com o cliente compartilhado (multipart binário em streaming,
+keep-alive e envios concorrentes), em tempo, conexões e bytes enviados
+Uso: python benchmark_cdn_upload.py [--files 15] [--latency 0.05] [--connect-latency 0.05]
+"""
+import os
+import sys
+import io
+import time
+import base64
+import argparse
+import requests
+
+# Adicionar o diretório raiz ao path
+sys.path.insert(0, os.path.dirname(__file__))
+
+from imagekit_stub import build_parser, start_server
+from src.cdn_client import ImageKitClient, get_session
+
+def make_sample_files(count, width=1600, height=1200):
+    """Fotos sintéticas em JPEG (tamanho típico de upload)"""
+    from PIL import Image
+    files = []
+    for index in range(count):
+        buffer = io.BytesIO()
+        Image.effect_noise((width, height), 40 + index).convert('RGB').save(buffer, 'JPEG', quality=85)
+        files.append(buffer.getvalue())
+    return files
+
+def legacy_upload(upload_url, content, filename, folder):
+    """Fluxo anterior: requests.post avulso (sem reaproveitar conexão)"""
+    response = requests.post(
+        upload_url,
+        data={'file': base64.b64encode(content).decode('utf-8'), 'fileName': filename, 'folder': folder},
+        headers={'Authorization': f'Basic {base64.b64encode(b"bench:").decode()}'},
+        timeout=30
+    )
+    response.raise_for_status()
+    return response.json()
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de envios em lote ao CDN')
+    parser.add_argument('--files', type=int, default=15)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--latency', type=float, default=0.05, help='Atraso por requisição no CDN local (s)')
+    parser.add_argument('--connect-latency', type=float, default=0.05, help='Atraso por conexão nova (s)')
+    args = parser.parse_args()
+
+    stub_options = build_parser().parse_args([
+        '--port', '0', '--latency', str(args.latency), '--connect-latency', str(args.connect_latency)
+    ])
+    server, storage = start_server(stub_options)
+    upload_url = f"http://127.0.0.1:{server.server_address[1]}/api/v1/files/upload"
+
+    files = make_sample_files(args.files)
+    total_mb = sum(len(content) for content in files) / (1024 * 1024)
+    print(f"🖼️  {args.files} arquivos, {total_mb:.1f} MB | latência {args.latency}s + conexão {args.connect_latency}s")
+
+    def report(label, elapsed, before):
+        connections = storage.stats['connections'] - before['connections']
+        sent_mb = (storage.stats['bytes_received'] - before['bytes_received']) / (1024 * 1024)
+        print(
+            f"{label:>9}: {elapsed:.2f} s | {args.files / elapsed:.1f} arquivos/s | "
+            f"{connections} conexões | {sent_mb:.1f} MB enviados"
+        )
+
+    items = [(content, f"bench-{index}.jpg", '/bench') for index, content in enumerate(files)]
+
+    before = dict(storage.stats)
+    started = time.perf_counter()
+    for item in items:
+        legacy_upload(upload_url, *item)
+    report('serial', time.perf_counter() - started, before)
+
+    client = ImageKitClient('bench', get_session(args.concurrency), upload_url=upload_url, concurrency=args.concurrency)
+    before = dict(storage.stats)
+    started = time.perf_counter()
+    results = client.upload_many(items)
+    report('pooled', time.perf_counter() - started, before)
+
+    failures = [result for result in results if isinstance(result, Exception)]
+    ordered = all(result['name'] == item[1] for item, result in zip(items, results) if not isinstance(result, Exception))
+    print(f"✅ Ordem preservada: {ordered} | falhas: {len(failures)}")
+
+    server.shutdown()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,132 @@
+"""
+Benchmark do processamento de imagens do upload local
+Compara o fluxo anterior (gravar, reler com libmagic, verify() e três
+decodificações completas) com o pipeline de decodificação única em cascata
+Cada modo roda em um subprocesso próprio para medir o pico de RSS isolado
+Uso: python benchmark_image_pipeline.py [--runs 10] [--size 4000x3000]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import shutil
+import subprocess
+import tempfile
+
+# Adicionar o diretório raiz ao path
+sys.path.insert(0, os.path.dirname(__file__))
+
+def make_sample_jpeg(path, width, height):
+    """Gera uma foto sintética com detalhes (gradiente + ruído) em JPEG"""
+    from PIL import Image, ImageFilter
+    gradient = Image.linear_gradient('L').resize((width, height))
+    noise = Image.effect_noise((width, height), 64)
+    image = Image.merge('RGB', (gradient, noise, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+    image = image.filter(ImageFilter.SMOOTH)
+    image.save(path, 'JPEG', quality=92)
+
+def legacy_process(content, output_dir, filename):
+    """Fluxo anterior de src/routes/uploads.py (mantido aqui só para comparação)"""
+    import magic
+    from PIL import Image
+
+    file_path = os.path.join(output_dir, filename)
+    with open(file_path, 'wb') as output:
+        output.write(content)
+
+    if not magic.Magic(mime=True).from_file(file_path).startswith('image/'):
+        raise ValueError('não é imagem')
+    with Image.open(file_path) as img:
+        img.verify()
+
+    for prefix, size in (('original', (1920, 1080)), ('medium', (800, 600)), ('thumb', (300, 200))):
+        with Image.open(file_path) as img:
+            if img.mode in ('RGBA', 'LA', 'P'):
+                img = img.convert('RGB')
+            img.thumbnail(size, Image.Resampling.LANCZOS)
+            img.save(os.path.join(output_dir, f"{prefix}_{filename}"), 'JPEG', quality=85, optimize=True)
+
+    os.remove(file_path)
+
+def peak_rss_mb():
+    """
+    Pico de memória residente do processo
+    VmHWM (Linux) é zerado no exec; ru_maxrss herdaria o pico do processo pai
+    """
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def run_mode(mode, sample_path, runs):
+    """Executa um modo no processo atual e imprime o resultado em JSON"""
+    from src.image_pipeline import process_image
+
+    with open(sample_path, 'rb') as sample:
+        content = sample.read()
+
+    output_dir = tempfile.mkdtemp(prefix=f'bench-{mode}-')
+    timings = []
+    try:
+        for index in range(runs):
+            started = time.perf_counter()
+            if mode == 'legacy':
+                legacy_process(content, output_dir, f"{index}.jpg")
+            else:
+                process_image(content, output_dir, f"{index}.jpg")
+            timings.append((time.perf_counter() - started) * 1000)
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+    timings.sort()
+    print(json.dumps({
+        'mode': mode,
+        'runs': runs,
+        'mean_ms': sum(timings) / len(timings),
+        'p50_ms': timings[len(timings) // 2],
+        'max_ms': timings[-1],
+        'peak_rss_mb': peak_rss_mb()
+    }))
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark do pipeline de variantes de imagem')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--size', default='4000x3000', help='Resolução da foto sintética')
+    parser.add_argument('--mode', choices=['legacy', 'pipeline'], help=argparse.SUPPRESS)
+    parser.add_argument('--sample', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        run_mode(args.mode, args.sample, args.runs)
+        return 0
+
+    width, height = (int(value) for value in args.size.lower().split('x'))
+    sample_dir = tempfile.mkdtemp(prefix='bench-sample-')
+    sample_path = os.path.join(sample_dir, 'sample.jpg')
+    make_sample_jpeg(sample_path, width, height)
+    print(f"🖼️  Foto de teste: {width}x{height}, {os.path.getsize(sample_path) / 1024:.0f} KB, {args.runs} execuções")
+
+    try:
+        for mode in ('legacy', 'pipeline'):
+            output = subprocess.run(
+                [sys.executable, __file__, '--mode', mode, '--sample', sample_path, '--runs', str(args.runs)],
+                check=True, capture_output=True, text=True
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(
+                f"{mode:>9}: média {result['mean_ms']:.1f} ms | p50 {result['p50_ms']:.1f} ms | "
+                f"máx {result['max_ms']:.1f} ms | pico RSS {result['peak_rss_mb']:.1f} MB"
+            )
+    finally:
+        shutil.rmtree(sample_dir, ignore_errors=True)
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
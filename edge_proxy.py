@@ -0,0 +1,196 @@
+"""
+Proxy reverso local com cache por surrogate keys (substituto da CDN em testes)
+Encaminha GETs para a API, guarda respostas 200 pelo Surrogate-Control
+(ou Cache-Control max-age) e indexa cada resposta pelas tags do Surrogate-Key
+Purga: POST /__purge com {"keys": [...]} ou {"all": true}
+Uso: python edge_proxy.py --upstream http://localhost:5000 --port 8080
+     EDGE_PURGE_BACKEND=http EDGE_PURGE_URL=http://localhost:8080/__purge python src/main.py
+"""
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+
+# Headers que não devem ser repassados entre conexões
+HOP_BY_HOP_HEADERS = {
+    'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization',
+    'te', 'trailers', 'transfer-encoding', 'upgrade', 'content-length', 'content-encoding'
+}
+
+class SurrogateCache:
+    """Cache em memória: chave (URL) -> resposta, com índice tag -> URLs"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.tags = {}
+        self.stats = {'hits': 0, 'misses': 0, 'purged': 0}
+
+    def get(self, url):
+        with self.lock:
+            entry = self.entries.get(url)
+            if entry and entry['expires_at'] > time.time():
+                self.stats['hits'] += 1
+                return entry
+            if entry:
+                self._drop(url)
+            self.stats['misses'] += 1
+            return None
+
+    def put(self, url, status, headers, body, ttl, keys):
+        with self.lock:
+            self._drop(url)
+            self.entries[url] = {
+                'status': status,
+                'headers': headers,
+                'body': body,
+                'expires_at': time.time() + ttl,
+                'keys': keys
+            }
+            for key in keys:
+                self.tags.setdefault(key, set()).add(url)
+
+    def _drop(self, url):
+        entry = self.entries.pop(url, None)
+        if entry:
+            for key in entry['keys']:
+                urls = self.tags.get(key)
+                if urls:
+                    urls.discard(url)
+                    if not urls:
+                        del self.tags[key]
+        return entry is not None
+
+    def purge(self, keys=None):
+        """Remove as respostas marcadas com as tags (ou tudo); retorna a quantidade"""
+        with self.lock:
+            if keys is None:
+                count = len(self.entries)
+                self.entries.clear()
+                self.tags.clear()
+            else:
+                urls = set()
+                for key in keys:
+                    urls.update(self.tags.get(key, ()))
+                count = sum(1 for url in urls if self._drop(url))
+            self.stats['purged'] += count
+            return count
+
+def edge_ttl(headers):
+    """TTL da borda: Surrogate-Control tem prioridade sobre Cache-Control"""
+    for name in ('Surrogate-Control', 'Cache-Control'):
+        value = headers.get(name, '')
+        if name == 'Cache-Control' and ('no-cache' in value or 'no-store' in value or 'private' in value):
+            return 0
+        match = re.search(r'max-age=(\d+)', value)
+        if match:
+            return int(match.group(1))
+    return 0
+
+def make_handler(upstream, cache):
+    class EdgeProxyHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def send_body(self, status, headers, body, cache_status=None):
+            self.send_response(status)
+            for name, value in headers:
+                self.send_header(name, value)
+            if cache_status:
+                self.send_header('X-Cache', cache_status)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def forward(self, method, body=None):
+            headers = {
+                name: value for name, value in self.headers.items()
+                if name.lower() not in HOP_BY_HOP_HEADERS and name.lower() != 'host'
+            }
+            response = requests.request(
+                method, upstream + self.path, headers=headers, data=body,
+                allow_redirects=False, timeout=30
+            )
+            response_headers = [
+                (name, value) for name, value in response.headers.items()
+                if name.lower() not in HOP_BY_HOP_HEADERS
+            ]
+            return response, response_headers
+
+        def do_GET(self):
+            entry = cache.get(self.path)
+            if entry:
+                self.send_body(entry['status'], entry['headers'], entry['body'], 'HIT')
+                return
+
+            response, headers = self.forward('GET')
+            ttl = edge_ttl(response.headers)
+            keys = response.headers.get('Surrogate-Key', '').split()
+
+            # Requisições autenticadas nunca são compartilhadas
+            if response.status_code == 200 and ttl > 0 and 'Authorization' not in self.headers:
+                # Surrogate-* são consumidos pela borda e não vão ao cliente
+                client_headers = [(n, v) for n, v in headers if not n.lower().startswith('surrogate-')]
+                cache.put(self.path, response.status_code, client_headers, response.content, ttl, keys)
+                self.send_body(response.status_code, client_headers, response.content, 'MISS')
+            else:
+                self.send_body(response.status_code, headers, response.content, 'PASS')
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            body = self.rfile.read(length) if length else b''
+
+            if self.path == '/__purge':
+                try:
+                    data = json.loads(body or b'{}')
+                except json.JSONDecodeError:
+                    self.send_body(400, [('Content-Type', 'application/json')], b'{"error": "JSON invalido"}')
+                    return
+                keys = None if data.get('all') else list(data.get('keys') or [])
+                purged = cache.purge(keys)
+                print(f"🧹 Purga {'total' if keys is None else ' '.join(keys)}: {purged} resposta(s)")
+                payload = json.dumps({'purged': purged, **cache.stats}).encode('utf-8')
+                self.send_body(200, [('Content-Type', 'application/json')], payload)
+                return
+
+            response, headers = self.forward('POST', body)
+            self.send_body(response.status_code, headers, response.content, 'PASS')
+
+        def do_PUT(self):
+            self.pass_through('PUT')
+
+        def do_PATCH(self):
+            self.pass_through('PATCH')
+
+        def do_DELETE(self):
+            self.pass_through('DELETE')
+
+        def pass_through(self, method):
+            length = int(self.headers.get('Content-Length') or 0)
+            body = self.rfile.read(length) if length else None
+            response, headers = self.forward(method, body)
+            self.send_body(response.status_code, headers, response.content, 'PASS')
+
+    return EdgeProxyHandler
+
+def main():
+    parser = argparse.ArgumentParser(description='Proxy reverso local com cache por surrogate keys')
+    parser.add_argument('--upstream', default='http://localhost:5000', help='URL da API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    args = parser.parse_args()
+
+    cache = SurrogateCache()
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(args.upstream.rstrip('/'), cache))
+    print(f"🌐 Proxy em http://{args.host}:{args.port} -> {args.upstream}")
+    print(f"🧹 Purga: POST http://{args.host}:{args.port}/__purge")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Proxy encerrado")
+
+if __name__ == '__main__':
+    main()
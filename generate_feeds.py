@@ -0,0 +1,41 @@
+"""
+Geração dos feeds de anúncios para marketplaces pela linha de comando
+Uso: python generate_feeds.py                       (XML e CSV, incremental)
+     python generate_feeds.py --format xml --full
+     python generate_feeds.py --dir ./public/feeds
+Indicado para execução periódica (cron)
+"""
+import os
+import sys
+import argparse
+
+# Adicionar o diretório raiz ao path
+sys.path.insert(0, os.path.dirname(__file__))
+
+from src.main import create_app
+from src.feeds import build_feed, FEED_FORMATS
+
+def main():
+    parser = argparse.ArgumentParser(description='Gera os feeds de veículos (XML/CSV) para marketplaces')
+    parser.add_argument('--dir', help='Diretório de saída (padrão: FEED_DIR)')
+    parser.add_argument('--format', choices=FEED_FORMATS, action='append', help='Formato do feed (padrão: todos)')
+    parser.add_argument('--full', action='store_true', help='Reconstruir do zero em vez de aplicar apenas as alterações')
+    args = parser.parse_args()
+    
+    app = create_app()
+    root = args.dir or app.config.get('FEED_DIR')
+    
+    if not root:
+        print("❌ Informe --dir ou defina FEED_DIR")
+        return 1
+    
+    with app.app_context():
+        for file_format in args.format or FEED_FORMATS:
+            report = build_feed(root, file_format, full=args.full)
+            print(f"📰 Feed {file_format.upper()} ({report['mode']}): {report['path']}")
+            print(f"   Anúncios: {report['items']} | Alterados: {report['changed']}")
+    
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
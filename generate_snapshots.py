@@ -0,0 +1,46 @@
+"""
+Geração dos snapshots estáticos do catálogo pela linha de comando
+Uso: python generate_snapshots.py                  (usa SNAPSHOT_DIR)
+     python generate_snapshots.py --dir ./public/snapshot
+     python generate_snapshots.py --vehicle-id 12 --vehicle-id 15
+"""
+import os
+import sys
+import argparse
+
+# Adicionar o diretório raiz ao path
+sys.path.insert(0, os.path.dirname(__file__))
+
+from src.main import create_app
+from src.snapshots import generate_full_snapshot, generate_partial_snapshot, MANIFEST_NAME
+
+def main():
+    parser = argparse.ArgumentParser(description='Gera o snapshot estático (JSON + gzip) do catálogo público')
+    parser.add_argument('--dir', help='Diretório de saída (padrão: SNAPSHOT_DIR)')
+    parser.add_argument('--vehicle-id', type=int, action='append', help='Regenerar apenas os arquivos afetados por estes veículos')
+    args = parser.parse_args()
+    
+    app = create_app()
+    root = args.dir or app.config.get('SNAPSHOT_DIR')
+    
+    if not root:
+        print("❌ Informe --dir ou defina SNAPSHOT_DIR")
+        return 1
+    
+    with app.app_context():
+        if args.vehicle_id:
+            summary = generate_partial_snapshot(root, sorted(set(args.vehicle_id)))
+        else:
+            summary = generate_full_snapshot(root)
+    
+    print(f"📁 Snapshot: {os.path.abspath(root)}")
+    print(f"📄 Arquivos no manifest: {summary['files']}")
+    print(f"✍️  Gravados: {summary['written']}")
+    print(f"⏭️  Inalterados: {summary['unchanged']}")
+    print(f"🗑️  Removidos: {summary['removed']}")
+    print(f"🧾 Manifest: {os.path.join(root, MANIFEST_NAME)}")
+    
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
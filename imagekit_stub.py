@@ -0,0 +1,287 @@
+"""
+Servidor local que imita a API do ImageKit (substituto do CDN em testes e benchmarks)
+Implementa o upload (form com base64 ou multipart), detalhes e remoção de
+arquivos, e serve os arquivos enviados em /media
+Com --private-key, exige a autenticação do ImageKit: Basic com a chave privada
+ou, no upload direto pelo navegador, publicKey + signature/expire/token
+(HMAC-SHA1 da chave privada, token de uso único)
+Latência por conexão (--connect-latency, simula o handshake TLS) e por
+requisição (--latency) e uma taxa de falhas 503 (--fail-rate) permitem medir
+o efeito do keep-alive, da concorrência e das novas tentativas
+Uso: python imagekit_stub.py --port 8090 --latency 0.05 --connect-latency 0.05
+     IMAGEKIT_UPLOAD_URL=http://localhost:8090/api/v1/files/upload \
+     IMAGEKIT_API_URL=http://localhost:8090/v1 python src/main.py
+"""
+import argparse
+import base64
+import hashlib
+import hmac
+import io
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from email.parser import BytesParser
+from email.policy import default as default_policy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+class StubStorage:
+    """Arquivos enviados, em memória: fileId -> metadados + conteúdo"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.files = {}
+        self.used_tokens = set()
+        self.stats = {'connections': 0, 'uploads': 0, 'deletes': 0, 'failures': 0, 'bytes_received': 0}
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.stats[name] += amount
+
+def parse_upload_form(content_type, body):
+    """Campos do upload: multipart (arquivo binário) ou urlencoded (arquivo em base64)"""
+    if content_type.startswith('multipart/form-data'):
+        message = BytesParser(policy=default_policy).parsebytes(
+            f'Content-Type: {content_type}\r\n\r\n'.encode('latin-1') + body
+        )
+        fields = {}
+        for part in message.iter_parts():
+            name = part.get_param('name', header='content-disposition')
+            payload = part.get_payload(decode=True)
+            if part.get_filename() is not None or name == 'file':
+                fields[name] = payload
+            else:
+                fields[name] = payload.decode('utf-8')
+        return fields
+
+    fields = {name: values[-1] for name, values in parse_qs(body.decode('utf-8')).items()}
+    if 'file' in fields:
+        fields['file'] = base64.b64decode(fields['file'])
+    return fields
+
+def check_upload_auth(storage, options, headers, fields):
+    """Valida a autenticação do upload; retorna a mensagem de erro ou None"""
+    if not options.private_key:
+        return None
+    if check_basic_auth(options, headers):
+        return None
+
+    signature = fields.get('signature')
+    token = fields.get('token')
+    expire = fields.get('expire')
+    if not (fields.get('publicKey') and signature and token and expire):
+        return 'Autenticação ausente'
+
+    expected = hmac.new(options.private_key.encode(), f'{token}{expire}'.encode(), hashlib.sha1).hexdigest()
+    if not hmac.compare_digest(expected, signature):
+        return 'Assinatura inválida'
+    if not expire.isdigit() or int(expire) < time.time() or int(expire) > time.time() + 3600:
+        return 'expire inválido'
+
+    with storage.lock:
+        if token in storage.used_tokens:
+            return 'Token já utilizado'
+        storage.used_tokens.add(token)
+    return None
+
+def check_basic_auth(options, headers):
+    if not options.private_key:
+        return True
+    expected = 'Basic ' + base64.b64encode(f'{options.private_key}:'.encode()).decode()
+    return hmac.compare_digest(headers.get('Authorization', ''), expected)
+
+def image_dimensions(content):
+    try:
+        from PIL import Image
+        with Image.open(io.BytesIO(content)) as image:
+            return image.format, image.width, image.height
+    except Exception:
+        return None, None, None
+
+def make_handler(storage, options):
+    class ImageKitStubHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def setup(self):
+            super().setup()
+            # Custo de uma conexão nova (handshake TCP + TLS do CDN real)
+            storage.count('connections')
+            if options.connect_latency:
+                time.sleep(options.connect_latency)
+
+        def log_message(self, format, *args):
+            if options.verbose:
+                super().log_message(format, *args)
+
+        def send_json(self, status, payload=None):
+            body = json.dumps(payload).encode('utf-8') if payload is not None else b''
+            self.send_response(status)
+            if payload is not None:
+                self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def read_body(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            body = self.rfile.read(length) if length else b''
+            storage.count('bytes_received', len(body))
+            return body
+
+        def simulate(self):
+            """Aplica a latência e, conforme --fail-rate, responde 503; True se falhou"""
+            if options.latency:
+                time.sleep(options.latency)
+            if options.fail_rate and random.random() < options.fail_rate:
+                storage.count('failures')
+                self.send_json(503, {'message': 'Falha simulada'})
+                return True
+            return False
+
+        def do_POST(self):
+            path = urlsplit(self.path).path
+            body = self.read_body()
+
+            if path == '/__stats':
+                self.send_json(200, storage.stats)
+                return
+
+            if path != '/api/v1/files/upload':
+                self.send_json(404, {'message': 'Not found'})
+                return
+            if self.simulate():
+                return
+
+            fields = parse_upload_form(self.headers.get('Content-Type', ''), body)
+            auth_error = check_upload_auth(storage, options, self.headers, fields)
+            if auth_error:
+                self.send_json(403, {'message': auth_error})
+                return
+
+            content = fields.get('file')
+            if not content or not fields.get('fileName'):
+                self.send_json(400, {'message': 'file e fileName são obrigatórios'})
+                return
+
+            folder = '/' + (fields.get('folder') or '').strip('/')
+            name = fields['fileName'].replace('/', '_')
+            file_path = f"{folder.rstrip('/')}/{name}"
+            file_format, width, height = image_dimensions(content)
+            file_id = uuid.uuid4().hex[:24]
+
+            details = {
+                'fileId': file_id,
+                'name': name,
+                'size': len(content),
+                'filePath': file_path,
+                'url': f"{options.url_endpoint}{file_path}",
+                'thumbnailUrl': f"{options.url_endpoint}/tr:n-ik_ml_thumbnail{file_path}",
+                'fileType': 'image' if file_format else 'non-image',
+                'mime': f"image/{file_format.lower()}" if file_format else 'application/octet-stream',
+                'width': width,
+                'height': height
+            }
+            with storage.lock:
+                storage.files[file_id] = {'details': details, 'content': content}
+                storage.stats['uploads'] += 1
+
+            self.send_json(200, details)
+
+        def do_GET(self):
+            path = urlsplit(self.path).path
+
+            match = re.fullmatch(r'/v1/files/([^/]+)/details', path)
+            if match:
+                if not check_basic_auth(options, self.headers):
+                    self.send_json(401, {'message': 'Não autorizado'})
+                    return
+                if self.simulate():
+                    return
+                stored = storage.files.get(match.group(1))
+                if stored:
+                    self.send_json(200, stored['details'])
+                else:
+                    self.send_json(404, {'message': 'Arquivo não encontrado'})
+                return
+
+            if path.startswith('/media/'):
+                file_path = path[len('/media'):]
+                with storage.lock:
+                    stored = next((f for f in storage.files.values() if f['details']['filePath'] == file_path), None)
+                if not stored:
+                    self.send_json(404, {'message': 'Arquivo não encontrado'})
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/octet-stream')
+                self.send_header('Content-Length', str(len(stored['content'])))
+                self.end_headers()
+                self.wfile.write(stored['content'])
+                return
+
+            self.send_json(404, {'message': 'Not found'})
+
+        def do_DELETE(self):
+            self.read_body()
+            match = re.fullmatch(r'/v1/files/([^/]+)', urlsplit(self.path).path)
+            if not match:
+                self.send_json(404, {'message': 'Not found'})
+                return
+            if not check_basic_auth(options, self.headers):
+                self.send_json(401, {'message': 'Não autorizado'})
+                return
+            if self.simulate():
+                return
+
+            with storage.lock:
+                removed = storage.files.pop(match.group(1), None)
+                storage.stats['deletes'] += 1
+            if removed:
+                self.send_json(204)
+            else:
+                self.send_json(404, {'message': 'Arquivo não encontrado'})
+
+    return ImageKitStubHandler
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Servidor local que imita a API do ImageKit')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--latency', type=float, default=0.0, help='Atraso por requisição (s)')
+    parser.add_argument('--connect-latency', type=float, default=0.0, help='Atraso por conexão nova (s)')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='Fração de respostas 503 (0 a 1)')
+    parser.add_argument('--url-endpoint', help='Prefixo das URLs públicas (padrão: http://host:port/media)')
+    parser.add_argument('--private-key', help='Exige autenticação (Basic ou assinatura) com esta chave')
+    parser.add_argument('--verbose', action='store_true')
+    return parser
+
+def start_server(options):
+    """Inicia o servidor em uma thread; retorna (server, storage)"""
+    storage = StubStorage()
+    server = ThreadingHTTPServer((options.host, options.port), make_handler(storage, options))
+    server.daemon_threads = True
+    if not options.url_endpoint:
+        options.url_endpoint = f"http://{options.host}:{server.server_address[1]}/media"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, storage
+
+def main():
+    options = build_parser().parse_args()
+    server, storage = start_server(options)
+    base_url = f"http://{options.host}:{server.server_address[1]}"
+    print(f"🧪 ImageKit local em {base_url}")
+    print(f"   IMAGEKIT_UPLOAD_URL={base_url}/api/v1/files/upload")
+    print(f"   IMAGEKIT_API_URL={base_url}/v1")
+    print(f"   IMAGEKIT_URL_ENDPOINT={options.url_endpoint}")
+
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print(f"\n👋 Encerrado: {storage.stats}")
+        server.shutdown()
+
+if __name__ == '__main__':
+    main()
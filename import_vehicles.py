@@ -0,0 +1,43 @@
+"""
+Importação em massa de veículos pela linha de comando
+Uso: python import_vehicles.py arquivo.ndjson
+     python import_vehicles.py arquivo.csv --format csv
+"""
+import os
+import sys
+import json
+import argparse
+
+# Adicionar o diretório raiz ao path
+sys.path.insert(0, os.path.dirname(__file__))
+
+from src.main import create_app
+from src.vehicle_import import import_vehicles, IMPORT_CHUNK_SIZE
+
+def main():
+    parser = argparse.ArgumentParser(description='Importa veículos de um arquivo NDJSON ou CSV')
+    parser.add_argument('arquivo', help='Caminho do arquivo a importar')
+    parser.add_argument('--format', choices=['ndjson', 'csv'], help='Formato do arquivo (padrão: pela extensão)')
+    parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE, help='Registros por transação')
+    args = parser.parse_args()
+    
+    file_format = args.format or ('csv' if args.arquivo.lower().endswith('.csv') else 'ndjson')
+    
+    app = create_app()
+    
+    with app.app_context():
+        with open(args.arquivo, 'rb') as stream:
+            report = import_vehicles(stream, file_format, chunk_size=args.chunk_size)
+    
+    print(f"📦 Processados: {report['processed']}")
+    print(f"✅ Criados: {report['created']}")
+    print(f"🔄 Atualizados: {report['updated']}")
+    print(f"❌ Com erro: {report['failed']}")
+    
+    for error in report['errors']:
+        print(f"   Linha {error['line']} ({error['external_id']}): {json.dumps(error['errors'], ensure_ascii=False)}")
+    
+    return 0 if not report['failed'] else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,49 @@
+"""
+Script de migração para o feed incremental de alterações de veículos
+Cria o índice composto (updated_at, id) usado por /api/vehicles/changes
+"""
+import os
+import sys
+from sqlalchemy import text
+
+# Adicionar o diretório raiz ao path
+sys.path.insert(0, os.path.dirname(__file__))
+
+from src.models.user import db
+from src.main import create_app
+
+def migrate_database():
+    """Executa a migração do banco de dados"""
+    app = create_app()
+    
+    with app.app_context():
+        try:
+            print("Criando índice ix_vehicles_updated_at_id...")
+            db.session.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_vehicles_updated_at_id ON vehicles (updated_at, id)"
+            ))
+            
+            # Veículos antigos sem updated_at ficariam fora do feed
+            db.session.execute(text(
+                "UPDATE vehicles SET updated_at = created_at WHERE updated_at IS NULL"
+            ))
+            
+            db.session.commit()
+            print("✅ Migração concluída com sucesso!")
+            
+        except Exception as e:
+            print(f"❌ Erro na migração: {e}")
+            db.session.rollback()
+            return False
+    
+    return True
+
+if __name__ == '__main__':
+    print("🔄 Iniciando migração do banco de dados para o feed de alterações...")
+    success = migrate_database()
+    
+    if success:
+        print("🎉 Migração concluída! O feed /api/vehicles/changes está pronto.")
+    else:
+        print("💥 Falha na migração. Verifique os logs de erro.")
+        sys.exit(1)
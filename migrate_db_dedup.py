@@ -0,0 +1,55 @@
+"""
+Script de migração para a deduplicação de uploads
+Adiciona a coluna content_hash (SHA-256 do conteúdo enviado) com índice à tabela vehicle_images
+Imagens já existentes ficam sem hash: só uploads novos são deduplicados
+"""
+import os
+import sys
+from sqlalchemy import text, inspect
+
+# Adicionar o diretório raiz ao path
+sys.path.insert(0, os.path.dirname(__file__))
+
+from src.models.user import db
+from src.main import create_app
+
+def migrate_database():
+    """Executa a migração do banco de dados"""
+    app = create_app()
+    
+    with app.app_context():
+        try:
+            # Verificar se a coluna já existe
+            columns = [column['name'] for column in inspect(db.engine).get_columns('vehicle_images')]
+            
+            if 'content_hash' not in columns:
+                print("Adicionando coluna content_hash...")
+                db.session.execute(text("ALTER TABLE vehicle_images ADD COLUMN content_hash VARCHAR(64)"))
+                print("✅ Coluna content_hash adicionada com sucesso")
+            else:
+                print("ℹ️ Coluna content_hash já existe")
+            
+            # Índice usado na busca por uploads com o mesmo conteúdo
+            db.session.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_vehicle_images_content_hash ON vehicle_images (content_hash)"
+            ))
+            
+            db.session.commit()
+            print("✅ Migração concluída com sucesso!")
+            
+        except Exception as e:
+            print(f"❌ Erro na migração: {e}")
+            db.session.rollback()
+            return False
+    
+    return True
+
+if __name__ == '__main__':
+    print("🔄 Iniciando migração do banco de dados para deduplicação de uploads...")
+    success = migrate_database()
+    
+    if success:
+        print("🎉 Migração concluída! Uploads repetidos agora reaproveitam os arquivos existentes.")
+    else:
+        print("💥 Falha na migração. Verifique os logs de erro.")
+        sys.exit(1)
@@ -0,0 +1,54 @@
+"""
+Script de migração para a importação em massa de veículos
+Adiciona a coluna external_id (chave do DMS) com índice único à tabela vehicles
+"""
+import os
+import sys
+from sqlalchemy import text, inspect
+
+# Adicionar o diretório raiz ao path
+sys.path.insert(0, os.path.dirname(__file__))
+
+from src.models.user import db
+from src.main import create_app
+
+def migrate_database():
+    """Executa a migração do banco de dados"""
+    app = create_app()
+    
+    with app.app_context():
+        try:
+            # Verificar se a coluna já existe
+            columns = [column['name'] for column in inspect(db.engine).get_columns('vehicles')]
+            
+            if 'external_id' not in columns:
+                print("Adicionando coluna external_id...")
+                db.session.execute(text("ALTER TABLE vehicles ADD COLUMN external_id VARCHAR(100)"))
+                print("✅ Coluna external_id adicionada com sucesso")
+            else:
+                print("ℹ️ Coluna external_id já existe")
+            
+            # Índice único exigido pelo INSERT ... ON CONFLICT (external_id)
+            db.session.execute(text(
+                "CREATE UNIQUE INDEX IF NOT EXISTS ix_vehicles_external_id ON vehicles (external_id)"
+            ))
+            
+            db.session.commit()
+            print("✅ Migração concluída com sucesso!")
+            
+        except Exception as e:
+            print(f"❌ Erro na migração: {e}")
+            db.session.rollback()
+            return False
+    
+    return True
+
+if __name__ == '__main__':
+    print("🔄 Iniciando migração do banco de dados para importação em massa...")
+    success = migrate_database()
+    
+    if success:
+        print("🎉 Migração concluída! O banco agora suporta importação por external_id.")
+    else:
+        print("💥 Falha na migração. Verifique os logs de erro.")
+        sys.exit(1)
@@ -0,0 +1,61 @@
+"""
+Script de migração para a ordenação por popularidade
+Adiciona a coluna views (não nula) à tabela vehicles, preenchida com os
+contadores já gravados em vehicle_stats, e o índice (views, created_at)
+"""
+import os
+import sys
+from sqlalchemy import text, inspect
+
+# Adicionar o diretório raiz ao path
+sys.path.insert(0, os.path.dirname(__file__))
+
+from src.models.user import db
+from src.main import create_app
+
+def migrate_database():
+    """Executa a migração do banco de dados"""
+    app = create_app()
+    
+    with app.app_context():
+        try:
+            # Verificar se a coluna já existe
+            columns = [column['name'] for column in inspect(db.engine).get_columns('vehicles')]
+            
+            if 'views' not in columns:
+                print("Adicionando coluna views...")
+                db.session.execute(text("ALTER TABLE vehicles ADD COLUMN views INTEGER NOT NULL DEFAULT 0"))
+                print("✅ Coluna views adicionada com sucesso")
+            else:
+                print("ℹ️ Coluna views já existe")
+            
+            # Copiar as visualizações já contabilizadas
+            db.session.execute(text(
+                "UPDATE vehicles SET views = COALESCE("
+                "(SELECT vehicle_stats.views FROM vehicle_stats WHERE vehicle_stats.vehicle_id = vehicles.id), 0)"
+            ))
+            
+            # Índice usado por sort_by=popularity
+            db.session.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_vehicles_views_created_at ON vehicles (views, created_at)"
+            ))
+            
+            db.session.commit()
+            print("✅ Migração concluída com sucesso!")
+            
+        except Exception as e:
+            print(f"❌ Erro na migração: {e}")
+            db.session.rollback()
+            return False
+    
+    return True
+
+if __name__ == '__main__':
+    print("🔄 Iniciando migração do banco de dados para ordenação por popularidade...")
+    success = migrate_database()
+    
+    if success:
+        print("🎉 Migração concluída! A listagem por popularidade agora usa o índice de vehicles.")
+    else:
+        print("💥 Falha na migração. Verifique os logs de erro.")
+        sys.exit(1)
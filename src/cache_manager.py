@@ -4,14 +4,19 @@ Usa Flask-Caching com SimpleCache para evitar dependências externas
 """
 import os
 import time
+import uuid
 import hashlib
 from functools import wraps
-from flask import request, current_app
+from flask import request, current_app, jsonify
 from flask_caching import Cache
+from src.edge_cache import queue_purge_vehicles
 
 # Instância global do cache
 cache = Cache()
 
+# Funções chamadas após cada invalidação (ex.: regenerar documentos pré-calculados)
+invalidation_listeners = []
+
 def init_cache(app):
     """Inicializa o sistema de cache com a aplicação Flask"""
     # Configuração do cache
@@ -42,6 +47,58 @@ def generate_cache_key(*args, **kwargs):
     # Gerar hash MD5 para chave compacta
     return hashlib.md5(key_string.encode('utf-8')).hexdigest()
 
+def get_generation(name):
+    """
+    Retorna o token de geração de um grupo de chaves (listas ou um veículo)
+    Invalidar o grupo troca o token, tornando as entradas antigas inalcançáveis
+    Se o token for descartado pelo cache, um novo token aleatório é criado
+    (nunca reaproveita um token antigo, então entradas obsoletas não voltam)
+    """
+    token = cache.get(name)
+    if token is None:
+        token = uuid.uuid4().hex[:12]
+        cache.set(name, token, timeout=0)
+    return token
+
+def bump_generation(name):
+    """Troca o token de geração de um grupo de chaves"""
+    cache.set(name, uuid.uuid4().hex[:12], timeout=0)
+
+def list_generation_key():
+    """Chave do token de geração de todas as listagens (listas, buscas, categorias)"""
+    return "generation_vehicles_list"
+
+def vehicle_generation_key(vehicle_id):
+    """Chave do token de geração do detalhe de um veículo"""
+    return f"generation_vehicle_{int(vehicle_id)}"
+
+def cacheable_payload(result):
+    """
+    Extrai os dados JSON de uma resposta de view para armazenar no cache
+    Aceita (response, status), response ou list/dict
+    Retorna None se a resposta não deve ser cacheada (status diferente de 200)
+    """
+    status = 200
+    response = result
+    
+    if isinstance(result, tuple):
+        response = result[0]
+        if len(result) > 1:
+            status = result[1]
+    elif hasattr(result, 'status_code'):
+        status = result.status_code
+    
+    if status != 200:
+        return None
+    
+    if isinstance(response, (list, dict)):
+        return response
+    
+    if hasattr(response, 'get_json'):
+        return response.get_json(silent=True)
+    
+    return None
+
 def cache_vehicles_list(timeout=3600):
     """
     Decorator para cachear lista de veículos
@@ -51,21 +108,23 @@ def cache_vehicles_list(timeout=3600):
         @wraps(f)
         def decorated_function(*args, **kwargs):
             # Gerar chave do cache
-            cache_key = f"vehicles_list_{generate_cache_key(*args, **kwargs)}"
+            generation = get_generation(list_generation_key())
+            cache_key = f"vehicles_list_{generation}_{generate_cache_key(*args, **kwargs)}"
             
             # Tentar obter do cache
             cached_result = cache.get(cache_key)
             if cached_result is not None:
                 current_app.logger.info(f"Cache HIT: {cache_key}")
-                return cached_result
+                return jsonify(cached_result), 200
             
             # Executar função e cachear resultado
             current_app.logger.info(f"Cache MISS: {cache_key}")
             result = f(*args, **kwargs)
             
             # Cachear apenas se o resultado for válido
-            if result and (isinstance(result, (list, dict)) or hasattr(result, 'status_code')):
-                cache.set(cache_key, result, timeout=timeout)
+            payload = cacheable_payload(result)
+            if payload is not None:
+                cache.set(cache_key, payload, timeout=timeout)
                 current_app.logger.info(f"Cache SET: {cache_key} (timeout: {timeout}s)")
             
             return result
@@ -90,44 +149,100 @@ def cache_vehicle_detail(timeout=7200):
                 vehicle_id = kwargs['id']
             
             # Gerar chave do cache
-            cache_key = f"vehicle_detail_{vehicle_id}_{generate_cache_key(*args, **kwargs)}"
+            generation = get_generation(vehicle_generation_key(vehicle_id))
+            cache_key = f"vehicle_detail_{vehicle_id}_{generation}_{generate_cache_key(*args, **kwargs)}"
             
             # Tentar obter do cache
             cached_result = cache.get(cache_key)
             if cached_result is not None:
                 current_app.logger.info(f"Cache HIT: {cache_key}")
-                return cached_result
+                return jsonify(cached_result), 200
             
             # Executar função e cachear resultado
             current_app.logger.info(f"Cache MISS: {cache_key}")
             result = f(*args, **kwargs)
             
             # Cachear apenas se o resultado for válido
-            if result and (isinstance(result, (list, dict)) or hasattr(result, 'status_code')):
-                cache.set(cache_key, result, timeout=timeout)
+            payload = cacheable_payload(result)
+            if payload is not None:
+                cache.set(cache_key, payload, timeout=timeout)
                 current_app.logger.info(f"Cache SET: {cache_key} (timeout: {timeout}s)")
             
             return result
         return decorated_function
     return decorator
 
-def invalidate_vehicle_cache(vehicle_id=None):
+def vehicle_data_key(vehicle_id):
+    """Chave do cache para os dados serializados (to_dict) de um veículo"""
+    return f"vehicle_data_{vehicle_id}"
+
+def get_cached_vehicles(vehicle_ids):
+    """
+    Busca no cache os dados de vários veículos em uma única operação
+    Retorna dict {vehicle_id: dados} apenas com os encontrados
+    """
+    if not vehicle_ids:
+        return {}
+
+    try:
+        values = cache.get_many(*[vehicle_data_key(vid) for vid in vehicle_ids])
+        return {vid: value for vid, value in zip(vehicle_ids, values) if value is not None}
+    except Exception as e:
+        current_app.logger.error(f"Erro ao ler cache de veículos: {e}")
+        return {}
+
+def set_cached_vehicles(vehicles_data, timeout=7200):
+    """
+    Grava no cache os dados de vários veículos ({vehicle_id: dados})
+    Timeout padrão: 2 horas (mesmo do detalhe do veículo)
+    """
+    if not vehicles_data:
+        return
+
+    try:
+        cache.set_many(
+            {vehicle_data_key(vid): data for vid, data in vehicles_data.items()},
+            timeout=timeout
+        )
+    except Exception as e:
+        current_app.logger.error(f"Erro ao gravar cache de veículos: {e}")
+
+def register_invalidation_listener(callback):
+    """
+    Registra uma função chamada após cada invalidação do cache de veículos
+    A função recebe a lista de IDs invalidados (ou None para invalidação total)
+    """
+    if callback not in invalidation_listeners:
+        invalidation_listeners.append(callback)
+
+def notify_invalidation_listeners(vehicle_ids=None):
+    """Notifica os listeners registrados sem propagar erros para a rota"""
+    for callback in invalidation_listeners:
+        try:
+            callback(vehicle_ids)
+        except Exception as e:
+            current_app.logger.error(f"Erro no listener de invalidação {callback.__name__}: {e}")
+
+def invalidate_vehicle_cache(vehicle_id=None, vehicle_ids=None, previous_categories=None):
     """
     Invalida cache relacionado a veículos
-    Se vehicle_id for fornecido, invalida apenas esse veículo
+    Se vehicle_id (ou a lista vehicle_ids) for fornecido, invalida apenas esses
+    veículos e as listagens (que podem contê-los)
     Senão, invalida todo o cache de veículos
+    previous_categories: categorias anteriores à escrita (purga na borda)
     """
+    if vehicle_id is not None:
+        vehicle_ids = [vehicle_id]
+    
     try:
-        if vehicle_id:
-            # Invalidar cache específico do veículo
-            patterns = [
-                f"vehicle_detail_{vehicle_id}_*",
-                f"vehicles_list_*"  # Lista também precisa ser invalidada
-            ]
+        if vehicle_ids is not None:
+            # Invalidação direcionada: troca das gerações em vez de limpar o cache
+            bump_generation(list_generation_key())
+            for vid in vehicle_ids:
+                bump_generation(vehicle_generation_key(vid))
+            cache.delete_many(*[vehicle_data_key(int(vid)) for vid in vehicle_ids])
             
-            # Como SimpleCache não suporta wildcard, vamos limpar tudo
-            cache.clear()
-            current_app.logger.info(f"Cache invalidado para veículo {vehicle_id}")
+            current_app.logger.info(f"Cache invalidado para {len(vehicle_ids)} veículo(s): {list(vehicle_ids)[:20]}")
         else:
             # Invalidar todo o cache
             cache.clear()
@@ -135,6 +250,12 @@ def invalidate_vehicle_cache(vehicle_id=None):
             
     except Exception as e:
         current_app.logger.error(f"Erro ao invalidar cache: {e}")
+    
+    notify_invalidation_listeners(vehicle_ids)
+    
+    # Cache de borda (CDN/proxy): purga apenas as surrogate keys afetadas,
+    # na fila de tarefas (a escrita não espera o backend de purga)
+    queue_purge_vehicles(vehicle_ids, previous_categories)
 
 def cache_stats():
     """Retorna estatísticas do cache (limitado no SimpleCache)"""
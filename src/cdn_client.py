@@ -0,0 +1,417 @@
+"""
+Cliente HTTP do ImageKit
+Todas as chamadas usam uma única requests.Session por processo (conexões
+keep-alive reaproveitadas, sem um handshake TLS por arquivo), com novas
+tentativas e backoff exponencial para erros de rede, 429 e 5xx
+O upload envia o arquivo como parte binária de um multipart/form-data lido em
+blocos direto da origem (bytes, arquivo do spool ou stream do request), sem
+base64 e sem montar o corpo inteiro em memória
+Uploads em lote rodam em um pool de threads com concorrência limitada e os
+resultados voltam na ordem de entrada
+O cliente é montado a partir do app.config (get_cdn_client) e não depende de
+app context depois de criado, podendo ser usado nas threads do pool
+Resiliência: um circuit breaker por processo abre após falhas consecutivas ou
+chamadas lentas e, enquanto aberto, as chamadas falham na hora (sem segurar o
+worker); depois do intervalo de espera, uma chamada de teste decide se fecha
+Dentro de um request, todas as chamadas ao CDN dividem um orçamento de tempo
+(CDN_REQUEST_BUDGET): o timeout de cada tentativa é o que resta do orçamento
+"""
+import base64
+import hashlib
+import hmac
+import io
+import os
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from flask import current_app, g, has_request_context
+
+DEFAULT_UPLOAD_URL = 'https://upload.imagekit.io/api/v1/files/upload'
+DEFAULT_API_URL = 'https://api.imagekit.io/v1'
+
+# Respostas que valem nova tentativa (limite de taxa e falhas do servidor)
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+UPLOAD_RESPONSE_FIELDS = 'fileId,name,size,filePath,url,fileType,height,width,thumbnailUrl'
+
+class CDNError(Exception):
+    """Falha em uma chamada ao CDN (após esgotar as tentativas)"""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+class MultipartStream:
+    """
+    Corpo multipart/form-data gerado sob demanda (file-like com __len__)
+    Os campos e os delimitadores ficam em memória; o arquivo é lido da origem
+    em blocos durante o envio. __len__ permite ao requests enviar Content-Length
+    em vez de chunked encoding (por isso não há tell() nem __iter__, que o
+    requests usaria para tratar o corpo como stream de tamanho desconhecido)
+    source: bytes, caminho de arquivo ou arquivo binário aberto (lido desde o início)
+    """
+
+    def __init__(self, fields, file_field, filename, source, file_content_type='application/octet-stream'):
+        self.boundary = uuid.uuid4().hex
+        head = io.BytesIO()
+        for name, value in fields.items():
+            head.write(
+                f'--{self.boundary}\r\n'
+                f'Content-Disposition: form-data; name="{name}"\r\n\r\n'
+                f'{value}\r\n'.encode('utf-8')
+            )
+        safe_filename = filename.replace('"', '')
+        head.write(
+            f'--{self.boundary}\r\n'
+            f'Content-Disposition: form-data; name="{file_field}"; filename="{safe_filename}"\r\n'
+            f'Content-Type: {file_content_type}\r\n\r\n'.encode('utf-8')
+        )
+        tail = f'\r\n--{self.boundary}--\r\n'.encode('utf-8')
+
+        self.owns_file = False
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            file_obj = io.BytesIO(source)
+        elif isinstance(source, (str, os.PathLike)):
+            file_obj = open(source, 'rb')
+            self.owns_file = True
+        else:
+            file_obj = source
+            file_obj.seek(0)
+
+        file_obj.seek(0, os.SEEK_END)
+        file_size = file_obj.tell()
+        file_obj.seek(0)
+
+        self.file = file_obj
+        self.length = head.tell() + file_size + len(tail)
+        self.segments = [io.BytesIO(head.getvalue()), file_obj, io.BytesIO(tail)]
+
+    @property
+    def content_type(self):
+        return f'multipart/form-data; boundary={self.boundary}'
+
+    def __len__(self):
+        return self.length
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            return b''.join(segment.read() for segment in self.segments)
+
+        chunks = []
+        while size > 0 and self.segments:
+            chunk = self.segments[0].read(size)
+            if not chunk:
+                self.segments.pop(0)
+                continue
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b''.join(chunks)
+
+    def close(self):
+        if self.owns_file and not self.file.closed:
+            self.file.close()
+
+class CircuitOpenError(CDNError):
+    """CDN marcado como indisponível: a chamada nem é tentada"""
+
+class DeadlineExceeded(CDNError):
+    """Orçamento de tempo do request esgotado antes da chamada ao CDN"""
+
+# Tempo mínimo que vale a pena dar a uma tentativa
+MIN_ATTEMPT_TIMEOUT = 0.1
+
+class CircuitBreaker:
+    """
+    Circuit breaker (fechado -> aberto -> meio-aberto)
+    Abre após failure_threshold falhas consecutivas (chamadas mais lentas que
+    slow_call_threshold contam como falha); aberto, recusa chamadas por
+    reset_timeout segundos; meio-aberto, deixa passar uma chamada de teste
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, slow_call_threshold=10, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.slow_call_threshold = slow_call_threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0
+        self.probe_in_flight = False
+
+    def before_call(self):
+        """Libera a chamada ou levanta CircuitOpenError"""
+        with self.lock:
+            if self.state == self.CLOSED:
+                return
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    raise CircuitOpenError('CDN temporariamente indisponível (circuito aberto)')
+                self.state = self.HALF_OPEN
+                self.probe_in_flight = False
+            # Meio-aberto: apenas uma chamada de teste por vez
+            if self.probe_in_flight:
+                raise CircuitOpenError('CDN temporariamente indisponível (aguardando teste)')
+            self.probe_in_flight = True
+
+    def record_success(self, elapsed):
+        if elapsed > self.slow_call_threshold:
+            self.record_failure()
+            return
+        with self.lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.probe_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.probe_in_flight = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def release_probe(self):
+        """Libera a chamada de teste sem registrar sucesso nem falha"""
+        with self.lock:
+            self.probe_in_flight = False
+
+    def is_open(self):
+        """True enquanto as chamadas seriam recusadas (sem consumir a chamada de teste)"""
+        with self.lock:
+            return self.state == self.OPEN and time.monotonic() - self.opened_at < self.reset_timeout
+
+    def snapshot(self):
+        with self.lock:
+            return {'state': self.state, 'consecutive_failures': self.failures}
+
+# Breaker do ImageKit neste processo (criado na primeira chamada)
+breaker_state = {'breaker': None}
+breaker_lock = threading.Lock()
+
+def get_breaker(config):
+    with breaker_lock:
+        if breaker_state['breaker'] is None:
+            breaker_state['breaker'] = CircuitBreaker(
+                failure_threshold=config.get('CDN_BREAKER_FAILURES', 5),
+                slow_call_threshold=config.get('CDN_BREAKER_SLOW_CALL', 10),
+                reset_timeout=config.get('CDN_BREAKER_RESET', 30)
+            )
+        return breaker_state['breaker']
+
+# Sessão compartilhada do processo (criada sob demanda)
+session_state = {'session': None, 'pool_size': 0}
+session_lock = threading.Lock()
+
+def get_session(pool_size):
+    """Sessão HTTP compartilhada, com pool de conexões do tamanho da concorrência"""
+    with session_lock:
+        if session_state['session'] is None or session_state['pool_size'] < pool_size:
+            session = requests.Session()
+            # Novas tentativas ficam com o cliente (com backoff), não com o urllib3
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            previous = session_state['session']
+            session_state['session'] = session
+            session_state['pool_size'] = pool_size
+            if previous is not None:
+                previous.close()
+        return session_state['session']
+
+class ImageKitClient:
+    """Chamadas à API de upload e de arquivos do ImageKit"""
+
+    def __init__(self, private_key, session, upload_url=DEFAULT_UPLOAD_URL, api_url=DEFAULT_API_URL,
+                 timeout=30, max_retries=3, backoff=0.5, concurrency=4, breaker=None, deadline=None):
+        """deadline: instante limite (time.monotonic) de todas as chamadas deste cliente"""
+        self.private_key = private_key
+        self.session = session
+        self.upload_url = upload_url
+        self.api_url = api_url.rstrip('/')
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.concurrency = concurrency
+        self.breaker = breaker
+        self.deadline = deadline
+
+    def attempt_timeout(self):
+        """Timeout da próxima tentativa: o menor entre o timeout e o que resta do orçamento"""
+        if self.deadline is None:
+            return self.timeout
+        remaining = self.deadline - time.monotonic()
+        if remaining < MIN_ATTEMPT_TIMEOUT:
+            raise DeadlineExceeded('Tempo limite da requisição esgotado para o CDN')
+        return min(self.timeout, remaining)
+
+    def auth_headers(self):
+        token = base64.b64encode(f"{self.private_key}:".encode()).decode()
+        return {'Authorization': f'Basic {token}'}
+
+    def retry_delay(self, attempt):
+        """Backoff exponencial com jitter (evita tentativas sincronizadas entre threads)"""
+        return self.backoff * (2 ** attempt) * (0.5 + random.random() / 2)
+
+    def request(self, method, url, body_factory=None, **kwargs):
+        """
+        Executa a chamada com novas tentativas para erros de rede, 429 e 5xx
+        body_factory cria um corpo em streaming novo a cada tentativa
+        Retorna a resposta (qualquer status que não seja de nova tentativa)
+        """
+        headers = {**self.auth_headers(), **kwargs.pop('headers', {})}
+        last_error = None
+
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                delay = self.retry_delay(attempt - 1)
+                # Sem orçamento para esperar e tentar de novo: devolver o último erro já
+                if self.deadline is not None and time.monotonic() + delay + MIN_ATTEMPT_TIMEOUT > self.deadline:
+                    break
+                time.sleep(delay)
+
+            # Falha rápida sem orçamento ou com o circuito aberto (não contam como falha do CDN)
+            timeout = self.attempt_timeout()
+            body = body_factory() if body_factory else None
+            try:
+                if self.breaker:
+                    self.breaker.before_call()
+                if body is not None:
+                    headers['Content-Type'] = body.content_type
+                    kwargs['data'] = body
+
+                started = time.monotonic()
+                try:
+                    response = self.session.request(method, url, headers=headers, timeout=timeout, **kwargs)
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    if self.breaker:
+                        self.breaker.record_failure()
+                    last_error = CDNError(f'Erro de conexão com o CDN: {e}')
+                    continue
+                except Exception:
+                    # Erro local (ex.: leitura do arquivo) não diz nada sobre o CDN
+                    if self.breaker:
+                        self.breaker.release_probe()
+                    raise
+            finally:
+                if body is not None:
+                    body.close()
+
+            if response.status_code in RETRY_STATUS:
+                if self.breaker:
+                    self.breaker.record_failure()
+                last_error = CDNError(
+                    f'CDN respondeu {response.status_code}: {response.text[:200]}',
+                    response.status_code
+                )
+                continue
+
+            if self.breaker:
+                self.breaker.record_success(time.monotonic() - started)
+            return response
+
+        raise last_error
+
+    def upload(self, source, filename, folder_path):
+        """
+        Envia uma imagem; retorna o JSON do ImageKit ou levanta CDNError
+        source: bytes, caminho de arquivo ou arquivo binário aberto
+        """
+        fields = {
+            'fileName': filename,
+            'folder': folder_path,
+            'useUniqueFileName': 'false',  # Já geramos nome único
+            'tags': 'vehicle,concessionaria',
+            'isPrivateFile': 'false',
+            'responseFields': UPLOAD_RESPONSE_FIELDS
+        }
+
+        def body_factory():
+            return MultipartStream(fields, 'file', os.path.basename(filename), source)
+
+        response = self.request('POST', self.upload_url, body_factory=body_factory)
+        if response.status_code != 200:
+            raise CDNError(f'Erro no upload ImageKit: {response.status_code} - {response.text[:200]}', response.status_code)
+        return response.json()
+
+    def upload_many(self, items):
+        """
+        Envia vários arquivos (lista de (source, filename, folder_path)) com
+        concorrência limitada; retorna, na mesma ordem, o JSON ou a exceção de cada um
+        """
+        def upload_item(item):
+            try:
+                return self.upload(*item)
+            except Exception as e:
+                return e
+
+        if len(items) <= 1 or self.concurrency <= 1:
+            return [upload_item(item) for item in items]
+
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(items)), thread_name_prefix='cdn-upload') as executor:
+            # map preserva a ordem de entrada, independente da ordem de conclusão
+            return list(executor.map(upload_item, items))
+
+    def client_upload_signature(self, token, expire):
+        """Assinatura do upload direto pelo navegador: HMAC-SHA1(chave privada, token + expire)"""
+        return hmac.new(self.private_key.encode(), f'{token}{expire}'.encode(), hashlib.sha1).hexdigest()
+
+    def get_file_details(self, file_id):
+        """Detalhes de um arquivo (nome, caminho, tamanho, URL...); None se não existir"""
+        response = self.request('GET', f'{self.api_url}/files/{file_id}/details')
+        if response.status_code == 404:
+            return None
+        if response.status_code != 200:
+            raise CDNError(f'Erro ao consultar arquivo: {response.status_code} - {response.text[:200]}', response.status_code)
+        return response.json()
+
+    def delete(self, file_id):
+        """Remove um arquivo; True se removido (ou já inexistente)"""
+        response = self.request('DELETE', f'{self.api_url}/files/{file_id}')
+        return response.status_code in (204, 404)
+
+def start_request_budget():
+    """before_request: marca o início do request para o orçamento das chamadas ao CDN"""
+    g.cdn_request_started = time.monotonic()
+
+def init_cdn_client(app):
+    app.before_request(start_request_budget)
+
+def request_deadline(config):
+    """Limite das chamadas ao CDN no request atual (None fora de requests, ex.: tarefas)"""
+    if not has_request_context():
+        return None
+    started = g.get('cdn_request_started') or time.monotonic()
+    return started + config.get('CDN_REQUEST_BUDGET', 20)
+
+def get_cdn_client(timeout=None, max_retries=None):
+    """
+    Cliente configurado a partir do app.config (chamar dentro de um app context)
+    Dentro de um request, herda o orçamento de tempo restante do request
+    timeout/max_retries substituem CDN_TIMEOUT/CDN_MAX_RETRIES (ex.: tentativa
+    única e curta dentro do request, antes de delegar à fila)
+    """
+    config = current_app.config
+    concurrency = config.get('CDN_UPLOAD_CONCURRENCY', 4)
+    return ImageKitClient(
+        private_key=config.get('IMAGEKIT_PRIVATE_KEY', ''),
+        session=get_session(max(concurrency, 1)),
+        upload_url=config.get('IMAGEKIT_UPLOAD_URL') or DEFAULT_UPLOAD_URL,
+        api_url=config.get('IMAGEKIT_API_URL') or DEFAULT_API_URL,
+        timeout=config.get('CDN_TIMEOUT', 30) if timeout is None else timeout,
+        max_retries=config.get('CDN_MAX_RETRIES', 3) if max_retries is None else max_retries,
+        backoff=config.get('CDN_RETRY_BACKOFF', 0.5),
+        concurrency=concurrency,
+        breaker=get_breaker(config),
+        deadline=request_deadline(config)
+    )
+
+def cdn_circuit_open():
+    """True se o CDN está marcado como indisponível neste processo"""
+    return get_breaker(current_app.config).is_open()
@@ -0,0 +1,201 @@
+"""
+Integração com caches de borda (CDN / proxy reverso) via surrogate keys
+As respostas públicas do catálogo recebem o header Surrogate-Key com as tags
+dos dados que contêm (vehicle-<id>, vehicles-list, category-<nome>) e um
+Surrogate-Control com TTL longo para a borda
+Após escritas, apenas as tags afetadas são purgadas pelo backend configurado
+(EDGE_PURGE_BACKEND): 'http' (POST JSON em EDGE_PURGE_URL), 'log' ou vazio
+A purga roda na fila de tarefas (fora da requisição, repetida com backoff)
+Outros provedores podem ser registrados com register_purge_backend
+"""
+import unicodedata
+import requests
+from flask import current_app
+from src.models.user import db
+from src.models.vehicle import Vehicle
+from src.job_queue import enqueue_job, register_job_handler, get_job_queue
+
+LIST_KEY = 'vehicles-list'
+
+# Limite prático do header Surrogate-Key (Fastly: 16KB)
+MAX_SURROGATE_HEADER = 16 * 1024
+
+def vehicle_key(vehicle_id):
+    return f"vehicle-{vehicle_id}"
+
+def category_key(categoria):
+    """Tag da categoria em ASCII (headers não aceitam acentos com segurança)"""
+    normalized = unicodedata.normalize('NFKD', categoria).encode('ascii', 'ignore').decode('ascii')
+    slug = ''.join(char if char.isalnum() else '-' for char in normalized.lower()).strip('-')
+    return f"category-{slug}"
+
+def surrogate_keys_for_payload(endpoint, payload, args):
+    """
+    Tags de uma resposta pública a partir do endpoint e do corpo JSON
+    Listagens filtradas por categoria levam apenas a tag da categoria, para que
+    escritas em outras categorias não as purguem
+    """
+    keys = []
+
+    if endpoint == 'vehicles.get_vehicle':
+        vehicle = payload.get('vehicle') or {}
+        if vehicle.get('id'):
+            keys.append(vehicle_key(vehicle['id']))
+
+    elif endpoint == 'vehicles.get_vehicles':
+        categoria = args.get('categoria')
+        keys.append(category_key(categoria) if categoria else LIST_KEY)
+        keys.extend(vehicle_key(vehicle['id']) for vehicle in payload.get('vehicles') or [] if vehicle)
+
+    elif endpoint == 'vehicles.get_vehicles_batch':
+        # Todos os IDs pedidos, inclusive os não encontrados: a resposta muda
+        # quando um deles é criado ou reativado
+        keys.extend(vehicle_key(vehicle['id']) for vehicle in payload.get('vehicles') or [] if vehicle)
+        not_found = payload.get('not_found') or []
+        if not_found:
+            keys.append(LIST_KEY)
+            keys.extend(vehicle_key(vid) for vid in not_found)
+
+    elif endpoint in ('vehicles.search_vehicles', 'vehicles.get_vehicles_by_category', 'vehicles.get_similar_vehicles'):
+        # Dependem do catálogo inteiro (contagens, resultados e vizinhos mudam com qualquer escrita)
+        keys.append(LIST_KEY)
+        for name in ('vehicles', 'similar'):
+            keys.extend(vehicle_key(vehicle['id']) for vehicle in payload.get(name) or [] if vehicle)
+
+    return keys
+
+def add_surrogate_headers(response, keys):
+    """Adiciona Surrogate-Key e Surrogate-Control (TTL da borda) à resposta"""
+    if not keys:
+        return response
+
+    header = ' '.join(dict.fromkeys(keys))
+    if len(header) > MAX_SURROGATE_HEADER:
+        # Header grande demais: a tag mais ampla cobre a resposta
+        header = LIST_KEY
+
+    response.headers['Surrogate-Key'] = header
+    response.headers['Surrogate-Control'] = f"max-age={current_app.config.get('EDGE_CACHE_TTL', 86400)}"
+    return response
+
+# ==================== PURGA ====================
+
+def log_purge(keys):
+    """Backend de diagnóstico: apenas registra as tags no log"""
+    current_app.logger.info(f"Purga da borda: {'tudo' if keys is None else ' '.join(keys)}")
+
+def http_purge(keys):
+    """
+    Backend genérico: POST JSON {"keys": [...]} ou {"all": true} em EDGE_PURGE_URL
+    Compatível com edge_proxy.py (proxy local de testes) e com adaptadores próprios
+    """
+    url = current_app.config.get('EDGE_PURGE_URL')
+    if not url:
+        current_app.logger.error("EDGE_PURGE_URL não configurada para o backend http")
+        return
+
+    headers = {}
+    token = current_app.config.get('EDGE_PURGE_TOKEN')
+    if token:
+        headers['Authorization'] = f'Bearer {token}'
+
+    response = requests.post(
+        url,
+        json={'all': True} if keys is None else {'keys': keys},
+        headers=headers,
+        timeout=current_app.config.get('EDGE_PURGE_TIMEOUT', 2)
+    )
+    response.raise_for_status()
+
+purge_backends = {
+    'log': log_purge,
+    'http': http_purge
+}
+
+def register_purge_backend(name, callback):
+    """
+    Registra um backend de purga (ex.: API do Fastly ou Cloudflare)
+    callback(keys) recebe a lista de tags, ou None para purgar tudo
+    """
+    purge_backends[name] = callback
+
+def purge_surrogate_keys(keys):
+    """Purga as tags na borda sem propagar erros para a rota"""
+    backend_name = current_app.config.get('EDGE_PURGE_BACKEND')
+    if not backend_name:
+        return False
+
+    backend = purge_backends.get(backend_name)
+    if backend is None:
+        current_app.logger.error(f"Backend de purga desconhecido: {backend_name}")
+        return False
+
+    try:
+        backend(keys)
+        return True
+    except Exception as e:
+        current_app.logger.error(f"Erro ao purgar cache da borda ({backend_name}): {e}")
+        return False
+
+def purge_vehicles(vehicle_ids=None, previous_categories=None):
+    """
+    Purga as tags afetadas por escritas nos veículos informados:
+    vehicle-<id>, vehicles-list e as categorias atual e anterior
+    Sem IDs, purga tudo (ex.: importação ou limpeza total do cache)
+    """
+    if not current_app.config.get('EDGE_PURGE_BACKEND'):
+        return False
+
+    if vehicle_ids is None:
+        return purge_surrogate_keys(None)
+
+    vehicle_ids = [int(vid) for vid in vehicle_ids]
+    categories = set(previous_categories or [])
+    try:
+        categories.update(
+            categoria for (categoria,) in db.session.query(Vehicle.categoria).filter(
+                Vehicle.id.in_(vehicle_ids),
+                Vehicle.categoria.isnot(None)
+            ).distinct()
+        )
+    except Exception as e:
+        # Sem as categorias atuais, a purga total é a opção segura
+        current_app.logger.error(f"Erro ao ler categorias para purga da borda: {e}")
+        return purge_surrogate_keys(None)
+
+    keys = [LIST_KEY]
+    keys.extend(category_key(categoria) for categoria in sorted(c for c in categories if c))
+    keys.extend(vehicle_key(vid) for vid in vehicle_ids)
+    return purge_surrogate_keys(keys)
+
+def process_edge_purge_job(payload, progress):
+    """Tarefa de purga na borda (falhas voltam para a fila com backoff)"""
+    if not current_app.config.get('EDGE_PURGE_BACKEND'):
+        return None
+    if not purge_vehicles(payload['vehicle_ids'], payload['previous_categories']):
+        raise RuntimeError('Falha ao purgar cache da borda')
+    return {'vehicle_ids': payload['vehicle_ids']}
+
+register_job_handler('edge_purge', process_edge_purge_job)
+
+def queue_purge_vehicles(vehicle_ids=None, previous_categories=None):
+    """
+    Enfileira a purga de purge_vehicles sem bloquear a escrita
+    Sem fila de tarefas (scripts que não a inicializam), purga na hora
+    """
+    if not current_app.config.get('EDGE_PURGE_BACKEND'):
+        return False
+
+    payload = {
+        'vehicle_ids': None if vehicle_ids is None else [int(vid) for vid in vehicle_ids],
+        'previous_categories': sorted(c for c in previous_categories or [] if c)
+    }
+
+    if get_job_queue() is not None:
+        try:
+            enqueue_job('edge_purge', payload, current_app.config.get('EDGE_PURGE_MAX_ATTEMPTS'))
+            return True
+        except Exception as e:
+            current_app.logger.error(f"Erro ao enfileirar purga da borda: {e}")
+
+    return purge_vehicles(payload['vehicle_ids'], payload['previous_categories'])
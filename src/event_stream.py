@@ -0,0 +1,193 @@
+"""
+Publicador de eventos do catálogo para Server-Sent Events (SSE)
+Um único broker por processo recebe os eventos das rotas de escrita de veículos
+e os distribui para todos os clientes conectados em /api/vehicles/stream
+Clientes ociosos ficam bloqueados em uma Condition (sem polling e sem consultas)
+"""
+import json
+import threading
+import time
+import uuid
+from collections import deque
+
+# Quantidade de eventos mantidos para retomada via Last-Event-ID
+EVENT_HISTORY_SIZE = 1000
+
+# Intervalo do comentário de keep-alive enviado a clientes ociosos (segundos)
+KEEPALIVE_INTERVAL = 15
+
+# Tempo sugerido ao navegador para reconectar (milissegundos)
+RECONNECT_DELAY_MS = 3000
+
+class CatalogEventBroker:
+    """Fan-out de eventos do catálogo com histórico limitado para retomada"""
+
+    def __init__(self, history_size=EVENT_HISTORY_SIZE):
+        # Época do processo: IDs de outro processo (ou de antes de um restart) não são retomáveis
+        self.epoch = uuid.uuid4().hex[:8]
+        self._condition = threading.Condition()
+        self._events = deque(maxlen=history_size)
+        self._last_seq = 0
+
+    def format_id(self, seq):
+        """Gera o ID público do evento (época-sequência)"""
+        return f"{self.epoch}-{seq}"
+
+    def parse_id(self, event_id):
+        """
+        Converte um Last-Event-ID na sequência local
+        Retorna None se o ID não pertence a este processo
+        """
+        try:
+            epoch, seq = event_id.rsplit('-', 1)
+            if epoch != self.epoch:
+                return None
+            return int(seq)
+        except (ValueError, AttributeError):
+            return None
+
+    @property
+    def last_seq(self):
+        return self._last_seq
+
+    def publish(self, event_type, data):
+        """Publica um evento e acorda todos os clientes em espera"""
+        with self._condition:
+            self._last_seq += 1
+            self._events.append((self._last_seq, event_type, data))
+            self._condition.notify_all()
+        return self.format_id(self._last_seq)
+
+    def can_resume(self, seq):
+        """Verifica se todos os eventos após seq ainda estão no histórico"""
+        with self._condition:
+            if seq >= self._last_seq:
+                return True
+            return bool(self._events) and self._events[0][0] <= seq + 1
+
+    def wait_for_events(self, seq, timeout):
+        """
+        Bloqueia até existir evento com sequência maior que seq (ou timeout)
+        Retorna a lista de eventos (seq, tipo, dados) posteriores a seq
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._last_seq > seq, timeout=timeout)
+            return [event for event in self._events if event[0] > seq]
+
+# Instância única por processo
+broker = CatalogEventBroker()
+
+def format_sse(event_id, event_type, data):
+    """Formata um evento no protocolo text/event-stream"""
+    payload = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event_type}")
+    lines.append(f"data: {payload}")
+    return "\n".join(lines) + "\n\n"
+
+def stream_events(last_event_id=None):
+    """
+    Gerador de eventos SSE para um cliente
+    Retoma a partir do Last-Event-ID quando possível; senão envia 'reset'
+    para o cliente recarregar o estado (ex.: via /api/vehicles/changes)
+    """
+    yield f"retry: {RECONNECT_DELAY_MS}\n\n"
+
+    seq = broker.last_seq
+    if last_event_id:
+        resumed_seq = broker.parse_id(last_event_id)
+        if resumed_seq is not None and broker.can_resume(resumed_seq):
+            seq = resumed_seq
+        else:
+            yield format_sse(broker.format_id(seq), 'reset', {'reason': 'history_unavailable'})
+
+    while True:
+        events = broker.wait_for_events(seq, timeout=KEEPALIVE_INTERVAL)
+
+        if not events:
+            # Comentário SSE mantém a conexão aberta em proxies
+            yield f": keep-alive {int(time.time())}\n\n"
+            continue
+
+        for event_seq, event_type, data in events:
+            seq = event_seq
+            yield format_sse(broker.format_id(event_seq), event_type, data)
+
+def vehicle_counter_snapshot(vehicle):
+    """Captura os campos que alimentam os contadores do dashboard"""
+    if vehicle is None:
+        return None
+    return {
+        'is_active': vehicle.is_active,
+        'categoria': vehicle.categoria,
+        'marca': vehicle.marca,
+        'combustivel': vehicle.combustivel
+    }
+
+def dashboard_delta(before, after):
+    """
+    Calcula a variação dos contadores de /api/admin/dashboard/stats
+    entre dois snapshots (None = veículo inexistente)
+    """
+    delta = {
+        'total_vehicles': 0,
+        'total_inactive': 0,
+        'categories': {},
+        'brands': {},
+        'fuels': {}
+    }
+
+    groups = (('categories', 'categoria'), ('brands', 'marca'), ('fuels', 'combustivel'))
+
+    for snapshot, sign in ((before, -1), (after, 1)):
+        if snapshot is None:
+            continue
+
+        if snapshot['is_active']:
+            delta['total_vehicles'] += sign
+            # Os agrupamentos do dashboard consideram apenas veículos ativos
+            for group, field in groups:
+                name = snapshot[field] or 'Não informado'
+                delta[group][name] = delta[group].get(name, 0) + sign
+        else:
+            delta['total_inactive'] += sign
+
+    for group, _ in groups:
+        delta[group] = {name: value for name, value in delta[group].items() if value}
+
+    return delta
+
+def combine_dashboard_deltas(deltas):
+    """Soma várias variações de contadores (ex.: operações em massa)"""
+    combined = dashboard_delta(None, None)
+
+    for delta in deltas:
+        combined['total_vehicles'] += delta['total_vehicles']
+        combined['total_inactive'] += delta['total_inactive']
+        for group in ('categories', 'brands', 'fuels'):
+            for name, value in delta[group].items():
+                combined[group][name] = combined[group].get(name, 0) + value
+
+    for group in ('categories', 'brands', 'fuels'):
+        combined[group] = {name: value for name, value in combined[group].items() if value}
+
+    return combined
+
+def publish_vehicle_event(event_type, vehicle, before=None):
+    """
+    Publica um evento de veículo com a variação dos contadores do dashboard
+    event_type: created, updated, deleted ou restored
+    before: snapshot (vehicle_counter_snapshot) anterior à escrita
+    """
+    data = {
+        'id': str(vehicle.id),
+        'dashboard_delta': dashboard_delta(before, vehicle_counter_snapshot(vehicle))
+    }
+
+    # Dados completos apenas de veículos públicos (ativos)
+    if vehicle.is_active:
+        data['vehicle'] = vehicle.to_dict()
+
+    return broker.publish(f"vehicle.{event_type}", data)
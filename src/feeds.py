@@ -0,0 +1,316 @@
+"""
+Feeds de anúncios para marketplaces (XML e CSV)
+Cada veículo ativo vira um fragmento (elemento <veiculo> ou linha CSV) com as
+imagens do CDN já transformadas. Os fragmentos ficam em um arquivo de estado
+ordenado por ID; a reconstrução incremental relê apenas os veículos alterados
+desde a última execução (updated_at) e intercala os fragmentos novos com os
+antigos em streaming, sem carregar o feed inteiro em memória
+O feed anterior continua disponível até o novo estar completo (os.replace)
+"""
+import csv
+import io
+import json
+import os
+import tempfile
+from datetime import datetime, timedelta
+from xml.etree import ElementTree
+from flask import current_app
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+from src.models.user import db
+from src.models.vehicle import Vehicle
+
+FEED_FORMATS = ('xml', 'csv')
+FEED_BASENAME = 'veiculos'
+
+# Veículos lidos do banco por lote
+FEED_CHUNK_SIZE = 500
+
+# Sobreposição relida a cada execução incremental, cobrindo transações
+# confirmadas com updated_at anterior à última marca d'água
+FEED_SETTLE_SECONDS = 60
+
+# Transformação do ImageKit aplicada às imagens do feed
+FEED_IMAGE_TRANSFORMATION = 'w-1200,h-800,c-maintain_ratio'
+
+# Limite de imagens por anúncio (a maioria dos marketplaces aceita até 20)
+FEED_MAX_IMAGES = 20
+
+CSV_FIELDS = [
+    'id', 'titulo', 'marca', 'modelo', 'ano', 'preco', 'sob_consulta',
+    'quilometragem', 'combustivel', 'cambio', 'cor', 'categoria', 'descricao',
+    'link', 'whatsapp_link', 'imagem_principal', 'imagens', 'updated_at'
+]
+
+def feed_paths(root, file_format):
+    """Caminhos do feed, do arquivo de fragmentos e dos metadados"""
+    base = os.path.join(root, FEED_BASENAME)
+    return {
+        'feed': f"{base}.{file_format}",
+        'fragments': f"{base}.{file_format}.fragments.ndjson",
+        'state': f"{base}.{file_format}.state.json"
+    }
+
+def image_urls(vehicle):
+    """URLs absolutas das imagens do veículo, na ordem de exibição"""
+    base_url = current_app.config.get('FEED_BASE_URL', '').rstrip('/')
+    urls = []
+
+    for image in vehicle.vehicle_images:
+        if image.cdn_url:
+            urls.append(f"{image.cdn_url}?tr={FEED_IMAGE_TRANSFORMATION}")
+        elif base_url:
+            # O upload local grava só as variantes; original_ é a maior delas
+            urls.append(f"{base_url}/api/uploads/original_{image.filename}")
+
+    if not urls:
+        # Veículos antigos: apenas a lista de URLs no próprio veículo
+        for url in vehicle.get_imagens():
+            if url.startswith(('http://', 'https://')):
+                urls.append(url)
+            elif base_url:
+                urls.append(f"{base_url}/api/uploads/original_{url}")
+
+    return urls[:FEED_MAX_IMAGES]
+
+def listing_fields(vehicle):
+    """Campos do anúncio compartilhados entre os formatos"""
+    link_template = current_app.config.get('FEED_VEHICLE_URL', '')
+    images = image_urls(vehicle)
+
+    return {
+        'id': str(vehicle.id),
+        'titulo': f"{vehicle.marca} {vehicle.modelo} {vehicle.ano}",
+        'marca': vehicle.marca,
+        'modelo': vehicle.modelo,
+        'ano': vehicle.ano,
+        # Preço omitido quando o anúncio é "sob consulta"
+        'preco': None if vehicle.sob_consulta else vehicle.preco,
+        'sob_consulta': bool(vehicle.sob_consulta),
+        'quilometragem': vehicle.quilometragem,
+        'combustivel': vehicle.combustivel,
+        'cambio': vehicle.cambio,
+        'cor': vehicle.cor,
+        'categoria': vehicle.categoria,
+        'descricao': vehicle.descricao,
+        'link': link_template.format(id=vehicle.id) if link_template else None,
+        'whatsapp_link': vehicle.whatsapp_link,
+        'imagens': images,
+        'updated_at': vehicle.updated_at.isoformat() if vehicle.updated_at else None
+    }
+
+def render_xml_fragment(vehicle):
+    """Elemento <veiculo> do feed XML"""
+    fields = listing_fields(vehicle)
+    element = ElementTree.Element('veiculo')
+
+    for name, value in fields.items():
+        if name == 'imagens' or value is None:
+            continue
+        child = ElementTree.SubElement(element, name)
+        if name == 'preco':
+            child.set('moeda', 'BRL')
+            child.text = f"{value:.2f}"
+        elif isinstance(value, bool):
+            child.text = 'true' if value else 'false'
+        else:
+            child.text = str(value)
+
+    images = ElementTree.SubElement(element, 'imagens')
+    for url in fields['imagens']:
+        ElementTree.SubElement(images, 'imagem').text = url
+
+    return '  ' + ElementTree.tostring(element, encoding='unicode') + '\n'
+
+def render_csv_fragment(vehicle):
+    """Linha do feed CSV"""
+    fields = listing_fields(vehicle)
+    fields['imagem_principal'] = fields['imagens'][0] if fields['imagens'] else None
+    fields['imagens'] = '|'.join(fields['imagens'])
+
+    buffer = io.StringIO()
+    csv.DictWriter(buffer, fieldnames=CSV_FIELDS, extrasaction='ignore').writerow(fields)
+    return buffer.getvalue()
+
+def csv_header():
+    buffer = io.StringIO()
+    csv.DictWriter(buffer, fieldnames=CSV_FIELDS).writeheader()
+    return buffer.getvalue()
+
+FEED_RENDERERS = {
+    'xml': render_xml_fragment,
+    'csv': render_csv_fragment
+}
+
+def feed_header(file_format, generated_at):
+    if file_format == 'csv':
+        return csv_header()
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        f'<veiculos gerado_em="{generated_at.isoformat()}">\n'
+    )
+
+def feed_footer(file_format):
+    return '' if file_format == 'csv' else '</veiculos>\n'
+
+def iter_vehicle_partitions(statement):
+    """Percorre veículos (com imagens) em lotes de FEED_CHUNK_SIZE"""
+    statement = statement.options(selectinload(Vehicle.vehicle_images)).order_by(Vehicle.id)
+    result = db.session.execute(
+        statement.execution_options(yield_per=FEED_CHUNK_SIZE, stream_results=True)
+    ).scalars()
+
+    for partition in result.partitions():
+        yield partition
+        for vehicle in partition:
+            db.session.expunge(vehicle)
+
+def iter_fragment_file(path):
+    """Lê o arquivo de fragmentos (id, fragmento) em ordem de ID"""
+    if not os.path.exists(path):
+        return
+    with open(path, 'r', encoding='utf-8') as fragments_file:
+        for line in fragments_file:
+            if line.strip():
+                record = json.loads(line)
+                yield record['id'], record['fragment']
+
+def iter_full_fragments(file_format):
+    """Fragmentos de todo o catálogo ativo, em ordem de ID"""
+    render = FEED_RENDERERS[file_format]
+    statement = select(Vehicle).where(Vehicle.is_active == True)
+    for partition in iter_vehicle_partitions(statement):
+        for vehicle in partition:
+            yield vehicle.id, render(vehicle)
+
+def iter_merged_fragments(fragments_path, changes):
+    """
+    Intercala os fragmentos anteriores com as alterações (merge por ID)
+    changes: {id: fragmento novo ou None para remover}
+    """
+    pending = sorted(changes.items())
+    position = 0
+
+    for vehicle_id, fragment in iter_fragment_file(fragments_path):
+        while position < len(pending) and pending[position][0] < vehicle_id:
+            changed_id, changed_fragment = pending[position]
+            if changed_fragment is not None:
+                yield changed_id, changed_fragment
+            position += 1
+
+        if position < len(pending) and pending[position][0] == vehicle_id:
+            if pending[position][1] is not None:
+                yield vehicle_id, pending[position][1]
+            position += 1
+        else:
+            yield vehicle_id, fragment
+
+    for changed_id, changed_fragment in pending[position:]:
+        if changed_fragment is not None:
+            yield changed_id, changed_fragment
+
+def collect_changes(file_format, since):
+    """
+    Renderiza os veículos alterados desde a marca d'água
+    Retorna ({id: fragmento ou None}, maior updated_at visto)
+    """
+    render = FEED_RENDERERS[file_format]
+    statement = select(Vehicle).where(
+        Vehicle.updated_at >= since - timedelta(seconds=FEED_SETTLE_SECONDS)
+    )
+
+    changes = {}
+    watermark = since
+    for partition in iter_vehicle_partitions(statement):
+        for vehicle in partition:
+            changes[vehicle.id] = render(vehicle) if vehicle.is_active else None
+            if vehicle.updated_at and vehicle.updated_at > watermark:
+                watermark = vehicle.updated_at
+
+    return changes, watermark
+
+def temp_path_for(path):
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    os.close(fd)
+    return temp_path
+
+def load_state(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as state_file:
+            return json.load(state_file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def build_feed(root, file_format='xml', full=False):
+    """
+    Gera (ou atualiza incrementalmente) o feed no diretório informado
+    Retorna o relatório da execução
+    """
+    if file_format not in FEED_FORMATS:
+        raise ValueError('Formato inválido (use xml ou csv)')
+
+    os.makedirs(root, exist_ok=True)
+    paths = feed_paths(root, file_format)
+    state = None if full else load_state(paths['state'])
+    incremental = bool(state) and os.path.exists(paths['fragments'])
+
+    generated_at = datetime.utcnow()
+
+    if incremental:
+        since = datetime.fromisoformat(state['watermark'])
+        changes, watermark = collect_changes(file_format, since)
+        fragments = iter_merged_fragments(paths['fragments'], changes)
+    else:
+        changes = None
+        # Marca d'água antes da leitura: escritas concorrentes entram na próxima execução
+        watermark = generated_at
+        fragments = iter_full_fragments(file_format)
+
+    feed_temp = temp_path_for(paths['feed'])
+    fragments_temp = temp_path_for(paths['fragments'])
+    items = 0
+
+    try:
+        # newline='': o módulo csv já grava \r\n; o XML usa \n
+        with open(feed_temp, 'w', encoding='utf-8', newline='') as feed_file, \
+                open(fragments_temp, 'w', encoding='utf-8') as fragments_file:
+            feed_file.write(feed_header(file_format, generated_at))
+
+            for vehicle_id, fragment in fragments:
+                feed_file.write(fragment)
+                fragments_file.write(json.dumps({'id': vehicle_id, 'fragment': fragment}, ensure_ascii=False) + '\n')
+                items += 1
+
+            feed_file.write(feed_footer(file_format))
+            feed_file.flush()
+            os.fsync(feed_file.fileno())
+
+        # Feed e fragmentos trocados antes dos metadados: se o processo parar
+        # no meio, a próxima execução apenas reprocessa as mesmas alterações
+        os.replace(fragments_temp, paths['fragments'])
+        os.replace(feed_temp, paths['feed'])
+    except Exception:
+        for temp_path in (feed_temp, fragments_temp):
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        raise
+
+    state = {
+        'format': file_format,
+        'watermark': watermark.isoformat(),
+        'generated_at': generated_at.isoformat(),
+        'items': items
+    }
+    state_temp = temp_path_for(paths['state'])
+    with open(state_temp, 'w', encoding='utf-8') as state_file:
+        json.dump(state, state_file, indent=2)
+    os.replace(state_temp, paths['state'])
+
+    return {
+        'format': file_format,
+        'mode': 'incremental' if incremental else 'full',
+        'items': items,
+        'changed': len(changes) if changes is not None else items,
+        'path': paths['feed'],
+        'generated_at': state['generated_at']
+    }
@@ -0,0 +1,121 @@
+"""
+Deduplicação de imagens por hash do conteúdo (SHA-256 dos bytes enviados)
+Uploads com o mesmo conteúdo reaproveitam as variantes locais ou o arquivo do
+CDN já existentes: a nova VehicleImage aponta para os mesmos arquivos
+As referências são contadas pelas próprias linhas de vehicle_images, então os
+arquivos físicos só são removidos quando a última imagem que os usa é apagada
+Reaproveitamento e remoção são serializados pela linha de origem: quem
+reaproveita a trava (claim_*_source) até o commit, e quem remove conta as
+referências na mesma transação do DELETE - um dos dois sempre vê o outro
+"""
+import hashlib
+import os
+from sqlalchemy import update
+from src.models.user import db
+from src.models.vehicle import VehicleImage
+from src.image_pipeline import LOCAL_VARIANTS
+
+# Leitura em blocos: o arquivo nunca é carregado inteiro só para o hash
+HASH_CHUNK_SIZE = 64 * 1024
+
+def hash_content(source):
+    """
+    SHA-256 (hex) do conteúdo do upload
+    source: bytes, caminho de arquivo ou arquivo binário aberto (volta ao início)
+    """
+    digest = hashlib.sha256()
+
+    if isinstance(source, (bytes, bytearray)):
+        digest.update(source)
+        return digest.hexdigest()
+
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as stream:
+            return hash_content(stream)
+
+    source.seek(0)
+    for chunk in iter(lambda: source.read(HASH_CHUNK_SIZE), b''):
+        digest.update(chunk)
+    source.seek(0)
+    return digest.hexdigest()
+
+def find_vehicle_duplicate(vehicle_id, content_hash):
+    """Imagem do próprio veículo com o mesmo conteúdo (reenvio da mesma foto)"""
+    return VehicleImage.query.filter_by(vehicle_id=vehicle_id, content_hash=content_hash).first()
+
+def find_local_source(content_hash, upload_dir):
+    """Imagem local com o mesmo conteúdo cujas variantes ainda estão no disco"""
+    candidates = VehicleImage.query.filter(
+        VehicleImage.content_hash == content_hash,
+        VehicleImage.cdn_file_id.is_(None)
+    ).all()
+
+    for image in candidates:
+        if local_files_exist(image.filename, upload_dir):
+            return image
+    return None
+
+def local_files_exist(filename, upload_dir):
+    """Todas as variantes locais de filename estão no disco"""
+    return all(os.path.exists(os.path.join(upload_dir, f"{name}_{filename}")) for name, _ in LOCAL_VARIANTS)
+
+def find_cdn_source(content_hash):
+    """Imagem já enviada ao CDN com o mesmo conteúdo"""
+    return VehicleImage.query.filter(
+        VehicleImage.content_hash == content_hash,
+        VehicleImage.cdn_file_id.isnot(None)
+    ).first()
+
+def lock_source(image):
+    """
+    Trava a linha de origem até o fim da transação atual (UPDATE sem efeito)
+    Uma remoção concorrente da mesma linha espera o commit e então conta a
+    cópia; se a remoção veio antes, a linha sumiu e retorna False
+    """
+    result = db.session.execute(
+        update(VehicleImage)
+        .where(VehicleImage.id == image.id)
+        .values(content_hash=VehicleImage.content_hash)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+def claim_local_source(image, upload_dir):
+    """Trava a origem local para reaproveitá-la; False se ela foi removida (processar de novo)"""
+    return lock_source(image) and local_files_exist(image.filename, upload_dir)
+
+def claim_cdn_source(image):
+    """Trava a origem no CDN para reaproveitá-la; False se ela foi removida (enviar de novo)"""
+    return lock_source(image)
+
+def clone_image(source, vehicle_id, original_filename, image_order):
+    """Nova VehicleImage que reaproveita os arquivos (locais ou do CDN) de source"""
+    return VehicleImage(
+        vehicle_id=vehicle_id,
+        filename=source.filename,
+        original_filename=original_filename,
+        file_path=source.file_path,
+        file_size=source.file_size,
+        mime_type=source.mime_type,
+        image_order=image_order,
+        cdn_file_id=source.cdn_file_id,
+        cdn_url=source.cdn_url,
+        content_hash=source.content_hash
+    )
+
+def local_references(filename):
+    """
+    Quantas imagens locais ainda usam as variantes de filename
+    Na remoção, chamar após o flush do DELETE e antes do commit
+    """
+    return VehicleImage.query.filter(
+        VehicleImage.filename == filename,
+        VehicleImage.cdn_file_id.is_(None)
+    ).count()
+
+def cdn_references(file_id):
+    """
+    Quantas imagens ainda usam o arquivo file_id do CDN
+    Na remoção, chamar após o flush do DELETE e antes do commit
+    """
+    return VehicleImage.query.filter_by(cdn_file_id=file_id).count()
@@ -0,0 +1,31 @@
+"""
+Formatos e nomes de arquivo das variantes de imagem, sem dependências
+O modelo monta as URLs por formato a partir daqui sem carregar Pillow e
+libmagic; o suporte a AVIF depende do Pillow e é registrado pelo
+image_pipeline quando ele é carregado (até lá, apenas WebP)
+"""
+
+# Formato na URL -> extensão do arquivo
+FORMAT_EXTENSIONS = {
+    'jpeg': 'jpg',
+    'webp': 'webp',
+    'avif': 'avif'
+}
+
+# Todas as extensões alternativas possíveis (inclusive de formatos gravados
+# antes de uma mudança de versão do Pillow), usadas na remoção
+ALTERNATE_EXTENSIONS = ('webp', 'avif')
+
+# Formatos modernos gravados junto com o JPEG neste processo, em ordem de preferência
+formats_state = {'modern': ('webp',)}
+
+def modern_formats():
+    return formats_state['modern']
+
+def set_modern_formats(formats):
+    """Chamado pelo image_pipeline com os formatos que o Pillow consegue gravar"""
+    formats_state['modern'] = tuple(formats)
+
+def alternate_filename(filename, fmt):
+    """Arquivo de uma variante em formato moderno: <arquivo>.<extensão>"""
+    return f"{filename}.{FORMAT_EXTENSIONS[fmt]}"
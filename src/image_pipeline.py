@@ -0,0 +1,236 @@
+"""
+Pipeline de variantes de imagem para uploads locais
+A imagem é validada a partir dos bytes recebidos (sem gravar e reler do disco),
+decodificada uma única vez - em JPEG, já em escala reduzida (draft mode) - e
+as variantes são geradas em cascata, da maior para a menor, cada uma
+redimensionada a partir da anterior em vez do original em resolução total
+Além do JPEG, cada variante é gravada em WebP (e AVIF, se o Pillow suportar)
+como <prefixo>_<filename>.webp/.avif, escolhidos pelo header Accept ao servir
+"""
+import atexit
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import magic
+from PIL import Image
+from src.image_formats import FORMAT_EXTENSIONS, ALTERNATE_EXTENSIONS, alternate_filename, set_modern_formats
+
+# Variantes geradas no upload local: (prefixo do arquivo, tamanho máximo),
+# da maior para a menor - a ordem é a da cascata
+LOCAL_VARIANTS = (
+    ('original', (1920, 1080)),
+    ('medium', (800, 600)),
+    ('thumb', (300, 200))
+)
+
+# Formatos aceitos pelo decodificador (mesmos das extensões permitidas)
+ALLOWED_FORMATS = {'JPEG', 'PNG', 'GIF', 'WEBP'}
+
+# Bytes iniciais suficientes para o libmagic identificar o tipo
+MAGIC_HEADER_BYTES = 2048
+
+JPEG_QUALITY = 85
+WEBP_QUALITY = 80
+# AVIF comprime mais a cada ponto de qualidade (60 ~ JPEG 85 visualmente)
+AVIF_QUALITY = 60
+
+def avif_supported():
+    """AVIF nativo (Pillow >= 11.2) ou pelo plugin pillow-avif-plugin, se instalado"""
+    try:
+        import pillow_avif  # noqa: F401 - registra o formato no Pillow
+    except ImportError:
+        pass
+    Image.init()
+    return 'AVIF' in Image.SAVE
+
+# Formatos de saída: nome na URL -> (formato do Pillow, MIME, extensão)
+OUTPUT_FORMATS = {
+    'jpeg': ('JPEG', 'image/jpeg', FORMAT_EXTENSIONS['jpeg']),
+    'webp': ('WEBP', 'image/webp', FORMAT_EXTENSIONS['webp'])
+}
+if avif_supported():
+    OUTPUT_FORMATS['avif'] = ('AVIF', 'image/avif', FORMAT_EXTENSIONS['avif'])
+
+# Formatos modernos gravados junto com o JPEG, em ordem de preferência na negociação
+MODERN_FORMATS = tuple(fmt for fmt in ('avif', 'webp') if fmt in OUTPUT_FORMATS)
+set_modern_formats(MODERN_FORMATS)
+
+class InvalidImageError(ValueError):
+    """Conteúdo enviado não é uma imagem válida"""
+
+def sniff_mime_type(content):
+    """Identifica o MIME type pelos bytes iniciais (equivalente ao from_file)"""
+    return magic.Magic(mime=True).from_buffer(content[:MAGIC_HEADER_BYTES])
+
+def decode_image(content, target_size):
+    """
+    Decodifica a imagem uma única vez
+    JPEG usa draft mode: o decodificador reduz a escala (1/2, 1/4, 1/8) já na
+    leitura, mantendo a imagem ao menos do tamanho de target_size
+    """
+    mime_type = sniff_mime_type(content)
+    if not mime_type.startswith('image/'):
+        raise InvalidImageError(f'Tipo de conteúdo inválido: {mime_type}')
+
+    try:
+        image = Image.open(io.BytesIO(content))
+        if image.format not in ALLOWED_FORMATS:
+            raise InvalidImageError(f'Formato não suportado: {image.format}')
+
+        original_size = image.size
+        image.draft('RGB', target_size)
+        # load() decodifica e valida (arquivos truncados/corrompidos falham aqui)
+        image.load()
+    except InvalidImageError:
+        raise
+    except Exception as e:
+        raise InvalidImageError(f'Imagem inválida: {e}')
+
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGB')
+
+    return image, mime_type, original_size
+
+def encode_image(image, fmt='jpeg'):
+    """Codifica uma variante no formato de saída (chave de OUTPUT_FORMATS)"""
+    buffer = io.BytesIO()
+    if fmt == 'webp':
+        image.save(buffer, 'WEBP', quality=WEBP_QUALITY, method=4)
+    elif fmt == 'avif':
+        image.save(buffer, 'AVIF', quality=AVIF_QUALITY)
+    else:
+        image.save(buffer, 'JPEG', quality=JPEG_QUALITY, optimize=True)
+    return buffer.getvalue()
+
+def encode_jpeg(image):
+    """Codifica uma variante em JPEG otimizado"""
+    return encode_image(image, 'jpeg')
+
+def render_variants(content, variants=LOCAL_VARIANTS, formats=MODERN_FORMATS):
+    """
+    Gera as variantes em memória a partir dos bytes do upload
+    Retorna (metadados da imagem, lista de (nome, {formato: bytes}, largura, altura)),
+    sempre com 'jpeg' e mais um item por formato em formats
+    """
+    image, mime_type, original_size = decode_image(content, variants[0][1])
+
+    rendered = []
+    for name, size in variants:
+        # Cascata: thumbnail reduz in-place, então cada variante parte da anterior
+        image.thumbnail(size, Image.Resampling.LANCZOS)
+        encoded = {fmt: encode_image(image, fmt) for fmt in ('jpeg',) + tuple(formats)}
+        rendered.append((name, encoded, image.width, image.height))
+
+    image.close()
+
+    info = {
+        'mime_type': mime_type,
+        'width': original_size[0],
+        'height': original_size[1]
+    }
+    return info, rendered
+
+def process_image(content, output_dir, filename, variants=LOCAL_VARIANTS, formats=MODERN_FORMATS):
+    """
+    Valida e grava todas as variantes (<prefixo>_<filename>, mais as versões
+    em formatos modernos) em uma passada
+    Se qualquer gravação falhar, nenhuma variante fica no disco
+    Retorna os metadados (MIME, dimensões originais e das variantes)
+    """
+    info, rendered = render_variants(content, variants, formats)
+
+    written = []
+    try:
+        for name, encoded, width, height in rendered:
+            for fmt, data in encoded.items():
+                variant_filename = f"{name}_{filename}"
+                if fmt != 'jpeg':
+                    variant_filename = alternate_filename(variant_filename, fmt)
+                path = os.path.join(output_dir, variant_filename)
+                with open(path, 'wb') as output:
+                    output.write(data)
+                written.append(path)
+    except Exception:
+        for path in written:
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+
+    info['variants'] = {
+        name: {
+            'width': width,
+            'height': height,
+            'size': len(encoded['jpeg']),
+            'formats': {fmt: len(data) for fmt, data in encoded.items()}
+        }
+        for name, encoded, width, height in rendered
+    }
+    return info
+
+# ==================== PROCESSAMENTO EM PARALELO ====================
+
+# Pool de processos por worker da aplicação (criado sob demanda)
+image_pool_state = {'executor': None, 'size': 0}
+image_pool_lock = threading.Lock()
+
+def get_image_pool(size):
+    """
+    Retorna o pool de processos de imagem com o tamanho configurado
+    Usa 'spawn': fork de um processo com threads (servidor web) pode travar
+    """
+    with image_pool_lock:
+        if image_pool_state['executor'] is None or image_pool_state['size'] != size:
+            if image_pool_state['executor'] is not None:
+                image_pool_state['executor'].shutdown(wait=False)
+            image_pool_state['executor'] = ProcessPoolExecutor(
+                max_workers=size,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+            image_pool_state['size'] = size
+        return image_pool_state['executor']
+
+def shutdown_image_pool():
+    """Encerra o pool (no encerramento do processo ou após falha de um worker)"""
+    with image_pool_lock:
+        executor = image_pool_state['executor']
+        image_pool_state['executor'] = None
+        image_pool_state['size'] = 0
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+atexit.register(shutdown_image_pool)
+
+def process_images(jobs, output_dir, pool_size=1):
+    """
+    Processa vários uploads (lista de (bytes, filename)) e retorna, na mesma
+    ordem, os metadados de cada um ou a exceção que ele gerou
+    Com pool_size > 1 as imagens são processadas em paralelo no pool de processos
+    """
+    if pool_size <= 1 or len(jobs) <= 1:
+        return [run_job(content, output_dir, filename) for content, filename in jobs]
+
+    executor = get_image_pool(pool_size)
+    futures = [executor.submit(process_image, content, output_dir, filename) for content, filename in jobs]
+
+    results = []
+    for (content, filename), future in zip(jobs, futures):
+        try:
+            results.append(future.result())
+        except BrokenProcessPool:
+            # Worker morto (ex.: OOM): recriar o pool na próxima chamada e
+            # processar os arquivos restantes no próprio processo
+            shutdown_image_pool()
+            results.append(run_job(content, output_dir, filename))
+        except Exception as e:
+            results.append(e)
+    return results
+
+def run_job(content, output_dir, filename):
+    """Processa um upload no processo atual, devolvendo a exceção em vez de propagá-la"""
+    try:
+        return process_image(content, output_dir, filename)
+    except Exception as e:
+        return e
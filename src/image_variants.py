@@ -0,0 +1,275 @@
+"""
+Variantes de imagem sob demanda para uploads locais (/api/uploads/<arquivo>?w=&h=&fit=&fmt=)
+Equivalente local das transformações ?tr= do ImageKit: a variante é gerada na
+primeira requisição a partir da maior variante gravada no upload (original_)
+e guardada em um cache em disco com limite de bytes e descarte LRU
+Apenas os tamanhos da lista permitida (IMAGE_VARIANT_SIZES) são aceitos, para
+que URLs arbitrárias não encham o cache nem consumam CPU
+Requisições simultâneas da mesma variante geram a imagem uma única vez
+O índice LRU é por processo; na inicialização ele é reconstruído a partir do
+disco (ordem pelo mtime, renovado a cada acerto)
+Sem fmt, o formato é negociado pelo header Accept (AVIF/WebP quando o
+navegador os anuncia explicitamente, senão JPEG)
+"""
+import os
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future
+from PIL import Image, ImageOps
+from src.image_pipeline import OUTPUT_FORMATS, MODERN_FORMATS, encode_image, InvalidImageError
+
+FITS = ('contain', 'cover')
+
+DEFAULT_SIZES = '1200x800,800x600,640x480,400x300,300x200,160x120'
+
+class InvalidVariantError(ValueError):
+    """Parâmetros de variante fora da lista permitida"""
+
+def parse_sizes(value):
+    """'800x600,300x200' -> {(800, 600), (300, 200)}"""
+    sizes = set()
+    for item in (value or '').split(','):
+        item = item.strip().lower()
+        if not item:
+            continue
+        width, _, height = item.partition('x')
+        sizes.add((int(width), int(height)))
+    return sizes
+
+def parse_variant_args(args, allowed_sizes):
+    """
+    Valida w, h, fit e fmt da query string
+    Retorna (largura, altura, fit, formato); formato None se não informado
+    (negociado pelo Accept); InvalidVariantError se fora da lista
+    """
+    try:
+        size = (int(args.get('w', '')), int(args.get('h', '')))
+    except ValueError:
+        raise InvalidVariantError('Parâmetros w e h são obrigatórios e devem ser inteiros')
+
+    if size not in allowed_sizes:
+        allowed = ', '.join(f'{width}x{height}' for width, height in sorted(allowed_sizes, reverse=True))
+        raise InvalidVariantError(f'Tamanho não permitido. Tamanhos disponíveis: {allowed}')
+
+    fit = args.get('fit', 'contain').lower()
+    if fit not in FITS:
+        raise InvalidVariantError(f"fit deve ser um de: {', '.join(FITS)}")
+
+    fmt = args.get('fmt')
+    if fmt is None:
+        return size[0], size[1], fit, None
+
+    fmt = fmt.lower()
+    if fmt == 'jpg':
+        fmt = 'jpeg'
+    if fmt not in OUTPUT_FORMATS:
+        raise InvalidVariantError(f"fmt deve ser um de: {', '.join(OUTPUT_FORMATS)}")
+
+    return size[0], size[1], fit, fmt
+
+def negotiate_format(accept, available=MODERN_FORMATS):
+    """
+    Melhor formato moderno que o cliente anuncia no Accept (q > 0), senão 'jpeg'
+    Só conta o MIME explícito: image/* e */* também vêm de navegadores sem suporte
+    """
+    accepted = {value for value, quality in accept if quality > 0}
+    for fmt in MODERN_FORMATS:
+        if fmt in available and OUTPUT_FORMATS[fmt][1] in accepted:
+            return fmt
+    return 'jpeg'
+
+def variant_key(filename, width, height, fit, fmt):
+    """Caminho relativo no cache: um diretório por imagem (descartado junto com ela)"""
+    return f"{filename}/{width}x{height}-{fit}.{OUTPUT_FORMATS[fmt][2]}"
+
+def render_variant(source_path, width, height, fit, fmt):
+    """
+    Gera a variante a partir do arquivo de origem
+    contain: cabe em width x height mantendo a proporção (sem ampliar)
+    cover: preenche exatamente width x height, cortando o excesso ao centro
+    """
+    try:
+        with Image.open(source_path) as source:
+            # JPEG: decodifica já em escala reduzida, ainda cobrindo o tamanho pedido
+            source.draft('RGB', (width, height))
+            image = source.convert('RGB') if source.mode != 'RGB' else source.copy()
+    except (OSError, ValueError) as e:
+        raise InvalidImageError(f'Imagem inválida: {e}')
+
+    if fit == 'cover':
+        image = ImageOps.fit(image, (width, height), Image.Resampling.LANCZOS)
+    else:
+        image.thumbnail((width, height), Image.Resampling.LANCZOS)
+
+    data = encode_image(image, fmt)
+    image.close()
+    return data
+
+def convert_image(source_path, fmt):
+    """Mesma imagem em outro formato, sem redimensionar (variantes anteriores aos formatos modernos)"""
+    try:
+        with Image.open(source_path) as source:
+            image = source.convert('RGB') if source.mode != 'RGB' else source.copy()
+    except (OSError, ValueError) as e:
+        raise InvalidImageError(f'Imagem inválida: {e}')
+
+    data = encode_image(image, fmt)
+    image.close()
+    return data
+
+class VariantCache:
+    """Cache em disco das variantes, limitado a max_bytes com descarte LRU"""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # chave -> bytes, do uso mais antigo ao mais recente
+        self.total_bytes = 0
+        self.in_flight = {}  # chave -> Future com o caminho
+        os.makedirs(directory, exist_ok=True)
+        self.load()
+
+    def load(self):
+        """Reconstrói o índice a partir dos arquivos já no disco"""
+        found = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                if name.endswith('.tmp'):
+                    # Gravação interrompida
+                    os.remove(path)
+                    continue
+                stat = os.stat(path)
+                found.append((stat.st_mtime, os.path.relpath(path, self.directory), stat.st_size))
+
+        with self.lock:
+            for _, key, size in sorted(found):
+                self.entries[key] = size
+                self.total_bytes += size
+            self.evict()
+
+    def path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key, render):
+        """
+        Caminho da variante key no cache; render() gera os bytes se ela não existir
+        Só uma thread gera cada variante: as demais aguardam o mesmo resultado
+        """
+        path = self.path(key)
+        with self.lock:
+            if key in self.entries:
+                if os.path.exists(path):
+                    self.entries.move_to_end(key)
+                    touch(path)
+                    return path
+                # Removida por outro processo
+                self.total_bytes -= self.entries.pop(key)
+
+            future = self.in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self.in_flight[key] = future
+
+        if not owner:
+            return future.result()
+
+        try:
+            if os.path.exists(path):
+                # Gerada por outro processo
+                size = os.path.getsize(path)
+                touch(path)
+            else:
+                size = self.write(path, render())
+
+            with self.lock:
+                self.entries[key] = size
+                self.total_bytes += size
+                self.evict(keep=key)
+
+            future.set_result(path)
+            return path
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                self.in_flight.pop(key, None)
+
+    def write(self, path, data):
+        """Gravação atômica (arquivo temporário + rename): nunca serve variante pela metade"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            with open(temp_path, 'wb') as output:
+                output.write(data)
+            os.replace(temp_path, path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return len(data)
+
+    def evict(self, keep=None):
+        """Remove as variantes menos usadas até caber no limite (chamar com o lock)"""
+        while self.total_bytes > self.max_bytes and self.entries:
+            key, size = next(iter(self.entries.items()))
+            if key == keep:
+                if len(self.entries) == 1:
+                    break
+                self.entries.move_to_end(key)
+                continue
+            del self.entries[key]
+            self.total_bytes -= size
+            try:
+                os.remove(self.path(key))
+            except FileNotFoundError:
+                pass
+
+    def forget(self, key):
+        """Tira do índice uma variante cujo arquivo sumiu"""
+        with self.lock:
+            if key in self.entries:
+                self.total_bytes -= self.entries.pop(key)
+
+    def discard(self, filename):
+        """Remove todas as variantes de uma imagem (após apagar os arquivos dela)"""
+        prefix = f"{filename}/"
+        with self.lock:
+            for key in [key for key in self.entries if key.startswith(prefix)]:
+                self.total_bytes -= self.entries.pop(key)
+        shutil.rmtree(self.path(filename), ignore_errors=True)
+
+    def stats(self):
+        with self.lock:
+            return {'entries': len(self.entries), 'bytes': self.total_bytes, 'max_bytes': self.max_bytes}
+
+def touch(path):
+    """Renova o mtime (ordem LRU preservada entre reinícios)"""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+# Cache do processo (criado na primeira chamada)
+variant_cache_state = {'cache': None, 'sizes': None}
+variant_cache_lock = threading.Lock()
+
+def get_variant_cache(config):
+    with variant_cache_lock:
+        if variant_cache_state['cache'] is None:
+            variant_cache_state['cache'] = VariantCache(
+                config['IMAGE_VARIANT_CACHE_DIR'],
+                config.get('IMAGE_VARIANT_CACHE_BYTES', 256 * 1024 * 1024)
+            )
+        return variant_cache_state['cache']
+
+def get_allowed_sizes(config):
+    """Tamanhos permitidos (IMAGE_VARIANT_SIZES, interpretado uma vez)"""
+    if variant_cache_state['sizes'] is None:
+        variant_cache_state['sizes'] = parse_sizes(config.get('IMAGE_VARIANT_SIZES', DEFAULT_SIZES))
+    return variant_cache_state['sizes']
@@ -0,0 +1,323 @@
+"""
+Fila de tarefas em segundo plano, durável, em um arquivo SQLite local
+As tarefas sobrevivem a reinícios: cada processo do servidor roda um pequeno
+pool de threads que reivindica tarefas com BEGIN IMMEDIATE (seguro entre
+processos), executa o handler registrado para o tipo e grava o resultado
+Falhas temporárias são repetidas com backoff exponencial; JobFailed encerra
+a tarefa sem novas tentativas
+"""
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_SUCCEEDED = 'succeeded'
+STATUS_FAILED = 'failed'
+
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_RETRY_BASE = 2  # segundos (2, 4, 8, ...)
+MAX_RETRY_DELAY = 300
+
+# Tarefas "running" sem atualização por mais tempo que isso são de um
+# processo que morreu e voltam para a fila
+DEFAULT_LEASE_SECONDS = 600
+
+# Intervalo de consulta quando a fila está vazia (enfileirar no mesmo processo acorda na hora)
+POLL_INTERVAL = 1.0
+
+# Tarefas concluídas são apagadas depois deste prazo
+RETENTION_SECONDS = 7 * 24 * 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    run_at REAL NOT NULL,
+    progress INTEGER NOT NULL DEFAULT 0,
+    message TEXT,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_jobs_status_run_at ON jobs (status, run_at);
+"""
+
+class JobFailed(Exception):
+    """Erro definitivo: a tarefa é marcada como falha sem novas tentativas"""
+
+def iso(timestamp):
+    return datetime.utcfromtimestamp(timestamp).isoformat() if timestamp else None
+
+class JobQueue:
+    """Fila durável em SQLite (uma conexão por operação, segura entre threads e processos)"""
+
+    def __init__(self, path, retry_base=DEFAULT_RETRY_BASE, lease_seconds=DEFAULT_LEASE_SECONDS):
+        self.path = path
+        self.retry_base = retry_base
+        self.lease_seconds = lease_seconds
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self.connect() as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.executescript(SCHEMA)
+
+    @contextmanager
+    def connect(self):
+        # isolation_level=None: autocommit, com transação explícita no claim
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    def enqueue(self, kind, payload, max_attempts=DEFAULT_MAX_ATTEMPTS, message=None):
+        """Adiciona uma tarefa e retorna o ID"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self.connect() as connection:
+            connection.execute(
+                "INSERT INTO jobs (id, kind, payload, status, max_attempts, run_at, message, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, json.dumps(payload), STATUS_QUEUED, max_attempts, now, message, now, now)
+            )
+        return job_id
+
+    def claim(self):
+        """
+        Reivindica a próxima tarefa pronta (ou abandonada por um processo morto)
+        Retorna o registro como dict, ou None se não houver
+        """
+        now = time.time()
+        with self.connect() as connection:
+            # BEGIN IMMEDIATE: a escrita é reservada antes da leitura, então dois
+            # workers (mesmo em processos diferentes) nunca pegam a mesma tarefa
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                row = connection.execute(
+                    "SELECT * FROM jobs WHERE (status = ? AND run_at <= ?) OR (status = ? AND updated_at < ?) "
+                    "ORDER BY run_at LIMIT 1",
+                    (STATUS_QUEUED, now, STATUS_RUNNING, now - self.lease_seconds)
+                ).fetchone()
+                if row is not None:
+                    connection.execute(
+                        "UPDATE jobs SET status = ?, attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                        (STATUS_RUNNING, now, row['id'])
+                    )
+                connection.execute('COMMIT')
+            except Exception:
+                connection.execute('ROLLBACK')
+                raise
+
+        if row is None:
+            return None
+
+        job = dict(row)
+        job['attempts'] += 1
+        job['payload'] = json.loads(job['payload'])
+        return job
+
+    def update_progress(self, job_id, progress, message=None):
+        """Atualiza o progresso (0-100); também renova a posse da tarefa"""
+        with self.connect() as connection:
+            connection.execute(
+                "UPDATE jobs SET progress = ?, message = COALESCE(?, message), updated_at = ? WHERE id = ?",
+                (int(progress), message, time.time(), job_id)
+            )
+
+    def complete(self, job_id, result=None, message=None):
+        with self.connect() as connection:
+            connection.execute(
+                "UPDATE jobs SET status = ?, progress = 100, result = ?, error = NULL, "
+                "message = COALESCE(?, message), updated_at = ? WHERE id = ?",
+                (STATUS_SUCCEEDED, json.dumps(result), message, time.time(), job_id)
+            )
+
+    def fail(self, job_id, error, retry=True):
+        """
+        Registra uma falha: volta para a fila com backoff exponencial enquanto
+        houver tentativas, senão marca como falha definitiva
+        Retorna True se a tarefa falhou definitivamente
+        """
+        now = time.time()
+        with self.connect() as connection:
+            row = connection.execute(
+                "SELECT attempts, max_attempts FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            if row is None:
+                return True
+
+            if retry and row['attempts'] < row['max_attempts']:
+                delay = min(self.retry_base * 2 ** (row['attempts'] - 1), MAX_RETRY_DELAY)
+                connection.execute(
+                    "UPDATE jobs SET status = ?, run_at = ?, error = ?, message = ?, updated_at = ? WHERE id = ?",
+                    (STATUS_QUEUED, now + delay, str(error), f'Nova tentativa em {delay:.0f}s', now, job_id)
+                )
+                return False
+
+            connection.execute(
+                "UPDATE jobs SET status = ?, error = ?, message = NULL, updated_at = ? WHERE id = ?",
+                (STATUS_FAILED, str(error), now, job_id)
+            )
+            return True
+
+    def get(self, job_id):
+        """Estado público de uma tarefa (None se não existir)"""
+        with self.connect() as connection:
+            row = connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+
+        return {
+            'id': row['id'],
+            'kind': row['kind'],
+            'status': row['status'],
+            'progress': row['progress'],
+            'message': row['message'],
+            'attempts': row['attempts'],
+            'max_attempts': row['max_attempts'],
+            'next_attempt_at': iso(row['run_at']) if row['status'] == STATUS_QUEUED else None,
+            'result': json.loads(row['result']) if row['result'] else None,
+            'error': row['error'],
+            'created_at': iso(row['created_at']),
+            'updated_at': iso(row['updated_at'])
+        }
+
+    def prune(self, older_than=RETENTION_SECONDS):
+        """Remove tarefas concluídas (com sucesso ou falha) antigas"""
+        with self.connect() as connection:
+            cursor = connection.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?",
+                (STATUS_SUCCEEDED, STATUS_FAILED, time.time() - older_than)
+            )
+            return cursor.rowcount
+
+# ==================== HANDLERS E WORKERS ====================
+
+# {tipo: {'handler': fn(payload, progress), 'on_failure': fn(payload, error) ou None}}
+job_handlers = {}
+
+queue_state = {'queue': None, 'threads': [], 'wakeup': threading.Event(), 'stopping': False}
+
+def register_job_handler(kind, handler, on_failure=None):
+    """
+    Registra o handler de um tipo de tarefa
+    handler(payload, progress) roda dentro de um app context; progress(pct, msg)
+    reporta o andamento e o retorno (serializável em JSON) vira o resultado
+    on_failure(payload, error) é chamado após a falha definitiva (ex.: limpeza)
+    """
+    job_handlers[kind] = {'handler': handler, 'on_failure': on_failure}
+
+def get_job_queue():
+    """Fila do processo atual (None se init_job_queue não foi chamado)"""
+    return queue_state['queue']
+
+def enqueue_job(kind, payload, max_attempts=None):
+    """Enfileira uma tarefa e acorda um worker deste processo"""
+    queue = queue_state['queue']
+    if queue is None:
+        raise RuntimeError('Fila de tarefas não inicializada')
+    job_id = queue.enqueue(kind, payload, max_attempts or DEFAULT_MAX_ATTEMPTS, message='Aguardando processamento')
+    queue_state['wakeup'].set()
+    return job_id
+
+def run_job(app, queue, job):
+    """Executa uma tarefa reivindicada e registra o resultado"""
+    entry = job_handlers.get(job['kind'])
+    if entry is None:
+        queue.fail(job['id'], f"Tipo de tarefa desconhecido: {job['kind']}", retry=False)
+        return
+
+    def progress(pct, message=None):
+        queue.update_progress(job['id'], pct, message)
+
+    with app.app_context():
+        try:
+            result = entry['handler'](job['payload'], progress)
+        except Exception as e:
+            permanent = isinstance(e, JobFailed)
+            if not permanent:
+                app.logger.error(f"Erro na tarefa {job['kind']} {job['id']} (tentativa {job['attempts']}): {e}")
+            if queue.fail(job['id'], e, retry=not permanent) and entry['on_failure']:
+                try:
+                    entry['on_failure'](job['payload'], e)
+                except Exception as cleanup_error:
+                    app.logger.error(f"Erro ao finalizar tarefa {job['id']}: {cleanup_error}")
+            return
+
+    queue.complete(job['id'], result, message='Concluído')
+
+def worker_loop(app, queue):
+    """Loop de um worker: reivindica e executa tarefas até o processo encerrar"""
+    wakeup = queue_state['wakeup']
+    while not queue_state['stopping']:
+        try:
+            job = queue.claim()
+        except Exception as e:
+            app.logger.error(f"Erro ao ler fila de tarefas: {e}")
+            job = None
+
+        if job is None:
+            wakeup.wait(POLL_INTERVAL)
+            wakeup.clear()
+            continue
+
+        run_job(app, queue, job)
+
+def stop_workers():
+    queue_state['stopping'] = True
+    queue_state['wakeup'].set()
+
+def init_job_queue(app):
+    """
+    Abre a fila (JOB_QUEUE_PATH) para enfileirar tarefas neste processo
+    Os workers só são iniciados com JOB_WORKERS_AUTOSTART (servidores WSGI);
+    o ponto de entrada do servidor chama start_job_workers, e scripts de
+    linha de comando apenas enfileiram
+    """
+    if queue_state['queue'] is not None:
+        return queue_state['queue']
+
+    queue = JobQueue(
+        app.config['JOB_QUEUE_PATH'],
+        retry_base=app.config.get('JOB_RETRY_BASE', DEFAULT_RETRY_BASE)
+    )
+    queue_state['queue'] = queue
+
+    try:
+        removed = queue.prune()
+        if removed:
+            app.logger.info(f"{removed} tarefa(s) antigas removidas da fila")
+    except Exception as e:
+        app.logger.error(f"Erro ao limpar fila de tarefas: {e}")
+
+    if app.config.get('JOB_WORKERS_AUTOSTART'):
+        start_job_workers(app)
+    return queue
+
+def start_job_workers(app):
+    """Inicia JOB_WORKERS threads que executam as tarefas da fila (uma vez por processo)"""
+    queue = init_job_queue(app)
+    if queue_state['threads']:
+        return queue
+
+    for index in range(app.config.get('JOB_WORKERS', 2)):
+        thread = threading.Thread(target=worker_loop, args=(app, queue), name=f'job-worker-{index}', daemon=True)
+        thread.start()
+        queue_state['threads'].append(thread)
+
+    atexit.register(stop_workers)
+    return queue
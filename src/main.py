@@ -14,16 +14,24 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
 # Importar modelos
 from src.models.user import db, User
-from src.models.vehicle import Vehicle, VehicleImage
+from src.models.vehicle import Vehicle, VehicleImage, VehicleStats
+from src.models.saved_search import SavedSearch, SavedSearchMatch
 
 # Importar blueprints
 from src.routes.auth import auth_bp
 from src.routes.vehicles_cached import vehicles_bp  # Versão com cache
 from src.routes.uploads import uploads_bp
 from src.routes.cdn_uploads import cdn_uploads_bp
+from src.routes.bootstrap import bootstrap_bp, build_health_payload
+from src.routes.saved_searches import saved_searches_bp
+from src.routes.feeds import feeds_bp
 
 # Importar sistema de cache
 from src.cache_manager import init_cache, warm_cache, cache_context_processor
+from src.view_counters import start_counter_flusher
+from src.snapshots import init_snapshots
+from src.job_queue import init_job_queue, start_job_workers
+from src.cdn_client import init_cdn_client
 
 def create_app():
     """Factory function para criar a aplicação Flask"""
@@ -52,16 +60,68 @@ def create_app():
     
     # Configurações de upload
     app.config['MAX_CONTENT_LENGTH'] = 5 * 1024 * 1024  # 5MB
+    app.config['IMPORT_MAX_CONTENT_LENGTH'] = int(os.environ.get('IMPORT_MAX_CONTENT_LENGTH', 100 * 1024 * 1024))  # 100MB
     
     # Configurações do ImageKit CDN
     app.config['IMAGEKIT_PRIVATE_KEY'] = os.environ.get('IMAGEKIT_PRIVATE_KEY', '')
     app.config['IMAGEKIT_PUBLIC_KEY'] = os.environ.get('IMAGEKIT_PUBLIC_KEY', '')
     app.config['IMAGEKIT_URL_ENDPOINT'] = os.environ.get('IMAGEKIT_URL_ENDPOINT', '')
+    app.config['IMAGEKIT_UPLOAD_URL'] = os.environ.get('IMAGEKIT_UPLOAD_URL', 'https://upload.imagekit.io/api/v1/files/upload')
+    app.config['IMAGEKIT_API_URL'] = os.environ.get('IMAGEKIT_API_URL', 'https://api.imagekit.io/v1')
+    app.config['CDN_UPLOAD_CONCURRENCY'] = int(os.environ.get('CDN_UPLOAD_CONCURRENCY', 4))  # envios simultâneos por lote
+    app.config['CDN_TIMEOUT'] = float(os.environ.get('CDN_TIMEOUT', 30))  # segundos
+    app.config['CDN_MAX_RETRIES'] = int(os.environ.get('CDN_MAX_RETRIES', 3))
+    app.config['CDN_RETRY_BACKOFF'] = float(os.environ.get('CDN_RETRY_BACKOFF', 0.5))  # segundos (dobra a cada tentativa)
+    app.config['CDN_SIGNATURE_TTL'] = int(os.environ.get('CDN_SIGNATURE_TTL', 1800))  # segundos (ImageKit aceita até 1 hora)
+    app.config['CDN_REQUEST_BUDGET'] = float(os.environ.get('CDN_REQUEST_BUDGET', 20))  # segundos de CDN por request
+    app.config['CDN_BREAKER_FAILURES'] = int(os.environ.get('CDN_BREAKER_FAILURES', 5))  # falhas seguidas para abrir
+    app.config['CDN_BREAKER_SLOW_CALL'] = float(os.environ.get('CDN_BREAKER_SLOW_CALL', 10))  # segundos (lenta = falha)
+    app.config['CDN_BREAKER_RESET'] = int(os.environ.get('CDN_BREAKER_RESET', 30))  # segundos aberto antes do teste
+    app.config['CDN_DELETE_MAX_ATTEMPTS'] = int(os.environ.get('CDN_DELETE_MAX_ATTEMPTS', 10))
+    app.config['CDN_INLINE_DELETE_TIMEOUT'] = float(os.environ.get('CDN_INLINE_DELETE_TIMEOUT', 2))  # segundos (tentativa no request)
     
     # Configurações de Cache
     app.config['CACHE_TIMEOUT'] = int(os.environ.get('CACHE_TIMEOUT', 3600))  # 1 hora
     app.config['CACHE_THRESHOLD'] = int(os.environ.get('CACHE_THRESHOLD', 500))  # 500 itens
     
+    # Contadores de visualizações/cliques: intervalo de gravação em lote
+    app.config['COUNTER_FLUSH_INTERVAL'] = int(os.environ.get('COUNTER_FLUSH_INTERVAL', 5))  # segundos
+    
+    # Índice de veículos semelhantes: reconstrução completa periódica
+    app.config['SIMILAR_REBUILD_INTERVAL'] = int(os.environ.get('SIMILAR_REBUILD_INTERVAL', 3600))  # segundos
+    
+    # Snapshots estáticos do catálogo (desativado se vazio)
+    app.config['SNAPSHOT_DIR'] = os.environ.get('SNAPSHOT_DIR', '')
+    
+    # Feeds de anúncios para marketplaces (gerados por generate_feeds.py)
+    app.config['FEED_DIR'] = os.environ.get('FEED_DIR', '')
+    app.config['FEED_BASE_URL'] = os.environ.get('FEED_BASE_URL', '')  # URL pública da API (imagens locais)
+    app.config['FEED_VEHICLE_URL'] = os.environ.get('FEED_VEHICLE_URL', '')  # Ex.: https://loja.com.br/veiculos/{id}
+    
+    # Cache de borda (CDN/proxy reverso): TTL via Surrogate-Control e purga por surrogate keys
+    app.config['EDGE_CACHE_TTL'] = int(os.environ.get('EDGE_CACHE_TTL', 86400))  # 24 horas
+    app.config['EDGE_PURGE_BACKEND'] = os.environ.get('EDGE_PURGE_BACKEND', '')  # http, log ou vazio (desativado)
+    app.config['EDGE_PURGE_URL'] = os.environ.get('EDGE_PURGE_URL', '')  # Ex.: http://localhost:8080/__purge
+    app.config['EDGE_PURGE_TOKEN'] = os.environ.get('EDGE_PURGE_TOKEN', '')
+    app.config['EDGE_PURGE_MAX_ATTEMPTS'] = int(os.environ.get('EDGE_PURGE_MAX_ATTEMPTS', 5))
+
+    # Configurações do processamento de imagens em lote (processos por worker; 1 = sem pool)
+    app.config['UPLOAD_PROCESS_POOL_SIZE'] = int(os.environ.get('UPLOAD_PROCESS_POOL_SIZE', min(4, os.cpu_count() or 1)))
+
+    # Variantes sob demanda das imagens locais (/api/uploads/<arquivo>?w=&h=&fit=&fmt=)
+    app.config['IMAGE_VARIANT_SIZES'] = os.environ.get('IMAGE_VARIANT_SIZES', '1200x800,800x600,640x480,400x300,300x200,160x120')
+    app.config['IMAGE_VARIANT_CACHE_DIR'] = os.environ.get('IMAGE_VARIANT_CACHE_DIR', os.path.join(app.root_path, 'static', 'variant_cache'))
+    app.config['IMAGE_VARIANT_CACHE_BYTES'] = int(os.environ.get('IMAGE_VARIANT_CACHE_BYTES', 256 * 1024 * 1024))
+
+    # Configurações da fila de tarefas em segundo plano (uploads assíncronos)
+    app.config['JOB_QUEUE_PATH'] = os.environ.get('JOB_QUEUE_PATH', os.path.join(app.root_path, 'database', 'jobs.db'))
+    app.config['JOB_WORKERS'] = int(os.environ.get('JOB_WORKERS', 2))  # threads por processo
+    # Workers iniciados junto com a aplicação (servidores WSGI); python src/main.py sempre os inicia
+    app.config['JOB_WORKERS_AUTOSTART'] = os.environ.get('JOB_WORKERS_AUTOSTART', 'false').lower() == 'true'
+    app.config['JOB_MAX_ATTEMPTS'] = int(os.environ.get('JOB_MAX_ATTEMPTS', 5))
+    app.config['JOB_RETRY_BASE'] = float(os.environ.get('JOB_RETRY_BASE', 2))  # segundos (dobra a cada tentativa)
+    app.config['UPLOAD_SPOOL_DIR'] = os.environ.get('UPLOAD_SPOOL_DIR', os.path.join(app.root_path, 'database', 'spool'))
+    
     # ==================== EXTENSÕES ====================
     
     # JWT
@@ -70,8 +130,9 @@ def create_app():
     # CORS - Configuração simplificada e robusta
     CORS(app, 
          origins="*",
-         methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-         allow_headers=["Content-Type", "Authorization"])
+         methods=["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"],
+         allow_headers=["Content-Type", "Authorization", "Last-Event-ID", "If-Match"],
+         expose_headers=["ETag"])
     
     # Inicializar sistema de cache
     init_cache(app)
@@ -88,6 +149,9 @@ def create_app():
     app.register_blueprint(vehicles_bp, url_prefix='/api')  # Versão com cache
     app.register_blueprint(uploads_bp, url_prefix='/api')  # Upload local (mantido para compatibilidade)
     app.register_blueprint(cdn_uploads_bp, url_prefix='/api')  # Upload via CDN (novo)
+    app.register_blueprint(bootstrap_bp, url_prefix='/api')  # Documento de bootstrap do frontend
+    app.register_blueprint(saved_searches_bp, url_prefix='/api')  # Buscas salvas (alertas)
+    app.register_blueprint(feeds_bp, url_prefix='/api')  # Feeds para marketplaces
     
     # ==================== HANDLERS JWT ====================
     
@@ -108,33 +172,7 @@ def create_app():
     @app.route('/api/health')
     def health_check():
         """Endpoint de verificação de saúde da aplicação"""
-        # Verificar configuração do CDN
-        cdn_configured = all([
-            app.config.get('IMAGEKIT_PRIVATE_KEY'),
-            app.config.get('IMAGEKIT_PUBLIC_KEY'),
-            app.config.get('IMAGEKIT_URL_ENDPOINT')
-        ])
-        
-        # Verificar cache
-        try:
-            from src.cache_manager import cache_stats
-            cache_status = cache_stats()
-            cache_enabled = cache_status.get('status') == 'active'
-        except Exception:
-            cache_enabled = False
-        
-        return jsonify({
-            'status': 'healthy',
-            'message': 'API da Concessionária funcionando',
-            'version': '1.2.0',
-            'features': {
-                'cdn_enabled': cdn_configured,
-                'local_upload': True,
-                'cache_enabled': cache_enabled,
-                'cache_timeout': app.config.get('CACHE_TIMEOUT', 3600),
-                'cache_threshold': app.config.get('CACHE_THRESHOLD', 500)
-            }
-        }), 200
+        return jsonify(build_health_payload()), 200
     
     # ==================== TRATAMENTO DE ERROS ====================
     
@@ -190,12 +228,32 @@ def create_app():
         except Exception as e:
             print(f"Aviso: Não foi possível aquecer cache: {e}")
     
+    # Gravação periódica dos contadores de visualizações e cliques
+    start_counter_flusher(app)
+    
+    # Regeneração dos snapshots estáticos após escritas de veículos
+    init_snapshots(app)
+    
+    # Fila de tarefas (uploads assíncronos); scripts e migrações só enfileiram
+    init_job_queue(app)
+    
+    # Orçamento de tempo das chamadas ao CDN por request
+    init_cdn_client(app)
+    
     return app
 
-# Criar aplicação
-app = create_app()
+# Aplicação WSGI (gunicorn src.main:app); com servidor WSGI, os workers da
+# fila de tarefas são iniciados com JOB_WORKERS_AUTOSTART=true
+# O pool de processos de imagem ('spawn') reimporta o ponto de entrada como
+# __mp_main__ em cada worker, que não deve repetir a inicialização (banco,
+# cache, filas, threads)
+if __name__ != '__mp_main__':
+    app = create_app()
 
 if __name__ == '__main__':
+    # Workers da fila de tarefas no processo do servidor
+    start_job_workers(app)
+    
     # Configuração para desenvolvimento e deploy
     port = int(os.environ.get('PORT', 5000))
     debug = os.environ.get('FLASK_ENV') == 'development'
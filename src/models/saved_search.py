@@ -0,0 +1,71 @@
+"""
+Modelos de buscas salvas (alertas de novos veículos) e da fila de notificações
+"""
+from datetime import datetime
+import json
+from src.models.user import db  # Usar a mesma instância do db
+
+class SavedSearch(db.Model):
+    """Busca salva por um cliente com os mesmos filtros de /api/vehicles"""
+    __tablename__ = 'saved_searches'
+
+    id = db.Column(db.Integer, primary_key=True)
+    contact = db.Column(db.String(200), nullable=False)  # E-mail ou telefone para o alerta
+    filters = db.Column(db.Text, nullable=False)  # JSON com os filtros da busca
+    is_active = db.Column(db.Boolean, default=True, nullable=False, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    matches = db.relationship('SavedSearchMatch', backref='saved_search', lazy=True, cascade='all, delete-orphan')
+
+    def get_filters(self):
+        """Retorna os filtros como dicionário"""
+        try:
+            return json.loads(self.filters) if self.filters else {}
+        except (json.JSONDecodeError, TypeError):
+            return {}
+
+    def set_filters(self, filters):
+        """Define os filtros a partir de um dicionário"""
+        self.filters = json.dumps(filters or {})
+
+    def to_dict(self):
+        """Converte a busca salva para dicionário"""
+        return {
+            'id': self.id,
+            'contact': self.contact,
+            'filters': self.get_filters(),
+            'is_active': self.is_active,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+    def __repr__(self):
+        return f'<SavedSearch {self.id} {self.contact}>'
+
+
+class SavedSearchMatch(db.Model):
+    """Veículo que atende a uma busca salva, na fila para notificação"""
+    __tablename__ = 'saved_search_matches'
+    __table_args__ = (
+        # Um mesmo veículo notifica cada busca uma única vez
+        db.UniqueConstraint('saved_search_id', 'vehicle_id', name='uq_saved_search_match'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    saved_search_id = db.Column(db.Integer, db.ForeignKey('saved_searches.id'), nullable=False, index=True)
+    vehicle_id = db.Column(db.Integer, db.ForeignKey('vehicles.id'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    notified_at = db.Column(db.DateTime, index=True)  # None = pendente
+
+    def to_dict(self):
+        """Converte o match para dicionário"""
+        return {
+            'id': self.id,
+            'saved_search_id': self.saved_search_id,
+            'vehicle_id': str(self.vehicle_id),
+            'contact': self.saved_search.contact if self.saved_search else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'notified_at': self.notified_at.isoformat() if self.notified_at else None
+        }
+
+    def __repr__(self):
+        return f'<SavedSearchMatch {self.saved_search_id} -> {self.vehicle_id}>'
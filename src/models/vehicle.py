@@ -5,10 +5,17 @@ Inclui suporte a CDN ImageKit
 from datetime import datetime
 import json
 from src.models.user import db  # Usar a mesma instância do db
+from src.image_formats import modern_formats, alternate_filename
 
 class Vehicle(db.Model):
     """Modelo de veículo com todos os campos necessários"""
     __tablename__ = 'vehicles'
+    __table_args__ = (
+        # Feed incremental de alterações (/api/vehicles/changes)
+        db.Index('ix_vehicles_updated_at_id', 'updated_at', 'id'),
+        # Ordenação por popularidade (sort_by=popularity) direto no índice
+        db.Index('ix_vehicles_views_created_at', 'views', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     marca = db.Column(db.String(100), nullable=False, index=True)
@@ -23,17 +30,30 @@ class Vehicle(db.Model):
     quilometragem = db.Column(db.Integer, default=0)
     categoria = db.Column(db.String(50), index=True)
     whatsapp_link = db.Column(db.String(500))  # Link do WhatsApp para contato
+    external_id = db.Column(db.String(100), unique=True, index=True)  # Chave do veículo no DMS (importação)
     imagens = db.Column(db.Text)  # JSON string com array de URLs do CDN
     is_active = db.Column(db.Boolean, default=True, nullable=False, index=True)
+    views = db.Column(db.Integer, default=0, nullable=False)  # Cópia de vehicle_stats.views para ordenação
     created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relacionamento com imagens
-    vehicle_images = db.relationship('VehicleImage', backref='vehicle', lazy=True, cascade='all, delete-orphan')
+    vehicle_images = db.relationship(
+        'VehicleImage',
+        backref='vehicle',
+        lazy=True,
+        cascade='all, delete-orphan',
+        order_by='VehicleImage.image_order'
+    )
     
-    def to_dict(self):
-        """Converte o veículo para dicionário"""
-        return {
+    def to_dict(self, include_images=False, include_primary_image=False):
+        """
+        Converte o veículo para dicionário
+        include_images: inclui os metadados de todas as imagens (VehicleImage)
+        include_primary_image: inclui apenas a imagem principal (menor image_order)
+        Para evitar N+1 consultas, carregue vehicle_images com selectinload
+        """
+        data = {
             'id': str(self.id),
             'marca': self.marca,
             'modelo': self.modelo,
@@ -52,6 +72,14 @@ class Vehicle(db.Model):
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
+        
+        if include_images:
+            data['images'] = [image.to_dict() for image in self.vehicle_images]
+        
+        if include_primary_image:
+            data['primary_image'] = self.vehicle_images[0].to_dict() if self.vehicle_images else None
+        
+        return data
     
     def set_imagens(self, imagens_list):
         """Define as imagens como JSON string - agora suporta URLs do CDN"""
@@ -105,6 +133,9 @@ class VehicleImage(db.Model):
     cdn_file_id = db.Column(db.String(255))  # ID do arquivo no ImageKit
     cdn_url = db.Column(db.String(1000))     # URL completa do CDN
     
+    # SHA-256 do conteúdo enviado (deduplicação de uploads)
+    content_hash = db.Column(db.String(64), index=True)
+    
     def to_dict(self):
         """Converte a imagem para dicionário com suporte a CDN"""
         base_dict = {
@@ -132,6 +163,15 @@ class VehicleImage(db.Model):
                 'webp_medium': f"{self.cdn_url}?tr=w-800,h-600,c-maintain_ratio,f-webp",
                 'webp_thumbnail': f"{self.cdn_url}?tr=w-300,h-200,c-maintain_ratio,f-webp"
             }
+            # Mesmos tamanhos em formatos modernos (o ImageKit converte sob demanda)
+            base_dict['formats'] = {
+                fmt: {
+                    'original': f"{self.cdn_url}?tr=f-{fmt}",
+                    'medium': f"{self.cdn_url}?tr=w-800,h-600,c-maintain_ratio,f-{fmt}",
+                    'thumbnail': f"{self.cdn_url}?tr=w-300,h-200,c-maintain_ratio,f-{fmt}"
+                }
+                for fmt in ('avif', 'webp')
+            }
         else:
             # Fallback para URLs locais
             base_dict['url'] = f'/api/uploads/{self.filename}'
@@ -140,9 +180,40 @@ class VehicleImage(db.Model):
                 'medium': f'/api/uploads/medium_{self.filename}',
                 'thumbnail': f'/api/uploads/thumb_{self.filename}'
             }
+            # URLs fixas por formato (as de 'urls' já negociam pelo header Accept)
+            base_dict['formats'] = {
+                fmt: {
+                    'original': f"/api/uploads/{alternate_filename(f'original_{self.filename}', fmt)}",
+                    'medium': f"/api/uploads/{alternate_filename(f'medium_{self.filename}', fmt)}",
+                    'thumbnail': f"/api/uploads/{alternate_filename(f'thumb_{self.filename}', fmt)}"
+                }
+                for fmt in modern_formats()
+            }
         
         return base_dict
     
     def __repr__(self):
         return f'<VehicleImage {self.filename}>'
 
+
+
+class VehicleStats(db.Model):
+    """Contadores de engajamento por veículo (visualizações e cliques no WhatsApp)"""
+    __tablename__ = 'vehicle_stats'
+    
+    vehicle_id = db.Column(db.Integer, db.ForeignKey('vehicles.id'), primary_key=True)
+    views = db.Column(db.Integer, default=0, nullable=False, index=True)  # Copiado em vehicles.views
+    whatsapp_clicks = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def to_dict(self):
+        """Converte os contadores para dicionário"""
+        return {
+            'vehicle_id': str(self.vehicle_id),
+            'views': self.views,
+            'whatsapp_clicks': self.whatsapp_clicks,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+    
+    def __repr__(self):
+        return f'<VehicleStats {self.vehicle_id}: {self.views} views>'
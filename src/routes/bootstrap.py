@@ -0,0 +1,151 @@
+"""
+Documento de bootstrap do frontend
+Agrupa em uma única resposta os dados da primeira renderização
+(saúde da API, configuração do CDN, categorias e primeira página de veículos)
+O documento é pré-calculado em memória e regenerado em segundo plano
+após escritas de veículos, então a rota apenas lê bytes prontos
+"""
+import hashlib
+import threading
+import time
+from datetime import datetime
+from flask import Blueprint, request, jsonify, current_app
+from werkzeug.datastructures import MultiDict
+from src.cache_manager import cache_stats, register_invalidation_listener
+
+bootstrap_bp = Blueprint('bootstrap', __name__)
+
+# Documento pré-calculado (por processo)
+bootstrap_state = {
+    'body': None,
+    'etag': None,
+    'generated_at': 0.0
+}
+
+# Controle da regeneração em segundo plano
+regeneration_state = {
+    'pending': False,
+    'running': False
+}
+regeneration_lock = threading.Lock()
+
+def build_health_payload():
+    """Monta o payload de /api/health (compartilhado com o bootstrap)"""
+    # Verificar configuração do CDN
+    cdn_configured = all([
+        current_app.config.get('IMAGEKIT_PRIVATE_KEY'),
+        current_app.config.get('IMAGEKIT_PUBLIC_KEY'),
+        current_app.config.get('IMAGEKIT_URL_ENDPOINT')
+    ])
+
+    # Verificar cache
+    try:
+        cache_status = cache_stats()
+        cache_enabled = cache_status.get('status') == 'active'
+    except Exception:
+        cache_enabled = False
+
+    return {
+        'status': 'healthy',
+        'message': 'API da Concessionária funcionando',
+        'version': '1.2.0',
+        'features': {
+            'cdn_enabled': cdn_configured,
+            'local_upload': True,
+            'cache_enabled': cache_enabled,
+            'cache_timeout': current_app.config.get('CACHE_TIMEOUT', 3600),
+            'cache_threshold': current_app.config.get('CACHE_THRESHOLD', 500)
+        }
+    }
+
+def build_bootstrap_document():
+    """Monta o documento com os quatro payloads da primeira renderização"""
+    from src.routes.vehicles_cached import build_vehicles_listing, build_categories
+    from src.routes.cdn_uploads import build_cdn_config
+
+    return {
+        'health': build_health_payload(),
+        'cdn_config': build_cdn_config(),
+        'categories': build_categories(),
+        'vehicles': build_vehicles_listing(MultiDict({'page': '1'})),
+        'generated_at': datetime.utcnow().isoformat()
+    }
+
+def regenerate_bootstrap():
+    """
+    Recalcula o documento e o ETag e publica ambos atomicamente
+    Deve ser chamada dentro de um app context
+    """
+    body = current_app.json.dumps(build_bootstrap_document()).encode('utf-8')
+    etag = hashlib.md5(body).hexdigest()
+
+    # Substituição do dict inteiro: leitores nunca veem body e etag misturados
+    global bootstrap_state
+    bootstrap_state = {
+        'body': body,
+        'etag': etag,
+        'generated_at': time.time()
+    }
+
+    current_app.logger.info(f"Bootstrap regenerado ({len(body)} bytes, etag {etag})")
+    return bootstrap_state
+
+def regeneration_worker(app):
+    """Regenera o documento enquanto houver pedidos pendentes (agrupa rajadas de escrita)"""
+    while True:
+        with regeneration_lock:
+            if not regeneration_state['pending']:
+                regeneration_state['running'] = False
+                return
+            regeneration_state['pending'] = False
+
+        with app.app_context():
+            try:
+                regenerate_bootstrap()
+            except Exception as e:
+                app.logger.error(f"Erro ao regenerar bootstrap: {e}")
+
+def schedule_bootstrap_regeneration(app):
+    """Agenda a regeneração em uma thread de fundo (no máximo uma por processo)"""
+    with regeneration_lock:
+        regeneration_state['pending'] = True
+        if regeneration_state['running']:
+            return
+        regeneration_state['running'] = True
+
+    thread = threading.Thread(target=regeneration_worker, args=(app,), daemon=True)
+    thread.start()
+
+def on_vehicle_cache_invalidated(vehicle_ids=None):
+    """Listener de invalidação: qualquer escrita de veículo regenera o bootstrap"""
+    schedule_bootstrap_regeneration(current_app._get_current_object())
+
+register_invalidation_listener(on_vehicle_cache_invalidated)
+
+@bootstrap_bp.route('/bootstrap', methods=['GET'])
+def get_bootstrap():
+    """
+    Retorna o documento de bootstrap do frontend com ETag
+    Endpoint público - responde 304 quando o ETag do cliente ainda é válido
+    """
+    try:
+        state = bootstrap_state
+
+        if state['body'] is None:
+            # Primeira requisição do processo: gerar de forma síncrona
+            state = regenerate_bootstrap()
+        elif time.time() - state['generated_at'] > current_app.config.get('CACHE_TIMEOUT', 3600):
+            # Documento expirado: servir o atual e regenerar em segundo plano
+            schedule_bootstrap_regeneration(current_app._get_current_object())
+
+        response = current_app.response_class(state['body'], mimetype='application/json')
+        response.set_etag(state['etag'])
+
+        # Clientes sempre revalidam; o ETag torna a revalidação barata (304)
+        response.headers['Cache-Control'] = 'public, no-cache'
+
+        return response.make_conditional(request)
+
+    except Exception as e:
+        current_app.logger.error(f"Erro em get_bootstrap: {e}")
+        return jsonify({'error': 'Erro interno do servidor'}), 500
@@ -3,10 +3,12 @@ Sistema de upload via CDN ImageKit para veículos
 Substitui o sistema de upload local por CDN
 """
 import os
+import time
 import uuid
-import requests
-import base64
+import hmac
+import hashlib
 from flask import Blueprint, request, jsonify, current_app
+from marshmallow import Schema, fields, ValidationError, validate
 from flask_jwt_extended import jwt_required
 from werkzeug.utils import secure_filename
 from PIL import Image
@@ -15,6 +17,16 @@ import io
 from src.models.vehicle import Vehicle, VehicleImage
 from src.models.user import db
 from src.routes.auth import require_admin
+from src.cache_manager import invalidate_vehicle_cache
+from src.cdn_client import get_cdn_client, cdn_circuit_open, CDNError
+from src.job_queue import enqueue_job, register_job_handler, JobFailed
+from src.routes.uploads import (
+    is_async_request, spool_upload, open_spooled_file, remove_spooled_file, accepted_job_response
+)
+from src.image_pipeline import MAGIC_HEADER_BYTES
+from src.image_dedup import (
+    hash_content, find_vehicle_duplicate, find_cdn_source, claim_cdn_source, clone_image, cdn_references
+)
 
 cdn_uploads_bp = Blueprint('cdn_uploads', __name__)
 
@@ -32,23 +44,31 @@ def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def validate_image_content(file_content):
-    """Valida se o conteúdo é realmente uma imagem"""
+def validate_image_content(source):
+    """
+    Valida se o conteúdo é realmente uma imagem
+    source: bytes ou arquivo binário aberto (lido sem carregar tudo em memória)
+    """
+    stream = io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source
     try:
-        # Verificar MIME type
+        # Verificar MIME type (o cabeçalho basta para o libmagic)
+        stream.seek(0)
         mime = magic.Magic(mime=True)
-        file_mime = mime.from_buffer(file_content)
+        file_mime = mime.from_buffer(stream.read(MAGIC_HEADER_BYTES))
         
         if not file_mime.startswith('image/'):
             return False
         
         # Tentar abrir com PIL
-        with Image.open(io.BytesIO(file_content)) as img:
+        stream.seek(0)
+        with Image.open(stream) as img:
             img.verify()
         
         return True
     except Exception:
         return False
+    finally:
+        stream.seek(0)
 
 def generate_unique_filename(original_filename, vehicle_id):
     """Gera um nome único para o arquivo no CDN"""
@@ -61,7 +81,7 @@ def upload_to_imagekit(file_content, filename, folder_path):
     Faz upload de uma imagem para o ImageKit
     
     Args:
-        file_content: Conteúdo binário do arquivo
+        file_content: Conteúdo binário, caminho ou arquivo aberto (enviado em streaming)
         filename: Nome do arquivo
         folder_path: Caminho da pasta no ImageKit
     
@@ -69,73 +89,146 @@ def upload_to_imagekit(file_content, filename, folder_path):
         dict: Resposta do ImageKit ou None em caso de erro
     """
     try:
-        # Converter conteúdo para base64
-        file_base64 = base64.b64encode(file_content).decode('utf-8')
-        
-        # Preparar dados para upload
-        upload_data = {
-            'file': file_base64,
-            'fileName': filename,
-            'folder': folder_path,
-            'useUniqueFileName': False,  # Já geramos nome único
-            'tags': ['vehicle', 'concessionaria'],
-            'isPrivateFile': False,
-            'customCoordinates': '',
-            'responseFields': 'fileId,name,size,filePath,url,fileType,height,width,thumbnailUrl'
-        }
-        
-        # Headers para autenticação
-        headers = {
-            'Authorization': f'Basic {base64.b64encode(f"{IMAGEKIT_PRIVATE_KEY}:".encode()).decode()}'
-        }
-        
-        # Fazer upload
-        response = requests.post(
-            'https://upload.imagekit.io/api/v1/files/upload',
-            data=upload_data,
-            headers=headers,
-            timeout=30
-        )
-        
-        if response.status_code == 200:
-            return response.json()
-        else:
-            print(f"Erro no upload ImageKit: {response.status_code} - {response.text}")
-            return None
-            
+        return get_cdn_client().upload(file_content, filename, folder_path)
     except Exception as e:
         print(f"Erro ao fazer upload para ImageKit: {e}")
         return None
 
-def delete_from_imagekit(file_id):
+def delete_from_imagekit(file_id, timeout=None, max_retries=None):
     """
     Remove uma imagem do ImageKit
     
     Args:
         file_id: ID do arquivo no ImageKit
+        timeout, max_retries: substituem CDN_TIMEOUT e CDN_MAX_RETRIES
     
     Returns:
         bool: True se removido com sucesso, False caso contrário
     """
     try:
-        # Headers para autenticação
-        headers = {
-            'Authorization': f'Basic {base64.b64encode(f"{IMAGEKIT_PRIVATE_KEY}:".encode()).decode()}'
-        }
-        
-        # Fazer delete
-        response = requests.delete(
-            f'https://api.imagekit.io/v1/files/{file_id}',
-            headers=headers,
-            timeout=30
-        )
-        
-        return response.status_code == 204
-        
+        return get_cdn_client(timeout=timeout, max_retries=max_retries).delete(file_id)
     except Exception as e:
         print(f"Erro ao deletar do ImageKit: {e}")
         return False
 
+def delete_cdn_file(file_id):
+    """
+    Remove o arquivo do CDN sem bloquear a resposta: uma única tentativa, sem
+    novas tentativas e com timeout curto (CDN_INLINE_DELETE_TIMEOUT); se falhar
+    (ou o circuito estiver aberto), deixa a remoção na fila durável, que
+    repete com backoff
+    Retorna True se removido agora, False se enfileirado
+    """
+    timeout = current_app.config.get('CDN_INLINE_DELETE_TIMEOUT', 2)
+    if not cdn_circuit_open() and delete_from_imagekit(file_id, timeout=timeout, max_retries=0):
+        return True
+
+    enqueue_job('cdn_delete', {'file_id': file_id}, current_app.config.get('CDN_DELETE_MAX_ATTEMPTS'))
+    current_app.logger.info(f"Remoção do arquivo {file_id} do ImageKit enviada para a fila")
+    return False
+
+def process_cdn_delete_job(payload, progress):
+    """Tarefa de remoção no CDN (erros de rede e circuito aberto voltam para a fila)"""
+    if not get_cdn_client().delete(payload['file_id']):
+        raise JobFailed('ImageKit recusou a remoção do arquivo')
+    return {'file_id': payload['file_id']}
+
+register_job_handler('cdn_delete', process_cdn_delete_job)
+
+def cdn_unavailable_response():
+    """503 enquanto o circuito do CDN está aberto (falha rápida, sem segurar o worker)"""
+    response = jsonify({'error': 'CDN temporariamente indisponível, tente novamente em instantes'})
+    response.headers['Retry-After'] = str(current_app.config.get('CDN_BREAKER_RESET', 30))
+    return response, 503
+
+def cdn_data(upload_result):
+    """Dados do CDN devolvidos ao frontend após o upload"""
+    return {
+        'file_id': upload_result['fileId'],
+        'url': upload_result['url'],
+        'thumbnail_url': upload_result.get('thumbnailUrl'),
+        'width': upload_result.get('width'),
+        'height': upload_result.get('height')
+    }
+
+def reused_cdn_data(image):
+    """Dados do CDN de um arquivo reaproveitado (mesmo conteúdo já enviado)"""
+    return {
+        'file_id': image.cdn_file_id,
+        'url': image.cdn_url,
+        'reused': True
+    }
+
+def reuse_cdn_image(vehicle, source, original_filename, image_order):
+    """Registra na sessão (sem commit) uma imagem que aponta para o arquivo de source no CDN"""
+    vehicle_image = clone_image(source, vehicle.id, original_filename, image_order)
+    db.session.add(vehicle_image)
+    vehicle.add_imagem(source.cdn_url)
+    return vehicle_image
+
+def process_cdn_upload_job(payload, progress):
+    """Tarefa do upload assíncrono via CDN: valida, envia ao ImageKit e registra a imagem"""
+    vehicle = Vehicle.query.get(payload['vehicle_id'])
+    if not vehicle:
+        raise JobFailed('Veículo não encontrado')
+
+    with open_spooled_file(payload) as spooled:
+        # Conteúdo já enviado: reaproveitar o arquivo do CDN em vez de reenviar
+        content_hash = hash_content(spooled)
+        duplicate = find_vehicle_duplicate(vehicle.id, content_hash)
+        if duplicate:
+            remove_spooled_file(payload)
+            return {'image': duplicate.to_dict(), 'cdn_data': reused_cdn_data(duplicate)}
+
+        # Origem travada até o commit; se foi removida nesse meio tempo, enviar normalmente
+        source = find_cdn_source(content_hash)
+        if source and claim_cdn_source(source):
+            vehicle_image = reuse_cdn_image(vehicle, source, payload['original_filename'], len(vehicle.vehicle_images))
+            db.session.commit()
+            invalidate_vehicle_cache(vehicle.id)
+            remove_spooled_file(payload)
+            return {'image': vehicle_image.to_dict(), 'cdn_data': reused_cdn_data(source)}
+
+        progress(10, 'Validando imagem')
+        if not validate_image_content(spooled):
+            raise JobFailed('Arquivo não é uma imagem válida')
+
+        # Enviado direto do spool, em blocos
+        progress(30, 'Enviando para o CDN')
+        upload_result = upload_to_imagekit(spooled, payload['filename'], payload['folder_path'])
+
+    if not upload_result:
+        # Falha temporária (rede, limite de taxa): a fila tenta novamente com backoff
+        raise RuntimeError('Erro ao fazer upload para CDN')
+
+    progress(80, 'Salvando imagem')
+    vehicle_image = VehicleImage(
+        vehicle_id=vehicle.id,
+        filename=upload_result['name'],
+        original_filename=payload['original_filename'],
+        file_path=upload_result['filePath'],
+        file_size=upload_result['size'],
+        mime_type=upload_result.get('fileType', payload['mime_type']),
+        image_order=len(vehicle.vehicle_images),
+        cdn_file_id=upload_result['fileId'],
+        cdn_url=upload_result['url'],
+        content_hash=content_hash
+    )
+
+    db.session.add(vehicle_image)
+    vehicle.add_imagem(upload_result['url'])
+    db.session.commit()
+
+    invalidate_vehicle_cache(vehicle.id)
+    remove_spooled_file(payload)
+
+    return {
+        'image': vehicle_image.to_dict(),
+        'cdn_data': cdn_data(upload_result)
+    }
+
+register_job_handler('cdn_upload', process_cdn_upload_job, on_failure=remove_spooled_file)
+
 @cdn_uploads_bp.route('/cdn-upload', methods=['POST'])
 @require_admin()
 def cdn_upload_file():
@@ -170,23 +263,62 @@ def cdn_upload_file():
         if not allowed_file(file.filename):
             return jsonify({'error': 'Tipo de arquivo não permitido'}), 400
         
-        # Ler conteúdo do arquivo
-        file_content = file.read()
+        # Verificar tamanho do arquivo (sem ler o conteúdo para a memória)
+        file.seek(0, os.SEEK_END)
+        file_size = file.tell()
+        file.seek(0)
         
-        # Verificar tamanho do arquivo
-        if len(file_content) > MAX_FILE_SIZE:
+        if file_size > MAX_FILE_SIZE:
             return jsonify({'error': 'Arquivo muito grande (máximo 5MB)'}), 400
         
-        # Validar se é realmente uma imagem
-        if not validate_image_content(file_content):
-            return jsonify({'error': 'Arquivo não é uma imagem válida'}), 400
-        
         # Gerar nome único para o arquivo
         filename = generate_unique_filename(file.filename, vehicle_id)
         folder_path = f"/vehicles/{vehicle_id}"
         
-        # Fazer upload para ImageKit
-        upload_result = upload_to_imagekit(file_content, filename, folder_path)
+        # Modo assíncrono: grava no spool; validação e envio ficam com a tarefa
+        if is_async_request():
+            job_id = enqueue_job('cdn_upload', {
+                'vehicle_id': vehicle.id,
+                'spool_path': spool_upload(file),
+                'filename': filename,
+                'folder_path': folder_path,
+                'original_filename': secure_filename(file.filename),
+                'mime_type': file.content_type
+            }, current_app.config.get('JOB_MAX_ATTEMPTS'))
+            return accepted_job_response(job_id)
+        
+        # Conteúdo já enviado: reaproveitar o arquivo do CDN (não depende do circuito)
+        content_hash = hash_content(file.stream)
+        duplicate = find_vehicle_duplicate(vehicle.id, content_hash)
+        if duplicate:
+            return jsonify({
+                'message': 'Imagem já cadastrada para este veículo',
+                'image': duplicate.to_dict(),
+                'cdn_data': reused_cdn_data(duplicate)
+            }), 200
+        
+        # Origem travada até o commit; se foi removida nesse meio tempo, enviar normalmente
+        source = find_cdn_source(content_hash)
+        if source and claim_cdn_source(source):
+            vehicle_image = reuse_cdn_image(vehicle, source, secure_filename(file.filename), len(vehicle.vehicle_images))
+            db.session.commit()
+            invalidate_vehicle_cache(vehicle.id)
+            return jsonify({
+                'message': 'Imagem enviada com sucesso para CDN',
+                'image': vehicle_image.to_dict(),
+                'cdn_data': reused_cdn_data(source)
+            }), 201
+        
+        # CDN indisponível: falhar já (o modo assíncrono continua aceitando uploads)
+        if cdn_circuit_open():
+            return cdn_unavailable_response()
+        
+        # Validar se é realmente uma imagem
+        if not validate_image_content(file.stream):
+            return jsonify({'error': 'Arquivo não é uma imagem válida'}), 400
+        
+        # Fazer upload para ImageKit (streaming direto do arquivo recebido)
+        upload_result = upload_to_imagekit(file.stream, filename, folder_path)
         
         if not upload_result:
             return jsonify({'error': 'Erro ao fazer upload para CDN'}), 500
@@ -201,7 +333,8 @@ def cdn_upload_file():
             mime_type=upload_result.get('fileType', file.content_type),
             image_order=len(vehicle.vehicle_images),
             cdn_file_id=upload_result['fileId'],  # Novo campo para ID do CDN
-            cdn_url=upload_result['url']  # Novo campo para URL do CDN
+            cdn_url=upload_result['url'],  # Novo campo para URL do CDN
+            content_hash=content_hash
         )
         
         db.session.add(vehicle_image)
@@ -211,16 +344,12 @@ def cdn_upload_file():
         
         db.session.commit()
         
+        invalidate_vehicle_cache(vehicle.id)
+        
         return jsonify({
             'message': 'Imagem enviada com sucesso para CDN',
             'image': vehicle_image.to_dict(),
-            'cdn_data': {
-                'file_id': upload_result['fileId'],
-                'url': upload_result['url'],
-                'thumbnail_url': upload_result.get('thumbnailUrl'),
-                'width': upload_result.get('width'),
-                'height': upload_result.get('height')
-            }
+            'cdn_data': cdn_data(upload_result)
         }), 201
         
     except Exception as e:
@@ -239,21 +368,28 @@ def delete_cdn_image(image_id):
         if not image:
             return jsonify({'error': 'Imagem não encontrada'}), 404
         
-        # Remover do ImageKit se tiver file_id
-        if hasattr(image, 'cdn_file_id') and image.cdn_file_id:
-            delete_success = delete_from_imagekit(image.cdn_file_id)
-            if not delete_success:
-                print(f"Aviso: Não foi possível remover imagem {image.cdn_file_id} do ImageKit")
-        
         # Remover da lista do veículo
-        vehicle = Vehicle.query.get(image.vehicle_id)
+        file_id = getattr(image, 'cdn_file_id', None)
+        vehicle_id = image.vehicle_id
+        vehicle = Vehicle.query.get(vehicle_id)
         if vehicle and hasattr(image, 'cdn_url') and image.cdn_url:
             vehicle.remove_imagem(image.cdn_url)
         
-        # Remover do banco
+        # Remover do banco; as referências restantes são contadas na mesma
+        # transação (um reaproveitamento em andamento trava a origem e é visto aqui)
         db.session.delete(image)
+        db.session.flush()
+        remaining = cdn_references(file_id) if file_id else 0
         db.session.commit()
         
+        # Remover do ImageKit só quando nenhuma outra imagem (upload deduplicado)
+        # usa o arquivo (falhas vão para a fila de tarefas)
+        if file_id and remaining == 0:
+            if not delete_cdn_file(file_id):
+                print(f"Aviso: Remoção da imagem {file_id} do ImageKit será repetida em segundo plano")
+        
+        invalidate_vehicle_cache(vehicle_id)
+        
         return jsonify({'message': 'Imagem removida com sucesso do CDN e banco de dados'}), 200
         
     except Exception as e:
@@ -313,6 +449,9 @@ def bulk_cdn_upload():
         if not all([IMAGEKIT_PRIVATE_KEY, IMAGEKIT_PUBLIC_KEY, IMAGEKIT_URL_ENDPOINT]):
             return jsonify({'error': 'CDN não configurado. Verifique as variáveis de ambiente.'}), 500
         
+        if cdn_circuit_open():
+            return cdn_unavailable_response()
+        
         vehicle_id = request.form.get('vehicle_id')
         
         if not vehicle_id:
@@ -329,41 +468,91 @@ def bulk_cdn_upload():
             return jsonify({'error': 'Nenhum arquivo enviado'}), 400
         
         uploaded_images = []
+        duplicates = []
         errors = []
         
+        # Validação no próprio request; os envios ao CDN rodam em paralelo
+        accepted = []
+        batch_hashes = set()
+        
         for file in files:
+            if file.filename == '':
+                continue
+            
+            if not allowed_file(file.filename):
+                errors.append(f'{file.filename}: Tipo de arquivo não permitido')
+                continue
+            
+            # Verificar tamanho
+            file.seek(0, os.SEEK_END)
+            file_size = file.tell()
+            file.seek(0)
+            
+            if file_size > MAX_FILE_SIZE:
+                errors.append(f'{file.filename}: Arquivo muito grande')
+                continue
+            
+            # Conteúdo repetido: no próprio veículo é ignorado; de outro
+            # veículo, o arquivo do CDN é reaproveitado sem novo envio
+            content_hash = hash_content(file.stream)
+            
+            if content_hash in batch_hashes:
+                errors.append(f'{file.filename}: Imagem repetida no envio')
+                continue
+            batch_hashes.add(content_hash)
+            
+            duplicate = find_vehicle_duplicate(vehicle.id, content_hash)
+            if duplicate:
+                duplicates.append(duplicate.to_dict())
+                continue
+            
+            source = find_cdn_source(content_hash)
+            if source:
+                accepted.append((file, content_hash, source, None))
+                continue
+            
+            # Validar imagem
+            if not validate_image_content(file.stream):
+                errors.append(f'{file.filename}: Não é uma imagem válida')
+                continue
+            
+            # Gerar nome único (o arquivo é enviado em streaming a partir do request)
+            filename = generate_unique_filename(file.filename, vehicle_id)
+            accepted.append((file, content_hash, None, (file.stream, filename, f"/vehicles/{vehicle_id}")))
+        
+        # Resultados na ordem de envio, preservando a ordem das imagens
+        results = iter(get_cdn_client().upload_many([item for _, _, _, item in accepted if item]))
+        
+        for file, content_hash, source, item in accepted:
+            # Origem travada até o commit; se foi removida nesse meio tempo,
+            # o próprio arquivo é enviado
+            if source is not None and claim_cdn_source(source):
+                vehicle_image = reuse_cdn_image(
+                    vehicle, source, secure_filename(file.filename),
+                    len(vehicle.vehicle_images) + len(uploaded_images)
+                )
+                uploaded_images.append({
+                    'image': vehicle_image.to_dict(),
+                    'cdn_data': reused_cdn_data(source)
+                })
+                continue
+            
+            if source is None:
+                upload_result = next(results)
+            elif not validate_image_content(file.stream):
+                errors.append(f'{file.filename}: Não é uma imagem válida')
+                continue
+            else:
+                upload_result = upload_to_imagekit(
+                    file.stream, generate_unique_filename(file.filename, vehicle_id), f"/vehicles/{vehicle_id}"
+                ) or CDNError('Erro ao fazer upload para CDN')
+            
+            if isinstance(upload_result, Exception):
+                print(f"Erro ao fazer upload para ImageKit ({file.filename}): {upload_result}")
+                errors.append(f'{file.filename}: Erro no upload para CDN')
+                continue
+            
             try:
-                if file.filename == '':
-                    continue
-                
-                if not allowed_file(file.filename):
-                    errors.append(f'{file.filename}: Tipo de arquivo não permitido')
-                    continue
-                
-                # Ler conteúdo
-                file_content = file.read()
-                
-                # Verificar tamanho
-                if len(file_content) > MAX_FILE_SIZE:
-                    errors.append(f'{file.filename}: Arquivo muito grande')
-                    continue
-                
-                # Validar imagem
-                if not validate_image_content(file_content):
-                    errors.append(f'{file.filename}: Não é uma imagem válida')
-                    continue
-                
-                # Gerar nome único
-                filename = generate_unique_filename(file.filename, vehicle_id)
-                folder_path = f"/vehicles/{vehicle_id}"
-                
-                # Upload para ImageKit
-                upload_result = upload_to_imagekit(file_content, filename, folder_path)
-                
-                if not upload_result:
-                    errors.append(f'{file.filename}: Erro no upload para CDN')
-                    continue
-                
                 # Salvar no banco
                 vehicle_image = VehicleImage(
                     vehicle_id=vehicle_id,
@@ -374,7 +563,8 @@ def bulk_cdn_upload():
                     mime_type=upload_result.get('fileType', file.content_type),
                     image_order=len(vehicle.vehicle_images) + len(uploaded_images),
                     cdn_file_id=upload_result['fileId'],
-                    cdn_url=upload_result['url']
+                    cdn_url=upload_result['url'],
+                    content_hash=content_hash
                 )
                 
                 db.session.add(vehicle_image)
@@ -390,25 +580,202 @@ def bulk_cdn_upload():
         
         db.session.commit()
         
+        if uploaded_images:
+            invalidate_vehicle_cache(vehicle.id)
+        
+        if uploaded_images:
+            status = 201
+        else:
+            status = 200 if duplicates else 400
+        
         return jsonify({
             'message': f'{len(uploaded_images)} imagens enviadas com sucesso para CDN',
             'uploaded_images': uploaded_images,
+            'duplicates': duplicates,
             'errors': errors
-        }), 201 if uploaded_images else 400
+        }), status
         
     except Exception as e:
         print(f"Erro no upload bulk CDN: {e}")
         return jsonify({'error': 'Erro interno do servidor'}), 500
 
-@cdn_uploads_bp.route('/cdn-config', methods=['GET'])
-def get_cdn_config():
+# ==================== UPLOAD DIRETO (NAVEGADOR -> CDN) ====================
+
+# Prazo para confirmar o upload depois que a assinatura expira
+UPLOAD_COMPLETE_GRACE = 10 * 60  # segundos
+
+# ImageKit recusa expire mais de 1 hora no futuro
+MAX_SIGNATURE_TTL = 3600 - 60
+
+class UploadSignatureSchema(Schema):
+    vehicle_id = fields.Int(required=True, validate=validate.Range(min=1))
+
+class CompleteUploadSchema(Schema):
+    vehicle_id = fields.Int(required=True, validate=validate.Range(min=1))
+    file_id = fields.Str(required=True, validate=validate.Regexp(r'^[A-Za-z0-9_-]{1,64}$'))
+    token = fields.Str(required=True, validate=validate.Length(max=100))
+    expire = fields.Int(required=True)
+    original_filename = fields.Str(load_default=None, validate=validate.Length(max=255))
+
+def upload_token_mac(vehicle_id, nonce, expire):
+    """MAC do token com a SECRET_KEY: amarra o token ao veículo e ao prazo"""
+    message = f'cdn-upload:{vehicle_id}:{nonce}:{expire}'.encode()
+    return hmac.new(current_app.config['SECRET_KEY'].encode(), message, hashlib.sha256).hexdigest()[:32]
+
+def issue_upload_token(vehicle_id, expire):
     """
-    Retorna configuração pública do CDN para o frontend
+    Token de uso único do upload direto (o ImageKit recusa tokens repetidos)
+    Formato <vehicle_id>-<nonce>-<mac>: a confirmação valida o token sem estado no servidor
+    """
+    nonce = uuid.uuid4().hex[:16]
+    return f'{vehicle_id}-{nonce}-{upload_token_mac(vehicle_id, nonce, expire)}'
+
+def verify_upload_token(token, vehicle_id, expire):
+    parts = token.split('-')
+    if len(parts) != 3 or parts[0] != str(vehicle_id):
+        return False
+    return hmac.compare_digest(parts[2], upload_token_mac(vehicle_id, parts[1], expire))
+
+@cdn_uploads_bp.route('/cdn-upload/signature', methods=['POST'])
+@require_admin()
+def cdn_upload_signature():
+    """
+    Emite a assinatura para o navegador enviar a imagem direto ao ImageKit
+    Depois do upload, o frontend chama /cdn-upload/complete com o fileId
+    Requer autenticação de administrador
+    """
+    try:
+        if not all([IMAGEKIT_PRIVATE_KEY, IMAGEKIT_PUBLIC_KEY, IMAGEKIT_URL_ENDPOINT]):
+            return jsonify({'error': 'CDN não configurado. Verifique as variáveis de ambiente.'}), 500
+        
+        schema = UploadSignatureSchema()
+        data = schema.load(request.get_json() or {})
+        
+        vehicle = Vehicle.query.get(data['vehicle_id'])
+        if not vehicle:
+            return jsonify({'error': 'Veículo não encontrado'}), 404
+        
+        ttl = min(current_app.config.get('CDN_SIGNATURE_TTL', 1800), MAX_SIGNATURE_TTL)
+        expire = int(time.time()) + ttl
+        token = issue_upload_token(vehicle.id, expire)
+        client = get_cdn_client()
+        
+        return jsonify({
+            'token': token,
+            'expire': expire,
+            'signature': client.client_upload_signature(token, expire),
+            'public_key': IMAGEKIT_PUBLIC_KEY,
+            'upload_url': client.upload_url,
+            # O ImageKit não inclui a pasta na assinatura: a confirmação exige o arquivo nela
+            'folder': f'/vehicles/{vehicle.id}',
+            'max_file_size': MAX_FILE_SIZE,
+            'allowed_extensions': list(ALLOWED_EXTENSIONS)
+        }), 200
+        
+    except ValidationError as e:
+        return jsonify({'errors': e.messages}), 400
+    except Exception as e:
+        current_app.logger.error(f"Erro em cdn_upload_signature: {e}")
+        return jsonify({'error': 'Erro interno do servidor'}), 500
+
+@cdn_uploads_bp.route('/cdn-upload/complete', methods=['POST'])
+@require_admin()
+def cdn_upload_complete():
     """
-    return jsonify({
+    Registra uma imagem enviada direto ao ImageKit pelo navegador
+    Confere o token emitido em /cdn-upload/signature e os dados do arquivo na API
+    do ImageKit (pasta do veículo, tipo e tamanho) antes de criar a VehicleImage
+    Requer autenticação de administrador
+    """
+    try:
+        schema = CompleteUploadSchema()
+        data = schema.load(request.get_json() or {})
+        vehicle_id = data['vehicle_id']
+        
+        if not verify_upload_token(data['token'], vehicle_id, data['expire']):
+            return jsonify({'error': 'Token de upload inválido'}), 403
+        
+        if time.time() > data['expire'] + UPLOAD_COMPLETE_GRACE:
+            return jsonify({'error': 'Token de upload expirado'}), 403
+        
+        vehicle = Vehicle.query.get(vehicle_id)
+        if not vehicle:
+            return jsonify({'error': 'Veículo não encontrado'}), 404
+        
+        # Confirmação repetida (ex.: nova tentativa do frontend)
+        existing = VehicleImage.query.filter_by(cdn_file_id=data['file_id']).first()
+        if existing:
+            if existing.vehicle_id != vehicle.id:
+                return jsonify({'error': 'Arquivo já registrado em outro veículo'}), 409
+            return jsonify({'message': 'Imagem já registrada', 'image': existing.to_dict()}), 200
+        
+        client = get_cdn_client()
+        try:
+            details = client.get_file_details(data['file_id'])
+        except CDNError as e:
+            current_app.logger.error(f"Erro ao consultar arquivo no ImageKit: {e}")
+            return jsonify({'error': 'CDN indisponível, tente novamente'}), 502
+        
+        if not details:
+            return jsonify({'error': 'Arquivo não encontrado no CDN'}), 404
+        
+        if not details.get('filePath', '').startswith(f'/vehicles/{vehicle.id}/'):
+            return jsonify({'error': 'Arquivo fora da pasta do veículo'}), 403
+        
+        # Arquivos fora da política de upload são removidos do CDN
+        invalid_reason = None
+        if details.get('fileType') != 'image' or not allowed_file(details.get('name', '')):
+            invalid_reason = 'Arquivo não é uma imagem válida'
+        elif details.get('size', 0) > MAX_FILE_SIZE:
+            invalid_reason = 'Arquivo muito grande (máximo 5MB)'
+        
+        if invalid_reason:
+            delete_cdn_file(data['file_id'])
+            return jsonify({'error': invalid_reason}), 400
+        
+        vehicle_image = VehicleImage(
+            vehicle_id=vehicle.id,
+            filename=details['name'],
+            original_filename=secure_filename(data['original_filename'] or details['name']),
+            file_path=details['filePath'],
+            file_size=details['size'],
+            mime_type=details.get('mime'),
+            image_order=len(vehicle.vehicle_images),
+            cdn_file_id=details['fileId'],
+            cdn_url=details['url']
+        )
+        
+        db.session.add(vehicle_image)
+        vehicle.add_imagem(details['url'])
+        db.session.commit()
+        
+        invalidate_vehicle_cache(vehicle.id)
+        
+        return jsonify({
+            'message': 'Imagem registrada com sucesso',
+            'image': vehicle_image.to_dict(),
+            'cdn_data': cdn_data(details)
+        }), 201
+        
+    except ValidationError as e:
+        return jsonify({'errors': e.messages}), 400
+    except Exception as e:
+        current_app.logger.error(f"Erro em cdn_upload_complete: {e}")
+        return jsonify({'error': 'Erro interno do servidor'}), 500
+
+def build_cdn_config():
+    """Monta a configuração pública do CDN (compartilhada com o bootstrap)"""
+    return {
         'imagekit_url_endpoint': IMAGEKIT_URL_ENDPOINT,
         'imagekit_public_key': IMAGEKIT_PUBLIC_KEY,
         'max_file_size': MAX_FILE_SIZE,
         'allowed_extensions': list(ALLOWED_EXTENSIONS)
-    }), 200
+    }
+
+@cdn_uploads_bp.route('/cdn-config', methods=['GET'])
+def get_cdn_config():
+    """
+    Retorna configuração pública do CDN para o frontend
+    """
+    return jsonify(build_cdn_config()), 200
 
@@ -0,0 +1,49 @@
+"""
+Download dos feeds de anúncios para marketplaces
+Os arquivos são gerados por generate_feeds.py (cron) em FEED_DIR;
+a rota apenas serve o último feed completo
+"""
+import os
+from flask import Blueprint, jsonify, current_app, send_file
+from src.feeds import FEED_FORMATS, feed_paths, load_state
+
+feeds_bp = Blueprint('feeds', __name__)
+
+FEED_MIMETYPES = {
+    'xml': 'application/xml',
+    'csv': 'text/csv'
+}
+
+@feeds_bp.route('/feeds/veiculos.<file_format>', methods=['GET'])
+def get_feed(file_format):
+    """
+    Retorna o feed de veículos (XML ou CSV)
+    Endpoint público - com ETag/Last-Modified do arquivo (respostas 304)
+    """
+    try:
+        root = current_app.config.get('FEED_DIR')
+        
+        if file_format not in FEED_FORMATS or not root:
+            return jsonify({'error': 'Feed não encontrado'}), 404
+        
+        paths = feed_paths(root, file_format)
+        
+        if not os.path.exists(paths['feed']):
+            return jsonify({'error': 'Feed ainda não foi gerado'}), 404
+        
+        response = send_file(
+            os.path.abspath(paths['feed']),
+            mimetype=FEED_MIMETYPES[file_format],
+            conditional=True,
+            max_age=300
+        )
+        
+        state = load_state(paths['state'])
+        if state:
+            response.headers['X-Feed-Items'] = str(state['items'])
+        
+        return response
+        
+    except Exception as e:
+        current_app.logger.error(f"Erro em get_feed: {e}")
+        return jsonify({'error': 'Erro interno do servidor'}), 500
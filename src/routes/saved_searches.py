@@ -0,0 +1,200 @@
+"""
+API de buscas salvas (alertas de novos veículos)
+Clientes cadastram os mesmos filtros de /api/vehicles; veículos criados ou
+atualizados são casados com as buscas e os matches ficam na fila de notificação
+"""
+from datetime import datetime
+from flask import Blueprint, request, jsonify, current_app
+from marshmallow import Schema, fields, ValidationError, validate, validates_schema
+from src.models.saved_search import SavedSearch, SavedSearchMatch
+from src.models.user import db
+from src.routes.auth import require_admin
+from src.saved_searches import SAVED_SEARCH_FILTERS, reset_saved_search_index
+
+saved_searches_bp = Blueprint('saved_searches', __name__)
+
+# Limite de matches retornados/confirmados por requisição
+MAX_MATCHES_PER_PAGE = 200
+
+class SavedSearchFiltersSchema(Schema):
+    """Filtros de uma busca salva (mesmos parâmetros de /api/vehicles)"""
+    marca = fields.Str(validate=validate.Length(min=1, max=100))
+    modelo = fields.Str(validate=validate.Length(min=1, max=100))
+    ano_min = fields.Int(validate=validate.Range(min=1900, max=2030))
+    ano_max = fields.Int(validate=validate.Range(min=1900, max=2030))
+    preco_min = fields.Float(validate=validate.Range(min=0, max=10000000))
+    preco_max = fields.Float(validate=validate.Range(min=0, max=10000000))
+    combustivel = fields.Str(validate=validate.OneOf([
+        'Gasolina', 'Etanol', 'Flex', 'Diesel', 'Elétrico', 'Híbrido'
+    ]))
+    categoria = fields.Str(validate=validate.OneOf([
+        'Hatch', 'Sedan', 'SUV', 'Picape', 'Conversível', 'Wagon', 'Coupé'
+    ]))
+    search = fields.Str(validate=validate.Length(min=1, max=100))
+
+    @validates_schema
+    def validate_ranges(self, data, **kwargs):
+        if not any(data.get(name) for name in SAVED_SEARCH_FILTERS):
+            raise ValidationError('Informe ao menos um filtro')
+        if data.get('ano_min') and data.get('ano_max') and data['ano_min'] > data['ano_max']:
+            raise ValidationError('ano_min deve ser menor ou igual a ano_max', 'ano_min')
+        if data.get('preco_min') and data.get('preco_max') and data['preco_min'] > data['preco_max']:
+            raise ValidationError('preco_min deve ser menor ou igual a preco_max', 'preco_min')
+
+class SavedSearchSchema(Schema):
+    """Schema para cadastro de buscas salvas"""
+    contact = fields.Str(required=True, validate=validate.Length(min=5, max=200))
+    filters = fields.Nested(SavedSearchFiltersSchema, required=True)
+
+class AckMatchesSchema(Schema):
+    """Schema para confirmar o envio de notificações"""
+    ids = fields.List(fields.Int(), required=True, validate=validate.Length(min=1, max=MAX_MATCHES_PER_PAGE))
+
+# ==================== ROTAS PÚBLICAS ====================
+
+@saved_searches_bp.route('/saved-searches', methods=['POST'])
+def create_saved_search():
+    """
+    Cadastra uma busca salva
+    Endpoint público - o cliente é avisado quando chegar um veículo compatível
+    """
+    try:
+        schema = SavedSearchSchema()
+        data = schema.load(request.get_json() or {})
+
+        saved_search = SavedSearch(contact=data['contact'])
+        saved_search.set_filters(data['filters'])
+
+        db.session.add(saved_search)
+        db.session.commit()
+
+        return jsonify({
+            'message': 'Busca salva com sucesso',
+            'saved_search': saved_search.to_dict()
+        }), 201
+
+    except ValidationError as e:
+        return jsonify({'errors': e.messages}), 400
+    except Exception as e:
+        current_app.logger.error(f"Erro em create_saved_search: {e}")
+        return jsonify({'error': 'Erro interno do servidor'}), 500
+
+# ==================== ROTAS ADMINISTRATIVAS ====================
+
+@saved_searches_bp.route('/admin/saved-searches', methods=['GET'])
+@require_admin()
+def get_saved_searches():
+    """
+    Lista as buscas salvas
+    Requer autenticação de administrador
+    """
+    try:
+        page = request.args.get('page', 1, type=int)
+        per_page = min(request.args.get('per_page', 20, type=int), 100)
+        status = request.args.get('status', 'active')  # active, inactive, all
+
+        query = SavedSearch.query
+        if status == 'active':
+            query = query.filter_by(is_active=True)
+        elif status == 'inactive':
+            query = query.filter_by(is_active=False)
+
+        pagination = query.order_by(SavedSearch.created_at.desc()).paginate(
+            page=page,
+            per_page=per_page,
+            error_out=False
+        )
+
+        return jsonify({
+            'saved_searches': [saved_search.to_dict() for saved_search in pagination.items],
+            'pagination': {
+                'page': page,
+                'per_page': per_page,
+                'total': pagination.total,
+                'pages': pagination.pages,
+                'has_next': pagination.has_next,
+                'has_prev': pagination.has_prev
+            }
+        }), 200
+
+    except Exception as e:
+        current_app.logger.error(f"Erro em get_saved_searches: {e}")
+        return jsonify({'error': 'Erro interno do servidor'}), 500
+
+@saved_searches_bp.route('/admin/saved-searches/<int:search_id>', methods=['DELETE'])
+@require_admin()
+def delete_saved_search(search_id):
+    """
+    Desativa uma busca salva (deixa de receber matches)
+    Requer autenticação de administrador
+    """
+    try:
+        saved_search = db.session.get(SavedSearch, search_id)
+
+        if not saved_search:
+            return jsonify({'error': 'Busca salva não encontrada'}), 404
+
+        saved_search.is_active = False
+        db.session.commit()
+
+        # O índice deste processo é recarregado na próxima escrita de veículo
+        reset_saved_search_index()
+
+        return jsonify({'message': 'Busca salva desativada com sucesso'}), 200
+
+    except Exception as e:
+        current_app.logger.error(f"Erro em delete_saved_search: {e}")
+        return jsonify({'error': 'Erro interno do servidor'}), 500
+
+@saved_searches_bp.route('/admin/saved-searches/matches', methods=['GET'])
+@require_admin()
+def get_pending_matches():
+    """
+    Fila de notificações pendentes (matches ainda não enviados)
+    Consumida pelo processo que envia os alertas
+    Requer autenticação de administrador
+    """
+    try:
+        limit = min(request.args.get('limit', 100, type=int), MAX_MATCHES_PER_PAGE)
+
+        matches = SavedSearchMatch.query.filter(
+            SavedSearchMatch.notified_at.is_(None)
+        ).order_by(SavedSearchMatch.id.asc()).limit(limit).all()
+
+        return jsonify({
+            'matches': [match.to_dict() for match in matches],
+            'count': len(matches)
+        }), 200
+
+    except Exception as e:
+        current_app.logger.error(f"Erro em get_pending_matches: {e}")
+        return jsonify({'error': 'Erro interno do servidor'}), 500
+
+@saved_searches_bp.route('/admin/saved-searches/matches/ack', methods=['POST'])
+@require_admin()
+def ack_matches():
+    """
+    Marca matches como notificados
+    Requer autenticação de administrador
+    """
+    try:
+        schema = AckMatchesSchema()
+        data = schema.load(request.get_json() or {})
+
+        updated = SavedSearchMatch.query.filter(
+            SavedSearchMatch.id.in_(data['ids']),
+            SavedSearchMatch.notified_at.is_(None)
+        ).update({'notified_at': datetime.utcnow()}, synchronize_session=False)
+        db.session.commit()
+
+        return jsonify({
+            'message': 'Notificações confirmadas',
+            'updated': updated
+        }), 200
+
+    except ValidationError as e:
+        return jsonify({'errors': e.messages}), 400
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Erro em ack_matches: {e}")
+        return jsonify({'error': 'Erro interno do servidor'}), 500
@@ -3,49 +3,42 @@ Sistema de upload e gerenciamento de imagens para veículos
 """
 import os
 import uuid
-from flask import Blueprint, request, jsonify, send_from_directory, current_app
+from datetime import datetime
+from flask import Blueprint, request, jsonify, send_from_directory, send_file, current_app
 from flask_jwt_extended import jwt_required
 from werkzeug.utils import secure_filename
-from PIL import Image
-import magic
 from src.models.vehicle import Vehicle, VehicleImage
 from src.models.user import db
 from src.routes.auth import require_admin
+from src.cache_manager import invalidate_vehicle_cache
+from src.image_pipeline import (
+    process_image, process_images, run_job, InvalidImageError, LOCAL_VARIANTS, OUTPUT_FORMATS, MODERN_FORMATS,
+    ALTERNATE_EXTENSIONS, alternate_filename
+)
+from src.job_queue import enqueue_job, get_job_queue, register_job_handler, JobFailed
+from src.image_variants import (
+    parse_variant_args, variant_key, render_variant, convert_image, negotiate_format,
+    get_variant_cache, get_allowed_sizes, InvalidVariantError
+)
+from src.image_dedup import (
+    hash_content, find_vehicle_duplicate, find_local_source, claim_local_source, clone_image, local_references
+)
 
 uploads_bp = Blueprint('uploads', __name__)
 
 # Configurações de upload
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 MAX_FILE_SIZE = 5 * 1024 * 1024  # 5MB
-IMAGE_SIZES = {
-    'thumbnail': (300, 200),
-    'medium': (800, 600),
-    'large': (1200, 800)
-}
+
+# Variantes sob demanda: o nome do arquivo é único por upload, então o conteúdo nunca muda
+VARIANT_MAX_AGE = 365 * 24 * 3600
+VARIANT_PARAMS = ('w', 'h', 'fit', 'fmt')
 
 def allowed_file(filename):
     """Verifica se o arquivo tem extensão permitida"""
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def validate_image(file_path):
-    """Valida se o arquivo é realmente uma imagem"""
-    try:
-        # Verificar MIME type
-        mime = magic.Magic(mime=True)
-        file_mime = mime.from_file(file_path)
-        
-        if not file_mime.startswith('image/'):
-            return False
-        
-        # Tentar abrir com PIL
-        with Image.open(file_path) as img:
-            img.verify()
-        
-        return True
-    except Exception:
-        return False
-
 def generate_unique_filename(original_filename):
     """Gera um nome único para o arquivo"""
     ext = original_filename.rsplit('.', 1)[1].lower() if '.' in original_filename else ''
@@ -58,24 +51,151 @@ def create_upload_directory():
     os.makedirs(upload_dir, exist_ok=True)
     return upload_dir
 
-def resize_image(image_path, output_path, size):
-    """Redimensiona uma imagem mantendo a proporção"""
+def variant_urls(filename):
+    """URLs das variantes geradas no upload local"""
+    return {
+        'original': f'/api/uploads/original_{filename}',
+        'medium': f'/api/uploads/medium_{filename}',
+        'thumbnail': f'/api/uploads/thumb_{filename}'
+    }
+
+def remove_local_files(filename):
+    """Remove o arquivo e as variantes (em todos os formatos) de um upload local"""
+    upload_dir = os.path.join(current_app.root_path, 'static', 'uploads')
+    files_to_remove = [os.path.join(upload_dir, filename)]
+    for name, _ in LOCAL_VARIANTS:
+        files_to_remove.append(os.path.join(upload_dir, f"{name}_{filename}"))
+        files_to_remove.extend(
+            os.path.join(upload_dir, f"{name}_{filename}.{extension}") for extension in ALTERNATE_EXTENSIONS
+        )
+    
+    for file_path in files_to_remove:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+    
+    # Variantes sob demanda pedidas sobre o upload ou sobre uma das variantes gravadas
+    cache = get_variant_cache(current_app.config)
+    cache.discard(filename)
+    for name, _ in LOCAL_VARIANTS:
+        cache.discard(f"{name}_{filename}")
+
+def save_local_image(vehicle, source, filename, original_filename, file_size, mime_type):
+    """
+    Registra um upload local na sessão (sem commit)
+    Conteúdo já enviado antes (mesmo hash) reaproveita as variantes existentes
+    em vez de decodificar e gravar tudo de novo
+    source: arquivo binário aberto; InvalidImageError se não for uma imagem
+    Retorna (VehicleImage, criada) - criada é False se o veículo já tem a imagem
+    """
+    content_hash = hash_content(source)
+    
+    duplicate = find_vehicle_duplicate(vehicle.id, content_hash)
+    if duplicate:
+        return duplicate, False
+    
+    upload_dir = create_upload_directory()
+    image_order = len(vehicle.vehicle_images)
+    
+    # A origem fica travada até o commit: uma remoção concorrente não apaga
+    # as variantes por baixo da cópia
+    existing = find_local_source(content_hash, upload_dir)
+    if existing and claim_local_source(existing, upload_dir):
+        vehicle_image = clone_image(existing, vehicle.id, original_filename, image_order)
+    else:
+        process_image(source.read(), upload_dir, filename)
+        vehicle_image = VehicleImage(
+            vehicle_id=vehicle.id,
+            filename=filename,
+            original_filename=original_filename,
+            file_path=f"uploads/{filename}",
+            file_size=file_size,
+            mime_type=mime_type,
+            image_order=image_order,
+            content_hash=content_hash
+        )
+    
+    db.session.add(vehicle_image)
+    vehicle.add_imagem(vehicle_image.filename)
+    return vehicle_image, True
+
+# ==================== UPLOAD ASSÍNCRONO ====================
+
+def is_async_request():
+    """Modo assíncrono pedido com ?async=1 (ou campo async no formulário)"""
+    value = request.args.get('async') or request.form.get('async') or ''
+    return value.lower() in ('1', 'true', 'sim')
+
+def spool_upload(file):
+    """Grava o arquivo recebido no spool (lido depois pela tarefa) e retorna o caminho"""
+    spool_dir = current_app.config['UPLOAD_SPOOL_DIR']
+    os.makedirs(spool_dir, exist_ok=True)
+    spool_path = os.path.join(spool_dir, f"{uuid.uuid4().hex}.upload")
+    file.save(spool_path)
+    return spool_path
+
+def open_spooled_file(payload):
+    """Abre o arquivo do spool da tarefa (falha definitiva se ele sumiu)"""
     try:
-        with Image.open(image_path) as img:
-            # Converter para RGB se necessário
-            if img.mode in ('RGBA', 'LA', 'P'):
-                img = img.convert('RGB')
-            
-            # Redimensionar mantendo proporção
-            img.thumbnail(size, Image.Resampling.LANCZOS)
-            
-            # Salvar com qualidade otimizada
-            img.save(output_path, 'JPEG', quality=85, optimize=True)
-        
-        return True
-    except Exception as e:
-        print(f"Erro ao redimensionar imagem: {e}")
-        return False
+        return open(payload['spool_path'], 'rb')
+    except FileNotFoundError:
+        raise JobFailed('Arquivo do upload não encontrado no spool')
+
+def read_spooled_file(payload):
+    with open_spooled_file(payload) as spooled:
+        return spooled.read()
+
+def remove_spooled_file(payload, error=None):
+    """Remove o arquivo do spool (após sucesso ou falha definitiva da tarefa)"""
+    spool_path = payload.get('spool_path')
+    if spool_path and os.path.exists(spool_path):
+        os.remove(spool_path)
+
+def accepted_job_response(job_id):
+    """Resposta 202 com o endereço de acompanhamento da tarefa"""
+    status_url = f'/api/uploads/jobs/{job_id}'
+    response = jsonify({
+        'message': 'Imagem recebida; processamento em andamento',
+        'job_id': job_id,
+        'status_url': status_url
+    })
+    response.headers['Location'] = status_url
+    return response, 202
+
+def process_upload_job(payload, progress):
+    """Tarefa do upload local assíncrono: gera as variantes e registra a imagem"""
+    vehicle = Vehicle.query.get(payload['vehicle_id'])
+    if not vehicle:
+        raise JobFailed('Veículo não encontrado')
+
+    filename = payload['filename']
+
+    # Nova tentativa depois de um commit bem-sucedido: a imagem já existe
+    vehicle_image = VehicleImage.query.filter_by(vehicle_id=vehicle.id, filename=filename).first()
+
+    if vehicle_image is None:
+        progress(20, 'Gerando variantes')
+        try:
+            with open_spooled_file(payload) as spooled:
+                vehicle_image, created = save_local_image(
+                    vehicle, spooled, filename, payload['original_filename'],
+                    payload['file_size'], payload['mime_type']
+                )
+        except InvalidImageError:
+            raise JobFailed('Arquivo não é uma imagem válida')
+
+        if created:
+            progress(80, 'Salvando imagem')
+            db.session.commit()
+            invalidate_vehicle_cache(vehicle.id)
+
+    remove_spooled_file(payload)
+
+    return {
+        'image': vehicle_image.to_dict(),
+        'urls': variant_urls(vehicle_image.filename)
+    }
+
+register_job_handler('upload', process_upload_job, on_failure=remove_spooled_file)
 
 @uploads_bp.route('/upload', methods=['POST'])
 @require_admin()
@@ -115,83 +235,73 @@ def upload_file():
         if file_size > MAX_FILE_SIZE:
             return jsonify({'error': 'Arquivo muito grande (máximo 5MB)'}), 400
         
-        # Criar diretório de uploads
-        upload_dir = create_upload_directory()
-        
         # Gerar nome único para o arquivo
         filename = generate_unique_filename(file.filename)
-        file_path = os.path.join(upload_dir, filename)
-        
-        # Salvar arquivo temporariamente
-        file.save(file_path)
         
-        # Validar se é realmente uma imagem
-        if not validate_image(file_path):
-            os.remove(file_path)
-            return jsonify({'error': 'Arquivo não é uma imagem válida'}), 400
-        
-        # Criar versões redimensionadas
-        versions_created = []
+        # Modo assíncrono: grava no spool e processa em segundo plano
+        if is_async_request():
+            job_id = enqueue_job('upload', {
+                'vehicle_id': vehicle.id,
+                'spool_path': spool_upload(file),
+                'filename': filename,
+                'original_filename': secure_filename(file.filename),
+                'file_size': file_size,
+                'mime_type': file.content_type
+            }, current_app.config.get('JOB_MAX_ATTEMPTS'))
+            return accepted_job_response(job_id)
+        
+        # Validar e criar as versões redimensionadas com uma única decodificação
+        # (o arquivo enviado não é gravado em disco); conteúdo repetido
+        # reaproveita as variantes já geradas
         try:
-            # Versão original otimizada
-            original_path = os.path.join(upload_dir, f"original_{filename}")
-            if resize_image(file_path, original_path, (1920, 1080)):
-                versions_created.append(original_path)
-            
-            # Versão média
-            medium_path = os.path.join(upload_dir, f"medium_{filename}")
-            if resize_image(file_path, medium_path, IMAGE_SIZES['medium']):
-                versions_created.append(medium_path)
-            
-            # Versão thumbnail
-            thumb_path = os.path.join(upload_dir, f"thumb_{filename}")
-            if resize_image(file_path, thumb_path, IMAGE_SIZES['thumbnail']):
-                versions_created.append(thumb_path)
-            
+            vehicle_image, created = save_local_image(
+                vehicle, file.stream, filename, secure_filename(file.filename),
+                file_size, file.content_type
+            )
+        except InvalidImageError:
+            return jsonify({'error': 'Arquivo não é uma imagem válida'}), 400
         except Exception as e:
-            # Limpar arquivos criados em caso de erro
-            for version_path in versions_created:
-                if os.path.exists(version_path):
-                    os.remove(version_path)
-            if os.path.exists(file_path):
-                os.remove(file_path)
+            current_app.logger.error(f"Erro ao processar imagem: {e}")
             return jsonify({'error': 'Erro ao processar imagem'}), 500
         
-        # Remover arquivo temporário original
-        if os.path.exists(file_path):
-            os.remove(file_path)
-        
-        # Salvar metadados no banco
-        vehicle_image = VehicleImage(
-            vehicle_id=vehicle_id,
-            filename=filename,
-            original_filename=secure_filename(file.filename),
-            file_path=f"uploads/{filename}",
-            file_size=file_size,
-            mime_type=file.content_type,
-            image_order=len(vehicle.vehicle_images)
-        )
-        
-        db.session.add(vehicle_image)
-        
-        # Adicionar imagem à lista do veículo
-        vehicle.add_imagem(filename)
+        if not created:
+            return jsonify({
+                'message': 'Imagem já cadastrada para este veículo',
+                'image': vehicle_image.to_dict(),
+                'urls': variant_urls(vehicle_image.filename)
+            }), 200
         
         db.session.commit()
         
+        invalidate_vehicle_cache(vehicle.id)
+        
         return jsonify({
             'message': 'Imagem enviada com sucesso',
             'image': vehicle_image.to_dict(),
-            'urls': {
-                'original': f'/api/uploads/original_{filename}',
-                'medium': f'/api/uploads/medium_{filename}',
-                'thumbnail': f'/api/uploads/thumb_{filename}'
-            }
+            'urls': variant_urls(vehicle_image.filename)
         }), 201
         
     except Exception as e:
         return jsonify({'error': 'Erro interno do servidor'}), 500
 
+@uploads_bp.route('/uploads/jobs/<job_id>', methods=['GET'])
+@require_admin()
+def get_upload_job(job_id):
+    """
+    Estado de uma tarefa de upload assíncrono (progresso, tentativas e resultado)
+    Requer autenticação de administrador
+    """
+    try:
+        job = get_job_queue().get(job_id)
+        if not job:
+            return jsonify({'error': 'Tarefa não encontrada'}), 404
+        
+        return jsonify({'job': job}), 200
+        
+    except Exception as e:
+        current_app.logger.error(f"Erro em get_upload_job: {e}")
+        return jsonify({'error': 'Erro interno do servidor'}), 500
+
 @uploads_bp.route('/uploads/<filename>')
 def uploaded_file(filename):
     """
@@ -200,10 +310,116 @@ def uploaded_file(filename):
     """
     try:
         upload_dir = os.path.join(current_app.root_path, 'static', 'uploads')
-        return send_from_directory(upload_dir, filename)
+        
+        if any(name in request.args for name in VARIANT_PARAMS):
+            return serve_variant(upload_dir, filename)
+        
+        return serve_negotiated(upload_dir, filename)
     except Exception as e:
         return jsonify({'error': 'Arquivo não encontrado'}), 404
 
+def serve_negotiated(upload_dir, filename):
+    """
+    Serve o arquivo pedido; variantes JPEG dão lugar à versão AVIF/WebP
+    quando o navegador a aceita (Vary: Accept para os caches intermediários)
+    <variante>.webp/.avif de uploads anteriores aos formatos modernos é
+    convertido na primeira requisição e guardado no cache de variantes
+    """
+    base, extension = os.path.splitext(filename)
+    requested_format = extension[1:].lower()
+    if requested_format in MODERN_FORMATS and not os.path.isfile(os.path.join(upload_dir, filename)):
+        return serve_converted(upload_dir, base, requested_format)
+    
+    available = [
+        fmt for fmt in MODERN_FORMATS
+        if os.path.isfile(os.path.join(upload_dir, alternate_filename(filename, fmt)))
+    ]
+    if not available:
+        if requested_format in MODERN_FORMATS:
+            return send_from_directory(upload_dir, filename, mimetype=OUTPUT_FORMATS[requested_format][1])
+        return send_from_directory(upload_dir, filename)
+    
+    fmt = negotiate_format(request.accept_mimetypes, available)
+    if fmt == 'jpeg':
+        response = send_from_directory(upload_dir, filename)
+    else:
+        response = send_from_directory(upload_dir, alternate_filename(filename, fmt), mimetype=OUTPUT_FORMATS[fmt][1])
+    response.vary.add('Accept')
+    return response
+
+def serve_converted(upload_dir, variant_filename, fmt):
+    """Versão em formato moderno de uma variante gravada só em JPEG"""
+    if variant_filename != secure_filename(variant_filename):
+        return jsonify({'error': 'Arquivo não encontrado'}), 404
+    
+    # Apenas variantes do upload (<prefixo>_<filename>), guardadas no diretório da imagem
+    source = next((
+        (name, variant_filename[len(name) + 1:]) for name, _ in LOCAL_VARIANTS
+        if variant_filename.startswith(f"{name}_")
+    ), None)
+    source_path = os.path.join(upload_dir, variant_filename)
+    if source is None or not os.path.isfile(source_path):
+        return jsonify({'error': 'Arquivo não encontrado'}), 404
+    
+    name, filename = source
+    key = f"{filename}/{name}.{OUTPUT_FORMATS[fmt][2]}"
+    return send_cached_variant(key, lambda: convert_image(source_path, fmt), fmt)
+
+def serve_variant(upload_dir, filename):
+    """
+    Variante redimensionada sob demanda (tamanhos da lista IMAGE_VARIANT_SIZES)
+    Gerada a partir da maior variante do upload e servida do cache em disco
+    """
+    try:
+        width, height, fit, fmt = parse_variant_args(request.args, get_allowed_sizes(current_app.config))
+    except InvalidVariantError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if filename != secure_filename(filename):
+        return jsonify({'error': 'Arquivo não encontrado'}), 404
+    
+    # original_ é a maior variante gravada no upload; arquivos avulsos servem de origem direta
+    source_path = next((
+        path for path in (os.path.join(upload_dir, f"original_{filename}"), os.path.join(upload_dir, filename))
+        if os.path.isfile(path)
+    ), None)
+    if source_path is None:
+        return jsonify({'error': 'Arquivo não encontrado'}), 404
+    
+    # Sem fmt: formato escolhido pelo Accept, e a resposta varia com ele
+    negotiated = fmt is None
+    if negotiated:
+        fmt = negotiate_format(request.accept_mimetypes)
+    
+    key = variant_key(filename, width, height, fit, fmt)
+    return send_cached_variant(
+        key, lambda: render_variant(source_path, width, height, fit, fmt), fmt, vary_accept=negotiated
+    )
+
+def send_cached_variant(key, render, fmt, vary_accept=False):
+    """
+    Envia a variante do cache em disco (gerando-a com render() na primeira vez)
+    vary_accept: formato negociado pelo Accept (Vary: Accept na resposta)
+    """
+    cache = get_variant_cache(current_app.config)
+    mimetype = OUTPUT_FORMATS[fmt][1]
+    
+    try:
+        try:
+            path = cache.get(key, render)
+            response = send_file(path, mimetype=mimetype, conditional=True, max_age=VARIANT_MAX_AGE)
+        except FileNotFoundError:
+            # Descartada por outro processo entre a consulta e o envio: gerar de novo
+            cache.forget(key)
+            path = cache.get(key, render)
+            response = send_file(path, mimetype=mimetype, conditional=True, max_age=VARIANT_MAX_AGE)
+    except InvalidImageError:
+        return jsonify({'error': 'Arquivo não é uma imagem válida'}), 400
+    
+    if vary_accept:
+        response.vary.add('Accept')
+    return response
+
 @uploads_bp.route('/uploads/<int:vehicle_id>/images', methods=['GET'])
 def get_vehicle_images(vehicle_id):
     """
@@ -236,28 +452,27 @@ def delete_image(image_id):
         if not image:
             return jsonify({'error': 'Imagem não encontrada'}), 404
         
-        # Remover arquivos físicos
-        upload_dir = os.path.join(current_app.root_path, 'static', 'uploads')
-        files_to_remove = [
-            os.path.join(upload_dir, image.filename),
-            os.path.join(upload_dir, f"original_{image.filename}"),
-            os.path.join(upload_dir, f"medium_{image.filename}"),
-            os.path.join(upload_dir, f"thumb_{image.filename}")
-        ]
-        
-        for file_path in files_to_remove:
-            if os.path.exists(file_path):
-                os.remove(file_path)
-        
         # Remover da lista do veículo
-        vehicle = Vehicle.query.get(image.vehicle_id)
+        filename = image.filename
+        vehicle_id = image.vehicle_id
+        vehicle = Vehicle.query.get(vehicle_id)
         if vehicle:
-            vehicle.remove_imagem(image.filename)
+            vehicle.remove_imagem(filename)
         
-        # Remover do banco
+        # Remover do banco; as referências restantes são contadas na mesma
+        # transação (um reaproveitamento em andamento trava a origem e é visto aqui)
         db.session.delete(image)
+        db.session.flush()
+        remaining = local_references(filename)
         db.session.commit()
         
+        # Remover arquivos físicos só quando nenhuma outra imagem (upload
+        # deduplicado) usa as mesmas variantes
+        if remaining == 0:
+            remove_local_files(filename)
+        
+        invalidate_vehicle_cache(vehicle_id)
+        
         return jsonify({'message': 'Imagem removida com sucesso'}), 200
         
     except Exception as e:
@@ -287,8 +502,13 @@ def reorder_images(vehicle_id):
             if image:
                 image.image_order = index
         
+        # A ordem muda a imagem principal: o feed incremental acompanha updated_at
+        vehicle.updated_at = datetime.utcnow()
+        
         db.session.commit()
         
+        invalidate_vehicle_cache(vehicle_id)
+        
         return jsonify({'message': 'Ordem das imagens atualizada com sucesso'}), 200
         
     except Exception as e:
@@ -320,48 +540,75 @@ def bulk_upload():
         uploaded_images = []
         errors = []
         
+        duplicates = []
+        
+        # Validação rápida no próprio request; o processamento pesado vai para o pool
+        upload_dir = create_upload_directory()
+        accepted = []
+        jobs = []
+        batch_hashes = set()
+        
         for file in files:
-            try:
-                if file.filename == '':
-                    continue
-                
-                if not allowed_file(file.filename):
-                    errors.append(f'{file.filename}: Tipo de arquivo não permitido')
-                    continue
-                
-                # Verificar tamanho
-                file.seek(0, os.SEEK_END)
-                file_size = file.tell()
-                file.seek(0)
-                
-                if file_size > MAX_FILE_SIZE:
-                    errors.append(f'{file.filename}: Arquivo muito grande')
-                    continue
-                
-                # Processar upload (código similar ao upload simples)
-                upload_dir = create_upload_directory()
-                filename = generate_unique_filename(file.filename)
-                file_path = os.path.join(upload_dir, filename)
-                
-                file.save(file_path)
-                
-                if not validate_image(file_path):
-                    os.remove(file_path)
+            if file.filename == '':
+                continue
+            
+            if not allowed_file(file.filename):
+                errors.append(f'{file.filename}: Tipo de arquivo não permitido')
+                continue
+            
+            # Verificar tamanho
+            file.seek(0, os.SEEK_END)
+            file_size = file.tell()
+            file.seek(0)
+            
+            if file_size > MAX_FILE_SIZE:
+                errors.append(f'{file.filename}: Arquivo muito grande')
+                continue
+            
+            # Conteúdo repetido: no próprio veículo é ignorado; de outro
+            # veículo, as variantes existentes são reaproveitadas
+            content_hash = hash_content(file.stream)
+            
+            if content_hash in batch_hashes:
+                errors.append(f'{file.filename}: Imagem repetida no envio')
+                continue
+            batch_hashes.add(content_hash)
+            
+            duplicate = find_vehicle_duplicate(vehicle.id, content_hash)
+            if duplicate:
+                duplicates.append(duplicate.to_dict())
+                continue
+            
+            source = find_local_source(content_hash, upload_dir)
+            filename = generate_unique_filename(file.filename)
+            accepted.append((file, filename, file_size, content_hash, source))
+            if source is None:
+                jobs.append((file.read(), filename))
+        
+        # Resultados voltam na ordem de envio, preservando a ordem das imagens
+        results = iter(process_images(jobs, upload_dir, current_app.config.get('UPLOAD_PROCESS_POOL_SIZE', 1)))
+        
+        for file, filename, file_size, content_hash, source in accepted:
+            image_order = len(vehicle.vehicle_images) + len(uploaded_images)
+            
+            # Origem travada até o commit; se foi removida nesse meio tempo,
+            # as variantes são geradas a partir do próprio arquivo
+            if source is not None and claim_local_source(source, upload_dir):
+                vehicle_image = clone_image(source, vehicle.id, secure_filename(file.filename), image_order)
+            else:
+                if source is None:
+                    result = next(results)
+                else:
+                    file.seek(0)
+                    result = run_job(file.read(), upload_dir, filename)
+                if isinstance(result, InvalidImageError):
                     errors.append(f'{file.filename}: Não é uma imagem válida')
                     continue
+                if isinstance(result, Exception):
+                    current_app.logger.error(f"Erro ao processar {file.filename}: {result}")
+                    errors.append(f'{file.filename}: Erro ao processar')
+                    continue
                 
-                # Criar versões redimensionadas
-                original_path = os.path.join(upload_dir, f"original_{filename}")
-                medium_path = os.path.join(upload_dir, f"medium_{filename}")
-                thumb_path = os.path.join(upload_dir, f"thumb_{filename}")
-                
-                resize_image(file_path, original_path, (1920, 1080))
-                resize_image(file_path, medium_path, IMAGE_SIZES['medium'])
-                resize_image(file_path, thumb_path, IMAGE_SIZES['thumbnail'])
-                
-                os.remove(file_path)
-                
-                # Salvar no banco
                 vehicle_image = VehicleImage(
                     vehicle_id=vehicle_id,
                     filename=filename,
@@ -369,24 +616,32 @@ def bulk_upload():
                     file_path=f"uploads/{filename}",
                     file_size=file_size,
                     mime_type=file.content_type,
-                    image_order=len(vehicle.vehicle_images) + len(uploaded_images)
+                    image_order=image_order,
+                    content_hash=content_hash
                 )
-                
-                db.session.add(vehicle_image)
-                vehicle.add_imagem(filename)
-                
-                uploaded_images.append(vehicle_image.to_dict())
-                
-            except Exception as e:
-                errors.append(f'{file.filename}: Erro ao processar')
+            
+            # Salvar no banco
+            db.session.add(vehicle_image)
+            vehicle.add_imagem(vehicle_image.filename)
+            
+            uploaded_images.append(vehicle_image.to_dict())
         
         db.session.commit()
         
+        if uploaded_images:
+            invalidate_vehicle_cache(vehicle.id)
+        
+        if uploaded_images:
+            status = 201
+        else:
+            status = 200 if duplicates else 400
+        
         return jsonify({
             'message': f'{len(uploaded_images)} imagens enviadas com sucesso',
             'uploaded_images': uploaded_images,
+            'duplicates': duplicates,
             'errors': errors
-        }), 201 if uploaded_images else 400
+        }), status
         
     except Exception as e:
         return jsonify({'error': 'Erro interno do servidor'}), 500
@@ -1,12 +1,20 @@
 """
 API REST para gerenciamento de veículos com sistema de cache
 """
-from flask import Blueprint, request, jsonify, current_app
+import base64
+import csv
+import hashlib
+import io
+import json
+from datetime import datetime, timedelta
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
-from marshmallow import Schema, fields, ValidationError, validate
-from sqlalchemy import or_, and_
-from src.models.vehicle import Vehicle, VehicleImage
+from marshmallow import ValidationError
+from sqlalchemy import or_, and_, select, update, func
+from sqlalchemy.orm import selectinload
+from src.models.vehicle import Vehicle, VehicleImage, VehicleStats
 from src.models.user import db
+from src.schemas import VehicleSchema
 from src.routes.auth import require_admin
 from src.cache_manager import (
     cache_active_vehicles, 
@@ -14,35 +22,168 @@ from src.cache_manager import (
     cache_vehicles_by_category,
     cache_vehicles_search,
     invalidate_vehicle_cache,
+    get_cached_vehicles,
+    set_cached_vehicles,
     add_cache_headers
 )
+from src.view_counters import track_vehicle_view, record_whatsapp_click
+from src.saved_searches import queue_saved_search_matches
+from src.similarity import SIMILAR_TOP_K, get_similarity_index
+from src.edge_cache import surrogate_keys_for_payload, add_surrogate_headers
+from src.event_stream import (
+    broker,
+    stream_events,
+    publish_vehicle_event,
+    vehicle_counter_snapshot,
+    dashboard_delta,
+    combine_dashboard_deltas
+)
 
 vehicles_bp = Blueprint('vehicles', __name__)
 
-class VehicleSchema(Schema):
-    """Schema para validação de dados de veículos"""
-    marca = fields.Str(required=True, validate=validate.Length(min=2, max=100))
-    modelo = fields.Str(required=True, validate=validate.Length(min=2, max=100))
-    ano = fields.Int(required=True, validate=validate.Range(min=1900, max=2030))
-    preco = fields.Float(required=False, allow_none=True, validate=validate.Range(min=0, max=10000000))
-    sob_consulta = fields.Bool(load_default=False)
-    descricao = fields.Str(validate=validate.Length(max=2000))
-    combustivel = fields.Str(validate=validate.OneOf([
-        'Gasolina', 'Etanol', 'Flex', 'Diesel', 'Elétrico', 'Híbrido'
-    ]))
-    cambio = fields.Str(validate=validate.OneOf([
-        'Manual', 'Automático', 'CVT', 'Automatizada'
-    ]))
-    cor = fields.Str(validate=validate.Length(max=50))
-    quilometragem = fields.Int(validate=validate.Range(min=0, max=1000000))
-    categoria = fields.Str(validate=validate.OneOf([
-        'Hatch', 'Sedan', 'SUV', 'Picape', 'Conversível', 'Wagon', 'Coupé'
-    ]))
-    whatsapp_link = fields.Str(validate=validate.Length(max=500))
-    imagens = fields.List(fields.Str())
+# Limite de IDs por requisição no endpoint de busca em lote
+MAX_BATCH_IDS = 50
+
+# Feed de alterações: tamanho das páginas e janela de acomodação
+# (alterações mais recentes que a janela ficam para a próxima consulta,
+# evitando perder transações que ainda não foram confirmadas)
+CHANGES_DEFAULT_LIMIT = 100
+CHANGES_MAX_LIMIT = 500
+CHANGES_SETTLE_SECONDS = 2
+
+# Operações administrativas em massa
+BULK_MAX_OPERATIONS = 50
+BULK_ACTIONS = ('activate', 'deactivate', 'patch', 'price_adjust')
+BULK_PRICE_ADJUST_RANGE = (-90, 500)  # Percentual permitido
+
+# Exportação do catálogo: linhas lidas do cursor (e enviadas) por lote
+EXPORT_CHUNK_SIZE = 500
+EXPORT_FIELDS = [
+    'id', 'marca', 'modelo', 'ano', 'preco', 'sob_consulta', 'descricao',
+    'combustivel', 'cambio', 'cor', 'quilometragem', 'categoria',
+    'whatsapp_link', 'imagens', 'is_active', 'created_at', 'updated_at'
+]
+
+def vehicle_etag(vehicle_id, updated_at):
+    """
+    ETag da versão de um veículo (id + updated_at)
+    updated_at pode ser datetime ou a string ISO de to_dict()
+    """
+    if hasattr(updated_at, 'isoformat'):
+        updated_at = updated_at.isoformat()
+    return hashlib.md5(f"{vehicle_id}:{updated_at}".encode('utf-8')).hexdigest()
+
+def include_requested(name, args=None):
+    """Verifica se um recurso relacionado foi solicitado em ?include=a,b"""
+    if args is None:
+        args = request.args
+    includes = args.get('include', '')
+    return name in [part.strip() for part in includes.split(',')]
 
 # ==================== ROTAS PÚBLICAS COM CACHE ====================
 
+def build_vehicles_listing(args):
+    """
+    Monta a listagem paginada de veículos ativos a partir dos parâmetros
+    (request.args ou MultiDict equivalente)
+    Compartilhada entre get_vehicles e o documento de bootstrap
+    """
+    # Parâmetros de filtro
+    marca = args.get('marca')
+    modelo = args.get('modelo')
+    ano_min = args.get('ano_min', type=int)
+    ano_max = args.get('ano_max', type=int)
+    preco_min = args.get('preco_min', type=float)
+    preco_max = args.get('preco_max', type=float)
+    combustivel = args.get('combustivel')
+    categoria = args.get('categoria')
+    search = args.get('search')
+    
+    # Parâmetros de paginação
+    page = args.get('page', 1, type=int)
+    per_page = min(args.get('per_page', 12, type=int), 50)  # Máximo 50 por página
+    
+    # Imagem principal embutida na listagem (?include=images)
+    with_images = include_requested('images', args)
+    
+    # Query base - apenas veículos ativos
+    query = Vehicle.query.filter_by(is_active=True)
+    
+    if with_images:
+        # Carrega as imagens de toda a página em uma única consulta IN
+        query = query.options(selectinload(Vehicle.vehicle_images))
+    
+    # Aplicar filtros
+    if marca:
+        query = query.filter(Vehicle.marca.ilike(f'%{marca}%'))
+    if modelo:
+        query = query.filter(Vehicle.modelo.ilike(f'%{modelo}%'))
+    if ano_min:
+        query = query.filter(Vehicle.ano >= ano_min)
+    if ano_max:
+        query = query.filter(Vehicle.ano <= ano_max)
+    if preco_min:
+        query = query.filter(Vehicle.preco >= preco_min)
+    if preco_max:
+        query = query.filter(Vehicle.preco <= preco_max)
+    if combustivel:
+        query = query.filter(Vehicle.combustivel == combustivel)
+    if categoria:
+        query = query.filter(Vehicle.categoria == categoria)
+    if search:
+        search_filter = or_(
+            Vehicle.marca.ilike(f'%{search}%'),
+            Vehicle.modelo.ilike(f'%{search}%'),
+            Vehicle.descricao.ilike(f'%{search}%')
+        )
+        query = query.filter(search_filter)
+    
+    # Ordenação
+    sort_by = args.get('sort_by', 'created_at')
+    sort_order = args.get('sort_order', 'desc')
+    
+    if sort_by == 'popularity':
+        # Mais vistos primeiro (vehicles.views, servido pelo índice (views, created_at))
+        if sort_order == 'asc':
+            query = query.order_by(Vehicle.views.asc(), Vehicle.created_at.asc())
+        else:
+            query = query.order_by(Vehicle.views.desc(), Vehicle.created_at.desc())
+    elif hasattr(Vehicle, sort_by):
+        if sort_order == 'asc':
+            query = query.order_by(getattr(Vehicle, sort_by).asc())
+        else:
+            query = query.order_by(getattr(Vehicle, sort_by).desc())
+    
+    # Paginação
+    pagination = query.paginate(
+        page=page, 
+        per_page=per_page, 
+        error_out=False
+    )
+    
+    vehicles = [
+        vehicle.to_dict(include_primary_image=with_images)
+        for vehicle in pagination.items
+    ]
+    
+    result = {
+        'vehicles': vehicles,
+        'pagination': {
+            'page': page,
+            'per_page': per_page,
+            'total': pagination.total,
+            'pages': pagination.pages,
+            'has_next': pagination.has_next,
+            'has_prev': pagination.has_prev
+        },
+        'cache_info': {
+            'cached': True,
+            'cache_timeout': 3600
+        }
+    }
+    
+    return result
+
 @vehicles_bp.route('/vehicles', methods=['GET'])
 @cache_active_vehicles(timeout=3600)  # Cache por 1 hora
 def get_vehicles():
@@ -51,107 +192,98 @@ def get_vehicles():
     Endpoint público para o frontend - COM CACHE
     """
     try:
-        # Parâmetros de filtro
-        marca = request.args.get('marca')
-        modelo = request.args.get('modelo')
-        ano_min = request.args.get('ano_min', type=int)
-        ano_max = request.args.get('ano_max', type=int)
-        preco_min = request.args.get('preco_min', type=float)
-        preco_max = request.args.get('preco_max', type=float)
-        combustivel = request.args.get('combustivel')
-        categoria = request.args.get('categoria')
-        search = request.args.get('search')
-        
-        # Parâmetros de paginação
-        page = request.args.get('page', 1, type=int)
-        per_page = min(request.args.get('per_page', 12, type=int), 50)  # Máximo 50 por página
-        
-        # Query base - apenas veículos ativos
-        query = Vehicle.query.filter_by(is_active=True)
-        
-        # Aplicar filtros
-        if marca:
-            query = query.filter(Vehicle.marca.ilike(f'%{marca}%'))
-        if modelo:
-            query = query.filter(Vehicle.modelo.ilike(f'%{modelo}%'))
-        if ano_min:
-            query = query.filter(Vehicle.ano >= ano_min)
-        if ano_max:
-            query = query.filter(Vehicle.ano <= ano_max)
-        if preco_min:
-            query = query.filter(Vehicle.preco >= preco_min)
-        if preco_max:
-            query = query.filter(Vehicle.preco <= preco_max)
-        if combustivel:
-            query = query.filter(Vehicle.combustivel == combustivel)
-        if categoria:
-            query = query.filter(Vehicle.categoria == categoria)
-        if search:
-            search_filter = or_(
-                Vehicle.marca.ilike(f'%{search}%'),
-                Vehicle.modelo.ilike(f'%{search}%'),
-                Vehicle.descricao.ilike(f'%{search}%')
-            )
-            query = query.filter(search_filter)
+        return jsonify(build_vehicles_listing(request.args)), 200
+        
+    except Exception as e:
+        current_app.logger.error(f"Erro em get_vehicles: {e}")
+        return jsonify({'error': 'Erro interno do servidor'}), 500
+
+@vehicles_bp.route('/vehicles/<int:vehicle_id>', methods=['GET'])
+@track_vehicle_view  # Conta também as respostas vindas do cache
+@cache_vehicle_detail(timeout=7200)  # Cache por 2 horas
+def get_vehicle(vehicle_id):
+    """
+    Retorna detalhes de um veículo específico
+    Endpoint público para visualização de detalhes - COM CACHE
+    Com ?include=images embute os metadados das imagens (VehicleImage)
+    """
+    try:
+        with_images = include_requested('images')
         
-        # Ordenação
-        sort_by = request.args.get('sort_by', 'created_at')
-        sort_order = request.args.get('sort_order', 'desc')
+        query = Vehicle.query.filter_by(id=vehicle_id, is_active=True)
         
-        if hasattr(Vehicle, sort_by):
-            if sort_order == 'asc':
-                query = query.order_by(getattr(Vehicle, sort_by).asc())
-            else:
-                query = query.order_by(getattr(Vehicle, sort_by).desc())
+        if with_images:
+            # Imagens carregadas já ordenadas por image_order
+            query = query.options(selectinload(Vehicle.vehicle_images))
         
-        # Paginação
-        pagination = query.paginate(
-            page=page, 
-            per_page=per_page, 
-            error_out=False
-        )
+        vehicle = query.first()
         
-        vehicles = [vehicle.to_dict() for vehicle in pagination.items]
+        if not vehicle:
+            return jsonify({'error': 'Veículo não encontrado'}), 404
+        
+        vehicle_data = vehicle.to_dict(include_images=with_images)
+        
+        # Compartilhar os dados com o endpoint de busca em lote
+        if not with_images:
+            set_cached_vehicles({vehicle.id: vehicle_data})
         
         result = {
-            'vehicles': vehicles,
-            'pagination': {
-                'page': page,
-                'per_page': per_page,
-                'total': pagination.total,
-                'pages': pagination.pages,
-                'has_next': pagination.has_next,
-                'has_prev': pagination.has_prev
-            },
+            'vehicle': vehicle_data,
             'cache_info': {
                 'cached': True,
-                'cache_timeout': 3600
+                'cache_timeout': 7200
             }
         }
         
         return jsonify(result), 200
         
     except Exception as e:
-        current_app.logger.error(f"Erro em get_vehicles: {e}")
+        current_app.logger.error(f"Erro em get_vehicle: {e}")
         return jsonify({'error': 'Erro interno do servidor'}), 500
 
-@vehicles_bp.route('/vehicles/<int:vehicle_id>', methods=['GET'])
-@cache_vehicle_detail(timeout=7200)  # Cache por 2 horas
-def get_vehicle(vehicle_id):
+@vehicles_bp.route('/vehicles/<int:vehicle_id>/whatsapp-click', methods=['POST'])
+def track_whatsapp_click(vehicle_id):
     """
-    Retorna detalhes de um veículo específico
-    Endpoint público para visualização de detalhes - COM CACHE
+    Registra um clique no link do WhatsApp do veículo
+    Endpoint público (beacon) - apenas incrementa o contador em memória
+    """
+    record_whatsapp_click(vehicle_id)
+    return '', 204
+
+@vehicles_bp.route('/vehicles/<int:vehicle_id>/similar', methods=['GET'])
+def get_similar_vehicles(vehicle_id):
+    """
+    Retorna os veículos ativos mais semelhantes (?limit=, máximo SIMILAR_TOP_K)
+    Endpoint público - vizinhos pré-calculados no índice de semelhança
+    e dados dos veículos resolvidos pelo cache por veículo
     """
     try:
-        vehicle = Vehicle.query.filter_by(id=vehicle_id, is_active=True).first()
+        limit = max(1, min(request.args.get('limit', 6, type=int), SIMILAR_TOP_K))
         
-        if not vehicle:
+        similar_ids = get_similarity_index().similar_ids(vehicle_id, limit)
+        
+        if similar_ids is None:
             return jsonify({'error': 'Veículo não encontrado'}), 404
         
+        found = get_cached_vehicles(similar_ids)
+        missing_ids = [vid for vid in similar_ids if vid not in found]
+        
+        if missing_ids:
+            vehicles = Vehicle.query.filter(
+                Vehicle.id.in_(missing_ids),
+                Vehicle.is_active == True
+            ).all()
+            
+            fetched = {vehicle.id: vehicle.to_dict() for vehicle in vehicles}
+            set_cached_vehicles(fetched)
+            found.update(fetched)
+        
         result = {
-            'vehicle': vehicle.to_dict(),
+            'vehicle_id': str(vehicle_id),
+            'similar': [found[vid] for vid in similar_ids if vid in found],
             'cache_info': {
                 'cached': True,
+                'cache_hits': len(similar_ids) - len(missing_ids),
                 'cache_timeout': 7200
             }
         }
@@ -159,9 +291,181 @@ def get_vehicle(vehicle_id):
         return jsonify(result), 200
         
     except Exception as e:
-        current_app.logger.error(f"Erro em get_vehicle: {e}")
+        current_app.logger.error(f"Erro em get_similar_vehicles: {e}")
+        return jsonify({'error': 'Erro interno do servidor'}), 500
+
+@vehicles_bp.route('/vehicles/batch', methods=['GET'])
+def get_vehicles_batch():
+    """
+    Retorna vários veículos em uma única requisição (?ids=1,2,3)
+    Usado em comparações e listas de favoritos - COM CACHE POR VEÍCULO
+    Busca primeiro no cache e consulta o banco apenas para os que faltam
+    """
+    try:
+        raw_ids = request.args.get('ids', '')
+        
+        # Validar e remover duplicados mantendo a ordem solicitada
+        vehicle_ids = []
+        for part in raw_ids.split(','):
+            part = part.strip()
+            if not part:
+                continue
+            if not (part.isascii() and part.isdigit()):
+                return jsonify({'error': f'ID inválido: {part}'}), 400
+            vehicle_id = int(part)
+            if vehicle_id not in vehicle_ids:
+                vehicle_ids.append(vehicle_id)
+        
+        if not vehicle_ids:
+            return jsonify({'error': 'Informe os IDs dos veículos (ids=1,2,3)'}), 400
+        
+        if len(vehicle_ids) > MAX_BATCH_IDS:
+            return jsonify({'error': f'Máximo de {MAX_BATCH_IDS} veículos por requisição'}), 400
+        
+        # Resolver primeiro pelo cache
+        found = get_cached_vehicles(vehicle_ids)
+        missing_ids = [vid for vid in vehicle_ids if vid not in found]
+        
+        # Buscar apenas os que faltam com uma única consulta IN
+        if missing_ids:
+            vehicles = Vehicle.query.filter(
+                Vehicle.id.in_(missing_ids),
+                Vehicle.is_active == True
+            ).all()
+            
+            fetched = {vehicle.id: vehicle.to_dict() for vehicle in vehicles}
+            set_cached_vehicles(fetched)
+            found.update(fetched)
+        
+        result = {
+            'vehicles': [found.get(vid) for vid in vehicle_ids],
+            'not_found': [str(vid) for vid in vehicle_ids if vid not in found],
+            'cache_info': {
+                'cached': True,
+                'cache_hits': len(vehicle_ids) - len(missing_ids),
+                'cache_timeout': 7200
+            }
+        }
+        
+        return jsonify(result), 200
+        
+    except Exception as e:
+        current_app.logger.error(f"Erro em get_vehicles_batch: {e}")
+        return jsonify({'error': 'Erro interno do servidor'}), 500
+
+def encode_change_token(updated_at, vehicle_id):
+    """Gera o token opaco do feed de alterações a partir de (updated_at, id)"""
+    raw = f"{updated_at.isoformat()}|{vehicle_id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+def decode_change_token(token):
+    """Decodifica o token do feed; lança ValueError se for inválido"""
+    try:
+        raw = base64.urlsafe_b64decode(token.encode('ascii')).decode('utf-8')
+        updated_at, vehicle_id = raw.split('|')
+        return datetime.fromisoformat(updated_at), int(vehicle_id)
+    except Exception:
+        raise ValueError('Token inválido')
+
+@vehicles_bp.route('/vehicles/changes', methods=['GET'])
+def get_vehicle_changes():
+    """
+    Feed incremental de alterações para sincronização (?since=<token>)
+    Retorna veículos criados, atualizados, desativados ou restaurados desde o token
+    Ordenado por (updated_at, id) e servido pelo índice ix_vehicles_updated_at_id
+    Sem token, retorna o catálogo desde o início (sincronização inicial)
+    """
+    try:
+        since = request.args.get('since')
+        limit = max(1, min(request.args.get('limit', CHANGES_DEFAULT_LIMIT, type=int), CHANGES_MAX_LIMIT))
+        
+        query = Vehicle.query.filter(Vehicle.updated_at.isnot(None))
+        
+        since_updated_at = None
+        if since:
+            try:
+                since_updated_at, since_id = decode_change_token(since)
+            except ValueError:
+                return jsonify({'error': 'Token de sincronização inválido'}), 400
+            
+            query = query.filter(or_(
+                Vehicle.updated_at > since_updated_at,
+                and_(Vehicle.updated_at == since_updated_at, Vehicle.id > since_id)
+            ))
+        
+        settled_until = datetime.utcnow() - timedelta(seconds=CHANGES_SETTLE_SECONDS)
+        query = query.filter(Vehicle.updated_at <= settled_until)
+        
+        vehicles = query.order_by(
+            Vehicle.updated_at.asc(),
+            Vehicle.id.asc()
+        ).limit(limit + 1).all()
+        
+        has_more = len(vehicles) > limit
+        vehicles = vehicles[:limit]
+        
+        changes = []
+        for vehicle in vehicles:
+            if not vehicle.is_active:
+                # Veículos inativos não são públicos: apenas o marcador de remoção
+                changes.append({
+                    'id': str(vehicle.id),
+                    'change': 'deactivated',
+                    'updated_at': vehicle.updated_at.isoformat()
+                })
+                continue
+            
+            is_new = since_updated_at is None or (
+                vehicle.created_at is not None and vehicle.created_at > since_updated_at
+            )
+            changes.append({
+                'id': str(vehicle.id),
+                'change': 'created' if is_new else 'updated',
+                'updated_at': vehicle.updated_at.isoformat(),
+                'vehicle': vehicle.to_dict()
+            })
+        
+        # Sem alterações novas, o cliente continua a partir do mesmo token
+        next_token = since
+        if vehicles:
+            last = vehicles[-1]
+            next_token = encode_change_token(last.updated_at, last.id)
+        
+        response = jsonify({
+            'changes': changes,
+            'next_token': next_token,
+            'has_more': has_more
+        })
+        
+        # O feed não deve ser cacheado por proxies/navegadores
+        response.headers['Cache-Control'] = 'no-cache'
+        
+        return response, 200
+        
+    except Exception as e:
+        current_app.logger.error(f"Erro em get_vehicle_changes: {e}")
         return jsonify({'error': 'Erro interno do servidor'}), 500
 
+@vehicles_bp.route('/vehicles/stream', methods=['GET'])
+def stream_vehicle_events():
+    """
+    Stream SSE de alterações do catálogo (text/event-stream)
+    Eventos: vehicle.created, vehicle.updated, vehicle.deleted, vehicle.restored,
+    vehicle.bulk (operações em massa) e catalog.imported (importação)
+    Cada evento de veículo traz a variação dos contadores do dashboard (dashboard_delta)
+    Suporta retomada pelo cabeçalho Last-Event-ID
+    """
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    
+    return Response(
+        stream_events(last_event_id),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # Desativa buffering em proxies nginx
+        }
+    )
+
 @vehicles_bp.route('/vehicles/search', methods=['GET'])
 @cache_vehicles_search(timeout=1800)  # Cache por 30 minutos
 def search_vehicles():
@@ -203,6 +507,29 @@ def search_vehicles():
         current_app.logger.error(f"Erro em search_vehicles: {e}")
         return jsonify({'error': 'Erro interno do servidor'}), 500
 
+def build_categories():
+    """
+    Monta a contagem de veículos ativos por categoria
+    Compartilhada entre get_vehicles_by_category e o documento de bootstrap
+    """
+    categories = db.session.query(
+        Vehicle.categoria, 
+        db.func.count(Vehicle.id)
+    ).filter_by(is_active=True).group_by(Vehicle.categoria).all()
+    
+    return {
+        'categories': [
+            {
+                'name': cat[0] or 'Não informado', 
+                'count': cat[1]
+            } for cat in categories
+        ],
+        'cache_info': {
+            'cached': True,
+            'cache_timeout': 7200
+        }
+    }
+
 @vehicles_bp.route('/vehicles/categories', methods=['GET'])
 @cache_vehicles_by_category(timeout=7200)  # Cache por 2 horas
 def get_vehicles_by_category():
@@ -210,25 +537,7 @@ def get_vehicles_by_category():
     Lista veículos agrupados por categoria - COM CACHE
     """
     try:
-        categories = db.session.query(
-            Vehicle.categoria, 
-            db.func.count(Vehicle.id)
-        ).filter_by(is_active=True).group_by(Vehicle.categoria).all()
-        
-        result = {
-            'categories': [
-                {
-                    'name': cat[0] or 'Não informado', 
-                    'count': cat[1]
-                } for cat in categories
-            ],
-            'cache_info': {
-                'cached': True,
-                'cache_timeout': 7200
-            }
-        }
-        
-        return jsonify(result), 200
+        return jsonify(build_categories()), 200
         
     except Exception as e:
         current_app.logger.error(f"Erro em get_vehicles_by_category: {e}")
@@ -281,6 +590,120 @@ def get_admin_vehicles():
         current_app.logger.error(f"Erro em get_admin_vehicles: {e}")
         return jsonify({'error': 'Erro interno do servidor'}), 500
 
+def iter_export_rows(status):
+    """
+    Percorre os veículos com cursor no servidor (yield_per), sem carregar o catálogo
+    Gera listas de dicionários com até EXPORT_CHUNK_SIZE veículos
+    """
+    statement = select(Vehicle).order_by(Vehicle.id)
+    
+    if status == 'active':
+        statement = statement.where(Vehicle.is_active == True)
+    elif status == 'inactive':
+        statement = statement.where(Vehicle.is_active == False)
+    
+    result = db.session.execute(
+        statement.execution_options(yield_per=EXPORT_CHUNK_SIZE, stream_results=True)
+    ).scalars()
+    
+    for partition in result.partitions():
+        yield [vehicle.to_dict() for vehicle in partition]
+        # Liberar os objetos do lote da sessão para manter a memória constante
+        for vehicle in partition:
+            db.session.expunge(vehicle)
+
+def generate_ndjson_export(status):
+    """Gera o catálogo em NDJSON (um veículo por linha)"""
+    for rows in iter_export_rows(status):
+        yield ''.join(
+            json.dumps(row, ensure_ascii=False, separators=(',', ':')) + '\n'
+            for row in rows
+        )
+
+def generate_csv_export(status):
+    """Gera o catálogo em CSV (cabeçalho enviado antes da consulta terminar)"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS, extrasaction='ignore')
+    
+    writer.writeheader()
+    yield buffer.getvalue()
+    
+    for rows in iter_export_rows(status):
+        buffer.seek(0)
+        buffer.truncate()
+        for row in rows:
+            row['imagens'] = json.dumps(row['imagens'], ensure_ascii=False)
+            writer.writerow(row)
+        yield buffer.getvalue()
+
+@vehicles_bp.route('/admin/vehicles/export', methods=['GET'])
+@require_admin()
+def export_vehicles():
+    """
+    Exporta todo o catálogo em streaming (?format=ndjson|csv&status=all|active|inactive)
+    Memória constante independente do tamanho do catálogo
+    Requer autenticação de administrador - SEM CACHE
+    """
+    export_format = request.args.get('format', 'ndjson')
+    status = request.args.get('status', 'all')
+    
+    if export_format not in ('ndjson', 'csv'):
+        return jsonify({'error': 'Formato inválido (use ndjson ou csv)'}), 400
+    
+    if status not in ('all', 'active', 'inactive'):
+        return jsonify({'error': 'Status inválido (use all, active ou inactive)'}), 400
+    
+    if export_format == 'csv':
+        generator = generate_csv_export(status)
+        mimetype = 'text/csv'
+    else:
+        generator = generate_ndjson_export(status)
+        mimetype = 'application/x-ndjson'
+    
+    filename = f"veiculos-{status}-{datetime.utcnow().strftime('%Y%m%d%H%M%S')}.{export_format}"
+    
+    return Response(
+        stream_with_context(generator),
+        mimetype=mimetype,
+        headers={
+            'Content-Disposition': f'attachment; filename="{filename}"',
+            'Cache-Control': 'no-store',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+@vehicles_bp.route('/admin/vehicles/import', methods=['POST'])
+@require_admin()
+def import_vehicles_endpoint():
+    """
+    Importação em massa de veículos (?format=ndjson|csv) com upsert por external_id
+    O corpo da requisição é o arquivo bruto, lido em streaming
+    Requer autenticação de administrador - INVALIDA CACHE uma única vez ao final
+    """
+    from src.vehicle_import import import_vehicles
+    
+    try:
+        file_format = request.args.get('format', 'ndjson')
+        
+        if file_format not in ('ndjson', 'csv'):
+            return jsonify({'error': 'Formato inválido (use ndjson ou csv)'}), 400
+        
+        # Arquivos do DMS podem exceder o limite padrão de upload (5MB)
+        request.max_content_length = current_app.config.get('IMPORT_MAX_CONTENT_LENGTH')
+        
+        report = import_vehicles(request.stream, file_format)
+        current_app.logger.info(
+            f"Importação concluída: {report['created']} criados, "
+            f"{report['updated']} atualizados, {report['failed']} com erro"
+        )
+        
+        status_code = 200 if report['created'] or report['updated'] or not report['failed'] else 400
+        return jsonify(report), status_code
+        
+    except Exception as e:
+        current_app.logger.error(f"Erro em import_vehicles_endpoint: {e}")
+        return jsonify({'error': 'Erro interno do servidor'}), 500
+
 @vehicles_bp.route('/vehicles', methods=['POST'])
 @require_admin()
 def create_vehicle():
@@ -315,10 +738,15 @@ def create_vehicle():
         db.session.add(vehicle)
         db.session.commit()
         
-        # INVALIDAR CACHE após criação
-        invalidate_vehicle_cache()
+        # INVALIDAR CACHE após criação (listagens + o novo veículo)
+        invalidate_vehicle_cache(vehicle.id)
         current_app.logger.info(f"Cache invalidado após criação do veículo {vehicle.id}")
         
+        publish_vehicle_event('created', vehicle)
+        
+        # Alertas de buscas salvas compatíveis
+        queue_saved_search_matches(vehicle)
+        
         return jsonify({
             'message': 'Veículo criado com sucesso',
             'vehicle': vehicle.to_dict()
@@ -347,6 +775,8 @@ def update_vehicle(vehicle_id):
         schema = VehicleSchema()
         data = schema.load(request.get_json() or {})
         
+        before = vehicle_counter_snapshot(vehicle)
+        
         # Atualizar campos
         vehicle.marca = data['marca']
         vehicle.modelo = data['modelo']
@@ -367,10 +797,15 @@ def update_vehicle(vehicle_id):
         
         db.session.commit()
         
-        # INVALIDAR CACHE após atualização
-        invalidate_vehicle_cache(vehicle_id)
+        # INVALIDAR CACHE após atualização (categoria anterior para a purga da borda)
+        invalidate_vehicle_cache(vehicle_id, previous_categories=[before['categoria']])
         current_app.logger.info(f"Cache invalidado após atualização do veículo {vehicle_id}")
         
+        publish_vehicle_event('updated', vehicle, before)
+        
+        # Alertas de buscas salvas compatíveis
+        queue_saved_search_matches(vehicle)
+        
         return jsonify({
             'message': 'Veículo atualizado com sucesso',
             'vehicle': vehicle.to_dict()
@@ -382,6 +817,88 @@ def update_vehicle(vehicle_id):
         current_app.logger.error(f"Erro em update_vehicle: {e}")
         return jsonify({'error': 'Erro interno do servidor'}), 500
 
+@vehicles_bp.route('/vehicles/<int:vehicle_id>', methods=['PATCH'])
+@require_admin()
+def patch_vehicle(vehicle_id):
+    """
+    Atualização parcial de um veículo
+    Grava apenas os campos enviados que realmente mudaram
+    Suporta If-Match com o ETag do veículo (concorrência otimista)
+    Requer autenticação de administrador
+    INVALIDA CACHE apenas se algo mudou
+    """
+    try:
+        # Com If-Match, bloquear a linha entre a verificação e a escrita
+        if_match = request.if_match
+        vehicle = db.session.get(Vehicle, vehicle_id, with_for_update=bool(if_match))
+        
+        if not vehicle:
+            return jsonify({'error': 'Veículo não encontrado'}), 404
+        
+        current_etag = vehicle_etag(vehicle.id, vehicle.updated_at)
+        
+        if if_match and not if_match.contains(current_etag):
+            db.session.rollback()
+            response = jsonify({
+                'error': 'O veículo foi alterado por outra requisição',
+                'etag': current_etag
+            })
+            response.set_etag(current_etag)
+            return response, 412
+        
+        schema = VehicleSchema(partial=True)
+        data = schema.load(request.get_json() or {})
+        
+        before = vehicle_counter_snapshot(vehicle)
+        
+        # Aplicar apenas os campos alterados
+        changed_fields = []
+        for field, value in data.items():
+            if field == 'imagens':
+                if (json.dumps(value) if value else None) != vehicle.imagens:
+                    vehicle.set_imagens(value)
+                    changed_fields.append(field)
+            elif getattr(vehicle, field) != value:
+                setattr(vehicle, field, value)
+                changed_fields.append(field)
+        
+        if not changed_fields:
+            # Nada mudou: sem commit, sem invalidação
+            db.session.rollback()
+            response = jsonify({
+                'message': 'Nenhuma alteração necessária',
+                'changed_fields': [],
+                'vehicle': vehicle.to_dict()
+            })
+            response.set_etag(current_etag)
+            return response, 200
+        
+        db.session.commit()
+        
+        invalidate_vehicle_cache(vehicle_id, previous_categories=[before['categoria']])
+        current_app.logger.info(f"Cache invalidado após atualização parcial do veículo {vehicle_id}: {changed_fields}")
+        
+        publish_vehicle_event('updated', vehicle, before)
+        
+        # Alertas de buscas salvas compatíveis
+        queue_saved_search_matches(vehicle)
+        
+        response = jsonify({
+            'message': 'Veículo atualizado com sucesso',
+            'changed_fields': changed_fields,
+            'vehicle': vehicle.to_dict()
+        })
+        response.set_etag(vehicle_etag(vehicle.id, vehicle.updated_at))
+        return response, 200
+        
+    except ValidationError as e:
+        db.session.rollback()
+        return jsonify({'errors': e.messages}), 400
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Erro em patch_vehicle: {e}")
+        return jsonify({'error': 'Erro interno do servidor'}), 500
+
 @vehicles_bp.route('/vehicles/<int:vehicle_id>', methods=['DELETE'])
 @require_admin()
 def delete_vehicle(vehicle_id):
@@ -396,6 +913,8 @@ def delete_vehicle(vehicle_id):
         if not vehicle:
             return jsonify({'error': 'Veículo não encontrado'}), 404
         
+        before = vehicle_counter_snapshot(vehicle)
+        
         # Soft delete - marca como inativo
         vehicle.is_active = False
         db.session.commit()
@@ -404,6 +923,8 @@ def delete_vehicle(vehicle_id):
         invalidate_vehicle_cache(vehicle_id)
         current_app.logger.info(f"Cache invalidado após exclusão do veículo {vehicle_id}")
         
+        publish_vehicle_event('deleted', vehicle, before)
+        
         return jsonify({'message': 'Veículo excluído com sucesso'}), 200
         
     except Exception as e:
@@ -424,6 +945,8 @@ def restore_vehicle(vehicle_id):
         if not vehicle:
             return jsonify({'error': 'Veículo não encontrado'}), 404
         
+        before = vehicle_counter_snapshot(vehicle)
+        
         # Restaurar veículo
         vehicle.is_active = True
         db.session.commit()
@@ -432,6 +955,11 @@ def restore_vehicle(vehicle_id):
         invalidate_vehicle_cache(vehicle_id)
         current_app.logger.info(f"Cache invalidado após restauração do veículo {vehicle_id}")
         
+        publish_vehicle_event('restored', vehicle, before)
+        
+        # Alertas de buscas salvas compatíveis
+        queue_saved_search_matches(vehicle)
+        
         return jsonify({
             'message': 'Veículo restaurado com sucesso',
             'vehicle': vehicle.to_dict()
@@ -441,6 +969,188 @@ def restore_vehicle(vehicle_id):
         current_app.logger.error(f"Erro em restore_vehicle: {e}")
         return jsonify({'error': 'Erro interno do servidor'}), 500
 
+class BulkOperationError(Exception):
+    """Operação em massa inválida (retornada como 400 com o índice da operação)"""
+
+def build_bulk_condition(operation):
+    """
+    Monta o filtro de uma operação em massa a partir de 'ids' e/ou 'filter'
+    Exige pelo menos um seletor para evitar alterar o catálogo inteiro por engano
+    """
+    conditions = []
+    
+    ids = operation.get('ids')
+    if ids is not None:
+        if not isinstance(ids, list) or not all(
+            isinstance(vid, (int, str)) and str(vid).isascii() and str(vid).isdigit() for vid in ids
+        ):
+            raise BulkOperationError("'ids' deve ser uma lista de IDs numéricos")
+        conditions.append(Vehicle.id.in_([int(vid) for vid in ids]))
+    
+    filters = operation.get('filter') or {}
+    if not isinstance(filters, dict):
+        raise BulkOperationError("'filter' deve ser um objeto")
+    
+    for field in ('marca', 'modelo', 'categoria', 'combustivel', 'cambio'):
+        if filters.get(field):
+            conditions.append(getattr(Vehicle, field) == filters[field])
+    try:
+        if filters.get('ano_min') is not None:
+            conditions.append(Vehicle.ano >= int(filters['ano_min']))
+        if filters.get('ano_max') is not None:
+            conditions.append(Vehicle.ano <= int(filters['ano_max']))
+    except (TypeError, ValueError):
+        raise BulkOperationError("'ano_min' e 'ano_max' devem ser numéricos")
+    if filters.get('status') == 'active':
+        conditions.append(Vehicle.is_active == True)
+    elif filters.get('status') == 'inactive':
+        conditions.append(Vehicle.is_active == False)
+    
+    if not conditions:
+        raise BulkOperationError("Informe 'ids' ou 'filter' para selecionar os veículos")
+    
+    return and_(*conditions)
+
+def prepare_bulk_operation(operation):
+    """
+    Valida uma operação e retorna (condição, valores do UPDATE)
+    Condições extras evitam reescrever linhas que não mudariam
+    """
+    if not isinstance(operation, dict):
+        raise BulkOperationError('Operação deve ser um objeto')
+    
+    action = operation.get('action')
+    if action not in BULK_ACTIONS:
+        raise BulkOperationError(f"Ação inválida (use {', '.join(BULK_ACTIONS)})")
+    
+    condition = build_bulk_condition(operation)
+    
+    if action == 'activate':
+        return and_(condition, Vehicle.is_active == False), {'is_active': True}
+    
+    if action == 'deactivate':
+        return and_(condition, Vehicle.is_active == True), {'is_active': False}
+    
+    if action == 'patch':
+        fields_data = operation.get('fields')
+        if not isinstance(fields_data, dict) or not fields_data:
+            raise BulkOperationError("'fields' deve conter os campos a alterar")
+        try:
+            values = VehicleSchema(partial=True).load(fields_data)
+        except ValidationError as e:
+            raise BulkOperationError(e.messages)
+        if 'imagens' in values:
+            values['imagens'] = json.dumps(values['imagens']) if values['imagens'] else None
+        return condition, values
+    
+    # price_adjust: percentual aplicado no próprio UPDATE (sem ler os preços)
+    try:
+        percent = float(operation.get('percent'))
+    except (TypeError, ValueError):
+        raise BulkOperationError("'percent' deve ser numérico")
+    
+    min_percent, max_percent = BULK_PRICE_ADJUST_RANGE
+    if not min_percent <= percent <= max_percent or percent == 0:
+        raise BulkOperationError(f"'percent' deve estar entre {min_percent} e {max_percent} e ser diferente de 0")
+    
+    return (
+        and_(condition, Vehicle.preco.isnot(None)),
+        {'preco': func.round(Vehicle.preco * (1 + percent / 100), 2)}
+    )
+
+@vehicles_bp.route('/admin/vehicles/bulk', methods=['POST'])
+@require_admin()
+def bulk_vehicle_operations():
+    """
+    Executa operações em massa em uma única transação
+    Ações: activate, deactivate, patch (fields) e price_adjust (percent)
+    Cada operação seleciona veículos por 'ids' e/ou 'filter'
+    Requer autenticação de administrador - INVALIDA CACHE apenas dos veículos afetados
+    """
+    try:
+        data = request.get_json() or {}
+        operations = data.get('operations')
+        
+        if not isinstance(operations, list) or not operations:
+            return jsonify({'error': "Informe a lista 'operations'"}), 400
+        
+        if len(operations) > BULK_MAX_OPERATIONS:
+            return jsonify({'error': f'Máximo de {BULK_MAX_OPERATIONS} operações por requisição'}), 400
+        
+        # Validar todas as operações antes de escrever
+        prepared = []
+        for index, operation in enumerate(operations):
+            try:
+                condition, values = prepare_bulk_operation(operation)
+            except BulkOperationError as e:
+                return jsonify({'errors': {index: e.args[0]}}), 400
+            # A ação só é lida depois de validada
+            prepared.append((operation['action'], condition, values))
+        
+        now = datetime.utcnow()
+        counter_columns = (Vehicle.id, Vehicle.is_active, Vehicle.categoria, Vehicle.marca, Vehicle.combustivel)
+        before = {}
+        affected_ids = set()
+        results = []
+        
+        for index, (action, condition, values) in enumerate(prepared):
+            # Snapshot dos contadores apenas das linhas atingidas (uma consulta)
+            rows = db.session.execute(select(*counter_columns).where(condition)).all()
+            ids = [row.id for row in rows]
+            
+            for row in rows:
+                before.setdefault(row.id, {
+                    'is_active': row.is_active,
+                    'categoria': row.categoria,
+                    'marca': row.marca,
+                    'combustivel': row.combustivel
+                })
+            
+            if ids:
+                db.session.execute(
+                    update(Vehicle)
+                    .where(Vehicle.id.in_(ids))
+                    .values(updated_at=now, **values)
+                    .execution_options(synchronize_session=False)
+                )
+                affected_ids.update(ids)
+            
+            results.append({'index': index, 'action': action, 'affected': len(ids)})
+        
+        db.session.commit()
+        
+        if affected_ids:
+            # Uma única invalidação direcionada para todos os veículos afetados
+            invalidate_vehicle_cache(
+                vehicle_ids=sorted(affected_ids),
+                previous_categories={snapshot['categoria'] for snapshot in before.values()}
+            )
+            
+            after_rows = db.session.execute(
+                select(*counter_columns).where(Vehicle.id.in_(affected_ids))
+            ).all()
+            delta = combine_dashboard_deltas(
+                dashboard_delta(before[row.id], vehicle_counter_snapshot(row))
+                for row in after_rows
+            )
+            broker.publish('vehicle.bulk', {
+                'ids': [str(vid) for vid in sorted(affected_ids)],
+                'dashboard_delta': delta
+            })
+        
+        current_app.logger.info(f"Operações em massa: {len(affected_ids)} veículos afetados")
+        
+        return jsonify({
+            'message': 'Operações executadas com sucesso',
+            'results': results,
+            'affected_ids': [str(vid) for vid in sorted(affected_ids)]
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Erro em bulk_vehicle_operations: {e}")
+        return jsonify({'error': 'Erro interno do servidor'}), 500
+
 # ==================== ESTATÍSTICAS E DASHBOARD ====================
 
 @vehicles_bp.route('/admin/dashboard/stats', methods=['GET'])
@@ -472,9 +1182,32 @@ def get_dashboard_stats():
             db.func.count(Vehicle.id)
         ).filter_by(is_active=True).group_by(Vehicle.combustivel).all()
         
+        # Engajamento (contadores gravados em lote a cada poucos segundos)
+        total_views, total_whatsapp_clicks = db.session.query(
+            func.coalesce(func.sum(VehicleStats.views), 0),
+            func.coalesce(func.sum(VehicleStats.whatsapp_clicks), 0)
+        ).one()
+        
+        top_viewed = db.session.query(Vehicle, VehicleStats).join(
+            VehicleStats, VehicleStats.vehicle_id == Vehicle.id
+        ).filter(Vehicle.is_active == True).order_by(VehicleStats.views.desc()).limit(10).all()
+        
         return jsonify({
             'total_vehicles': total_vehicles,
             'total_inactive': total_inactive,
+            'engagement': {
+                'total_views': int(total_views),
+                'total_whatsapp_clicks': int(total_whatsapp_clicks),
+                'top_viewed': [
+                    {
+                        'id': str(vehicle.id),
+                        'marca': vehicle.marca,
+                        'modelo': vehicle.modelo,
+                        'views': stats.views,
+                        'whatsapp_clicks': stats.whatsapp_clicks
+                    } for vehicle, stats in top_viewed
+                ]
+            },
             'categories': [{'name': cat[0] or 'Não informado', 'count': cat[1]} for cat in categories],
             'brands': [{'name': brand[0] or 'Não informado', 'count': brand[1]} for brand in brands],
             'fuels': [{'name': fuel[0] or 'Não informado', 'count': fuel[1]} for fuel in fuels]
@@ -484,6 +1217,32 @@ def get_dashboard_stats():
         current_app.logger.error(f"Erro em get_dashboard_stats: {e}")
         return jsonify({'error': 'Erro interno do servidor'}), 500
 
+@vehicles_bp.route('/admin/vehicles/<int:vehicle_id>/stats', methods=['GET'])
+@require_admin()
+def get_vehicle_stats(vehicle_id):
+    """
+    Retorna visualizações e cliques no WhatsApp de um veículo
+    SEM CACHE - dados sempre atualizados para admin
+    """
+    try:
+        if not db.session.get(Vehicle, vehicle_id):
+            return jsonify({'error': 'Veículo não encontrado'}), 404
+        
+        stats = db.session.get(VehicleStats, vehicle_id)
+        
+        return jsonify({
+            'stats': stats.to_dict() if stats else {
+                'vehicle_id': str(vehicle_id),
+                'views': 0,
+                'whatsapp_clicks': 0,
+                'updated_at': None
+            }
+        }), 200
+        
+    except Exception as e:
+        current_app.logger.error(f"Erro em get_vehicle_stats: {e}")
+        return jsonify({'error': 'Erro interno do servidor'}), 500
+
 @vehicles_bp.route('/admin/vehicles/search', methods=['GET'])
 @require_admin()
 def search_admin_vehicles():
@@ -564,10 +1323,23 @@ def get_cache_stats():
 def add_cache_headers_to_response(response):
     """Adiciona headers de cache às respostas públicas"""
     if request.endpoint and 'admin' not in request.endpoint:
-        if response.status_code == 200:
+        # Respeitar a política definida pela própria rota
+        if response.status_code == 200 and 'Cache-Control' not in response.headers:
             # Adicionar headers de cache para endpoints públicos
             if 'vehicles' in request.endpoint:
                 response = add_cache_headers(response, timeout=3600)
+        
+        # ETag da versão do veículo no detalhe (usado em If-Match no PATCH)
+        if request.endpoint == 'vehicles.get_vehicle' and request.method == 'GET' and response.status_code == 200:
+            vehicle_data = (response.get_json(silent=True) or {}).get('vehicle') or {}
+            if vehicle_data.get('id'):
+                response.set_etag(vehicle_etag(vehicle_data['id'], vehicle_data.get('updated_at')))
+                response = response.make_conditional(request)
+        
+        # Tags para purga seletiva em CDN/proxy reverso
+        if request.method == 'GET' and response.status_code in (200, 304) and response.is_json:
+            keys = surrogate_keys_for_payload(request.endpoint, response.get_json(silent=True) or {}, request.args)
+            response = add_surrogate_headers(response, keys)
     
     return response
 
@@ -0,0 +1,265 @@
+"""
+Casamento reverso de buscas salvas com veículos novos ou atualizados
+Em vez de reexecutar cada busca a cada escrita, as buscas são indexadas
+pelas dimensões seletivas (categoria, combustível, marca, faixas de preço e ano)
+e cada veículo é comparado apenas com as buscas candidatas
+Faixas usam árvores de intervalos centradas: consulta em O(log n + resultados)
+"""
+import math
+import threading
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import func, select
+from src.models.user import db
+from src.models.saved_search import SavedSearch, SavedSearchMatch
+
+# Filtros aceitos (os mesmos de /api/vehicles)
+SAVED_SEARCH_FILTERS = (
+    'marca', 'modelo', 'ano_min', 'ano_max', 'preco_min', 'preco_max',
+    'combustivel', 'categoria', 'search'
+)
+
+class IntervalTree:
+    """Árvore de intervalos centrada (estática) para consultas de ponto"""
+
+    def __init__(self, intervals):
+        # intervals: lista de (inicio, fim, id) com limites fechados (podem ser infinitos)
+        self.root = self._build(intervals)
+
+    def _build(self, intervals):
+        if not intervals:
+            return None
+
+        finite = sorted(p for start, end, _ in intervals for p in (start, end) if math.isfinite(p))
+        center = finite[len(finite) // 2] if finite else 0
+
+        left, right, overlapping = [], [], []
+        for interval in intervals:
+            start, end, _ = interval
+            if end < center:
+                left.append(interval)
+            elif start > center:
+                right.append(interval)
+            else:
+                overlapping.append(interval)
+
+        return {
+            'center': center,
+            'by_start': sorted(overlapping, key=lambda interval: interval[0]),
+            'by_end': sorted(overlapping, key=lambda interval: interval[1], reverse=True),
+            'left': self._build(left),
+            'right': self._build(right)
+        }
+
+    def stab(self, point):
+        """Retorna os IDs dos intervalos que contêm o ponto"""
+        found = set()
+        node = self.root
+
+        while node is not None:
+            if point < node['center']:
+                for start, _, interval_id in node['by_start']:
+                    if start > point:
+                        break
+                    found.add(interval_id)
+                node = node['left']
+            elif point > node['center']:
+                for _, end, interval_id in node['by_end']:
+                    if end < point:
+                        break
+                    found.add(interval_id)
+                node = node['right']
+            else:
+                found.update(interval_id for _, _, interval_id in node['by_start'])
+                break
+
+        return found
+
+def contains_text(value, term):
+    """Equivalente ao ILIKE '%termo%' usado nos filtros da listagem"""
+    return value is not None and term.lower() in value.lower()
+
+def vehicle_matches_filters(vehicle, filters):
+    """
+    Verifica se um veículo atende aos filtros de uma busca
+    Mesma semântica de build_vehicles_listing (filtros vazios são ignorados)
+    """
+    if not vehicle.is_active:
+        return False
+    if filters.get('marca') and not contains_text(vehicle.marca, filters['marca']):
+        return False
+    if filters.get('modelo') and not contains_text(vehicle.modelo, filters['modelo']):
+        return False
+    if filters.get('ano_min') and (vehicle.ano is None or vehicle.ano < filters['ano_min']):
+        return False
+    if filters.get('ano_max') and (vehicle.ano is None or vehicle.ano > filters['ano_max']):
+        return False
+    if filters.get('preco_min') and (vehicle.preco is None or vehicle.preco < filters['preco_min']):
+        return False
+    if filters.get('preco_max') and (vehicle.preco is None or vehicle.preco > filters['preco_max']):
+        return False
+    if filters.get('combustivel') and vehicle.combustivel != filters['combustivel']:
+        return False
+    if filters.get('categoria') and vehicle.categoria != filters['categoria']:
+        return False
+    if filters.get('search'):
+        term = filters['search']
+        if not any(contains_text(value, term) for value in (vehicle.marca, vehicle.modelo, vehicle.descricao)):
+            return False
+    return True
+
+def text_substrings(value):
+    """Todos os trechos (em minúsculas) de um texto curto, para o índice de marca"""
+    value = (value or '').lower()
+    return {value[i:j] for i in range(len(value)) for j in range(i + 1, len(value) + 1)}
+
+class SavedSearchIndex:
+    """Índice invertido + árvores de intervalos sobre as buscas salvas ativas"""
+
+    def __init__(self, searches=()):
+        # searches: iterável de (id, filtros)
+        self.filters = {}
+        self.exact = {'categoria': {}, 'combustivel': {}, 'marca': {}}
+        self.unconstrained = {'categoria': set(), 'combustivel': set(), 'marca': set()}
+        price_intervals, year_intervals = [], []
+
+        for search_id, filters in searches:
+            self.filters[search_id] = filters
+
+            for field in ('categoria', 'combustivel', 'marca'):
+                value = filters.get(field)
+                if value:
+                    key = value.lower() if field == 'marca' else value
+                    self.exact[field].setdefault(key, set()).add(search_id)
+                else:
+                    self.unconstrained[field].add(search_id)
+
+            price_intervals.append((
+                filters.get('preco_min') or -math.inf,
+                filters.get('preco_max') or math.inf,
+                search_id
+            ))
+            year_intervals.append((
+                filters.get('ano_min') or -math.inf,
+                filters.get('ano_max') or math.inf,
+                search_id
+            ))
+
+        self.price_tree = IntervalTree(price_intervals)
+        self.year_tree = IntervalTree(year_intervals)
+        self.all_ids = set(self.filters)
+        # Buscas sem faixa de preço (as únicas que aceitam veículos sem preço)
+        self.without_price = {
+            search_id for start, end, search_id in price_intervals
+            if math.isinf(start) and math.isinf(end)
+        }
+
+    def __len__(self):
+        return len(self.filters)
+
+    def candidates(self, vehicle):
+        """Buscas que podem casar com o veículo pelas dimensões indexadas"""
+        dimensions = [
+            self.exact['categoria'].get(vehicle.categoria, set()) | self.unconstrained['categoria'],
+            self.exact['combustivel'].get(vehicle.combustivel, set()) | self.unconstrained['combustivel'],
+            self.year_tree.stab(vehicle.ano) if vehicle.ano is not None else self.all_ids
+        ]
+
+        # Marca: ILIKE '%x%' casa com qualquer trecho da marca do veículo
+        marca_ids = set(self.unconstrained['marca'])
+        for fragment in text_substrings(vehicle.marca):
+            marca_ids |= self.exact['marca'].get(fragment, set())
+        dimensions.append(marca_ids)
+
+        if vehicle.preco is not None:
+            dimensions.append(self.price_tree.stab(vehicle.preco))
+        else:
+            dimensions.append(self.without_price)
+
+        # Interseção começando pela dimensão mais seletiva
+        dimensions.sort(key=len)
+        result = set(dimensions[0])
+        for dimension in dimensions[1:]:
+            if not result:
+                break
+            result &= dimension
+        return result
+
+    def match(self, vehicle):
+        """IDs das buscas que casam com o veículo (candidatas + verificação completa)"""
+        return sorted(
+            search_id for search_id in self.candidates(vehicle)
+            if vehicle_matches_filters(vehicle, self.filters[search_id])
+        )
+
+# Índice do processo, recarregado quando as buscas salvas mudam
+index_state = {'index': None, 'version': None}
+index_lock = threading.Lock()
+
+def saved_searches_version():
+    """Versão barata do conjunto de buscas ativas (detecta mudanças de outros workers)"""
+    count, max_id = db.session.execute(
+        select(func.count(SavedSearch.id), func.max(SavedSearch.id)).where(SavedSearch.is_active == True)
+    ).one()
+    return count, max_id
+
+def get_saved_search_index():
+    """Retorna o índice atualizado, reconstruindo se as buscas mudaram"""
+    version = saved_searches_version()
+
+    with index_lock:
+        if index_state['index'] is None or index_state['version'] != version:
+            searches = SavedSearch.query.filter_by(is_active=True).all()
+            index_state['index'] = SavedSearchIndex(
+                (search.id, search.get_filters()) for search in searches
+            )
+            index_state['version'] = version
+        return index_state['index']
+
+def reset_saved_search_index():
+    """Descarta o índice (recarregado na próxima consulta)"""
+    with index_lock:
+        index_state['index'] = None
+        index_state['version'] = None
+
+def queue_saved_search_matches(vehicle):
+    """
+    Casa um veículo novo/atualizado com as buscas salvas e enfileira as notificações
+    Chamada após o commit da escrita: falhas aqui são registradas e não afetam a rota
+    Retorna a quantidade de novos matches enfileirados
+    """
+    if not vehicle.is_active:
+        return 0
+
+    try:
+        return enqueue_matches(vehicle, get_saved_search_index().match(vehicle))
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Erro ao casar buscas salvas com o veículo {vehicle.id}: {e}")
+        return 0
+
+def enqueue_matches(vehicle, matched_ids):
+    """Grava os matches ainda não enfileirados para o veículo"""
+    if not matched_ids:
+        return 0
+
+    # Não notificar de novo buscas que já receberam este veículo
+    already_queued = set(db.session.scalars(
+        select(SavedSearchMatch.saved_search_id).where(
+            SavedSearchMatch.vehicle_id == vehicle.id,
+            SavedSearchMatch.saved_search_id.in_(matched_ids)
+        )
+    ))
+
+    now = datetime.utcnow()
+    new_matches = [
+        SavedSearchMatch(saved_search_id=search_id, vehicle_id=vehicle.id, created_at=now)
+        for search_id in matched_ids
+        if search_id not in already_queued
+    ]
+
+    if new_matches:
+        db.session.add_all(new_matches)
+        db.session.commit()
+
+    return len(new_matches)
@@ -0,0 +1,27 @@
+"""
+Schemas de validação compartilhados entre as rotas e os módulos de serviço
+(ex.: importação em massa), sem depender dos blueprints
+"""
+from marshmallow import Schema, fields, validate
+
+class VehicleSchema(Schema):
+    """Schema para validação de dados de veículos"""
+    marca = fields.Str(required=True, validate=validate.Length(min=2, max=100))
+    modelo = fields.Str(required=True, validate=validate.Length(min=2, max=100))
+    ano = fields.Int(required=True, validate=validate.Range(min=1900, max=2030))
+    preco = fields.Float(required=False, allow_none=True, validate=validate.Range(min=0, max=10000000))
+    sob_consulta = fields.Bool(load_default=False)
+    descricao = fields.Str(validate=validate.Length(max=2000))
+    combustivel = fields.Str(validate=validate.OneOf([
+        'Gasolina', 'Etanol', 'Flex', 'Diesel', 'Elétrico', 'Híbrido'
+    ]))
+    cambio = fields.Str(validate=validate.OneOf([
+        'Manual', 'Automático', 'CVT', 'Automatizada'
+    ]))
+    cor = fields.Str(validate=validate.Length(max=50))
+    quilometragem = fields.Int(validate=validate.Range(min=0, max=1000000))
+    categoria = fields.Str(validate=validate.OneOf([
+        'Hatch', 'Sedan', 'SUV', 'Picape', 'Conversível', 'Wagon', 'Coupé'
+    ]))
+    whatsapp_link = fields.Str(validate=validate.Length(max=500))
+    imagens = fields.List(fields.Str())
@@ -0,0 +1,325 @@
+"""
+Índice de veículos semelhantes (recomendações)
+Mantém em memória uma matriz NumPy de características do catálogo ativo
+(ano, preço e quilometragem normalizados + one-hot de categoria, combustível,
+câmbio e marca) e o top-K de vizinhos pré-calculado para cada veículo
+As consultas de vizinhos são feitas em lote (produto de matrizes) e as escritas
+de veículos atualizam apenas as linhas afetadas via listener de invalidação
+Um índice publicado nunca é alterado: atualizações e reconstruções geram um
+índice novo, trocado com uma única atribuição, e cada leitura usa uma única
+referência. Reconstruções de índice invalidado ou expirado rodam em segundo
+plano enquanto o índice anterior continua respondendo
+"""
+import copy
+import threading
+import time
+import numpy as np
+from flask import current_app
+from src.models.user import db
+from src.models.vehicle import Vehicle
+from src.cache_manager import register_invalidation_listener
+
+# Vizinhos pré-calculados por veículo
+SIMILAR_TOP_K = 12
+
+# Linhas por lote no cálculo das distâncias (limita a memória a BATCH x N)
+SIMILARITY_BATCH_SIZE = 512
+
+# Acima deste número de veículos alterados, reconstruir o índice inteiro
+MAX_INCREMENTAL_CHANGES = 200
+
+# Pesos das características (escala relativa na distância euclidiana)
+NUMERIC_FEATURES = {'ano': 1.0, 'preco': 1.5, 'quilometragem': 0.7}
+CATEGORICAL_FEATURES = {'categoria': 1.0, 'marca': 0.7, 'combustivel': 0.5, 'cambio': 0.5}
+
+FEATURE_COLUMNS = ['id'] + list(NUMERIC_FEATURES) + list(CATEGORICAL_FEATURES)
+
+class IndexOutdated(Exception):
+    """Alteração que exige reconstruir o índice (nova categoria, valor fora da escala)"""
+
+class SimilarityIndex:
+    """Matriz de características + top-K de vizinhos do catálogo ativo"""
+
+    def __init__(self, rows, top_k=SIMILAR_TOP_K):
+        self.top_k = top_k
+        self.built_at = time.time()
+        self._fit(rows)
+
+        self.ids = np.array([row['id'] for row in rows], dtype=np.int64)
+        self.features = self.encode(rows)
+        self.sqnorms = np.einsum('ij,ij->i', self.features, self.features)
+        self.positions = {int(vehicle_id): i for i, vehicle_id in enumerate(self.ids)}
+
+        self.neighbor_ids = np.full((len(rows), top_k), -1, dtype=np.int64)
+        self.neighbor_dists = np.full((len(rows), top_k), np.inf, dtype=np.float32)
+        self._compute_neighbors(np.arange(len(rows)))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _fit(self, rows):
+        """Define escalas numéricas e vocabulários a partir do catálogo"""
+        self.scales = {}
+        for name in NUMERIC_FEATURES:
+            values = [row[name] for row in rows if row[name] is not None]
+            low, high = (min(values), max(values)) if values else (0.0, 1.0)
+            # Mediana para veículos sem valor (ex.: preço sob consulta)
+            fill = float(np.median(values)) if values else 0.0
+            self.scales[name] = (float(low), float(high) if high > low else float(low) + 1.0, fill)
+
+        self.vocabularies = {}
+        offset = len(NUMERIC_FEATURES)
+        for name in CATEGORICAL_FEATURES:
+            values = sorted({row[name] for row in rows if row[name]})
+            self.vocabularies[name] = {value: offset + i for i, value in enumerate(values)}
+            offset += len(values)
+        self.dimensions = offset
+
+    def encode(self, rows):
+        """Converte veículos em linhas da matriz de características (float32)"""
+        matrix = np.zeros((len(rows), self.dimensions), dtype=np.float32)
+
+        for i, row in enumerate(rows):
+            for column, (name, weight) in enumerate(NUMERIC_FEATURES.items()):
+                low, high, fill = self.scales[name]
+                value = row[name] if row[name] is not None else fill
+                if not low <= value <= high:
+                    raise IndexOutdated(f'{name} fora da escala do índice')
+                matrix[i, column] = weight * (value - low) / (high - low)
+
+            for name, weight in CATEGORICAL_FEATURES.items():
+                value = row[name]
+                if not value:
+                    continue
+                if value not in self.vocabularies[name]:
+                    raise IndexOutdated(f'{name} "{value}" fora do vocabulário do índice')
+                matrix[i, self.vocabularies[name][value]] = weight
+
+        return matrix
+
+    def distances(self, rows):
+        """Distâncias quadráticas das linhas informadas para todo o catálogo"""
+        block = self.features[rows]
+        dists = self.sqnorms[rows][:, None] + self.sqnorms[None, :] - 2.0 * (block @ self.features.T)
+        np.maximum(dists, 0.0, out=dists)
+        # O próprio veículo não é vizinho de si mesmo
+        dists[np.arange(len(rows)), rows] = np.inf
+        return dists
+
+    def _compute_neighbors(self, rows):
+        """Recalcula o top-K das linhas informadas, em lotes vetorizados"""
+        k = min(self.top_k, len(self.ids) - 1)
+        self.neighbor_ids[rows] = -1
+        self.neighbor_dists[rows] = np.inf
+        if k <= 0:
+            return
+
+        for start in range(0, len(rows), SIMILARITY_BATCH_SIZE):
+            batch = rows[start:start + SIMILARITY_BATCH_SIZE]
+            dists = self.distances(batch)
+
+            nearest = np.argpartition(dists, k - 1, axis=1)[:, :k]
+            nearest_dists = np.take_along_axis(dists, nearest, axis=1)
+            order = np.argsort(nearest_dists, axis=1, kind='stable')
+            nearest = np.take_along_axis(nearest, order, axis=1)
+
+            self.neighbor_ids[batch, :k] = self.ids[nearest]
+            self.neighbor_dists[batch, :k] = np.take_along_axis(nearest_dists, order, axis=1)
+
+    def _remove(self, vehicle_ids):
+        rows = [self.positions[vid] for vid in vehicle_ids if vid in self.positions]
+        if not rows:
+            return
+        keep = np.ones(len(self.ids), dtype=bool)
+        keep[rows] = False
+        self.ids = self.ids[keep]
+        self.features = self.features[keep]
+        self.sqnorms = self.sqnorms[keep]
+        self.neighbor_ids = self.neighbor_ids[keep]
+        self.neighbor_dists = self.neighbor_dists[keep]
+        self.positions = {int(vehicle_id): i for i, vehicle_id in enumerate(self.ids)}
+
+    def _append(self, rows):
+        if not rows:
+            return
+        features = self.encode(rows)
+        start = len(self.ids)
+        self.ids = np.concatenate([self.ids, np.array([row['id'] for row in rows], dtype=np.int64)])
+        self.features = np.vstack([self.features, features])
+        self.sqnorms = np.concatenate([self.sqnorms, np.einsum('ij,ij->i', features, features)])
+        self.neighbor_ids = np.vstack([self.neighbor_ids, np.full((len(rows), self.top_k), -1, dtype=np.int64)])
+        self.neighbor_dists = np.vstack([self.neighbor_dists, np.full((len(rows), self.top_k), np.inf, dtype=np.float32)])
+        for i, row in enumerate(rows):
+            self.positions[row['id']] = start + i
+
+    def with_changes(self, vehicle_ids, rows):
+        """
+        Atualização incremental após escritas, sem alterar este índice
+        vehicle_ids: IDs alterados; rows: estado atual dos que continuam ativos
+        Retorna (novo índice, veículos recalculados) - recalcula apenas os
+        veículos alterados e os que podem ter ganhado ou perdido um deles
+        entre os vizinhos
+        """
+        # Validar antes de copiar qualquer estrutura (IndexOutdated = rebuild)
+        self.encode(rows)
+
+        # _remove e _append criam arrays novos; apenas os vizinhos (alterados
+        # in-place) e o mapa de posições precisam ser copiados
+        updated = copy.copy(self)
+        updated.neighbor_ids = self.neighbor_ids.copy()
+        updated.neighbor_dists = self.neighbor_dists.copy()
+        updated.positions = dict(self.positions)
+        affected = updated._apply_changes(vehicle_ids, rows)
+        return updated, affected
+
+    def _apply_changes(self, vehicle_ids, rows):
+        changed = np.array(sorted(vehicle_ids), dtype=np.int64)
+        self._remove(vehicle_ids)
+        self._append(rows)
+
+        # Quem tinha um veículo alterado entre os vizinhos precisa recalcular
+        affected = np.isin(self.neighbor_ids, changed).any(axis=1)
+
+        new_rows = np.array([self.positions[row['id']] for row in rows], dtype=np.int64)
+        if len(new_rows):
+            affected[new_rows] = True
+            # Quem tem um veículo alterado mais perto que o K-ésimo vizinho também
+            dists = self.distances(new_rows).min(axis=0)
+            affected |= dists < self.neighbor_dists[:, -1]
+
+        self._compute_neighbors(np.flatnonzero(affected))
+        return int(affected.sum())
+
+    def similar_ids(self, vehicle_id, limit):
+        """IDs dos veículos mais semelhantes (pré-calculados), ou None se fora do índice"""
+        row = self.positions.get(vehicle_id)
+        if row is None:
+            return None
+        neighbors = self.neighbor_ids[row, :limit]
+        return [int(vid) for vid in neighbors if vid >= 0]
+
+# Índice publicado do processo; update_lock serializa quem gera um índice novo
+# (escritas e a troca ao fim de uma reconstrução) - leitores não usam lock
+index_state = {'index': None, 'stale': True, 'rebuilding': False, 'pending': set(), 'pending_full': False}
+update_lock = threading.Lock()
+first_build_lock = threading.Lock()
+
+def load_feature_rows(vehicle_ids=None):
+    """Lê apenas as colunas usadas nas características dos veículos ativos"""
+    query = db.session.query(*[getattr(Vehicle, column) for column in FEATURE_COLUMNS]).filter(
+        Vehicle.is_active == True
+    )
+    if vehicle_ids is not None:
+        query = query.filter(Vehicle.id.in_(vehicle_ids))
+    return [dict(zip(FEATURE_COLUMNS, row)) for row in query.order_by(Vehicle.id)]
+
+def begin_rebuild():
+    """Marca uma reconstrução em andamento; False se já houver uma"""
+    with update_lock:
+        if index_state['rebuilding']:
+            return False
+        index_state['rebuilding'] = True
+        index_state['pending'] = set()
+        index_state['pending_full'] = False
+        return True
+
+def rebuild_similarity_index():
+    """
+    Reconstrói o índice completo a partir do catálogo ativo (chamar após begin_rebuild)
+    O cálculo roda sem lock; escritas feitas durante ele são reaplicadas ao
+    índice novo antes da troca
+    """
+    try:
+        started = time.time()
+        index = SimilarityIndex(load_feature_rows())
+
+        with update_lock:
+            pending = index_state['pending']
+            stale = index_state['pending_full']
+            if pending and not stale:
+                try:
+                    index, _ = index.with_changes(pending, load_feature_rows(pending))
+                except IndexOutdated:
+                    stale = True
+            index_state['index'] = index
+            index_state['stale'] = stale
+    finally:
+        with update_lock:
+            index_state['rebuilding'] = False
+            index_state['pending'] = set()
+            index_state['pending_full'] = False
+
+    current_app.logger.info(
+        f"Índice de semelhança reconstruído: {len(index)} veículos, "
+        f"{index.dimensions} características em {time.time() - started:.2f}s"
+    )
+    return index
+
+def rebuild_in_background(app):
+    """Reconstrução em uma thread própria (o índice atual continua servindo)"""
+    with app.app_context():
+        try:
+            rebuild_similarity_index()
+        except Exception as e:
+            app.logger.error(f"Erro ao reconstruir índice de semelhança: {e}")
+        finally:
+            db.session.remove()
+
+def get_similarity_index():
+    """
+    Retorna o índice publicado
+    Só a primeira construção bloqueia; índice invalidado ou expirado é
+    reconstruído em segundo plano e o atual é devolvido enquanto isso
+    """
+    index = index_state['index']
+    if index is None:
+        with first_build_lock:
+            index = index_state['index']
+            if index is None:
+                begin_rebuild()
+                index = rebuild_similarity_index()
+        return index
+
+    max_age = current_app.config.get('SIMILAR_REBUILD_INTERVAL', 3600)
+    if (index_state['stale'] or time.time() - index.built_at > max_age) and begin_rebuild():
+        threading.Thread(
+            target=rebuild_in_background,
+            args=(current_app._get_current_object(),),
+            name='similarity-rebuild',
+            daemon=True
+        ).start()
+    return index
+
+def refresh_similarity_index(vehicle_ids=None):
+    """
+    Listener de invalidação: aplica as escritas de veículos ao índice
+    Invalidação total ou muitas alterações marcam o índice para reconstrução
+    """
+    with update_lock:
+        if index_state['rebuilding']:
+            # O catálogo lido pela reconstrução pode não incluir esta escrita
+            if vehicle_ids is None:
+                index_state['pending_full'] = True
+            else:
+                index_state['pending'].update(int(vid) for vid in vehicle_ids)
+
+        index = index_state['index']
+        if index is None or index_state['stale']:
+            return
+
+        if vehicle_ids is None or len(vehicle_ids) > MAX_INCREMENTAL_CHANGES:
+            index_state['stale'] = True
+            return
+
+        vehicle_ids = {int(vid) for vid in vehicle_ids}
+        try:
+            index_state['index'], affected = index.with_changes(vehicle_ids, load_feature_rows(vehicle_ids))
+            current_app.logger.info(f"Índice de semelhança atualizado: {affected} veículo(s) recalculado(s)")
+        except IndexOutdated as e:
+            current_app.logger.info(f"Índice de semelhança será reconstruído: {e}")
+            index_state['stale'] = True
+        except Exception as e:
+            current_app.logger.error(f"Erro ao atualizar índice de semelhança: {e}")
+            index_state['stale'] = True
+
+register_invalidation_listener(refresh_similarity_index)
@@ -0,0 +1,378 @@
+"""
+Snapshots estáticos do catálogo público
+Renderiza as respostas públicas de leitura (listagem padrão, listagem por
+categoria, detalhe de cada veículo ativo e contagem por categoria) em arquivos
+JSON pré-comprimidos (gzip) com hash de conteúdo, mais um manifest.json
+Qualquer servidor de arquivos estáticos ou CDN pode servir o catálogo sem o Flask
+Após cada escrita de veículo, apenas os arquivos afetados são regenerados
+"""
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import unicodedata
+from datetime import datetime
+from flask import current_app
+from werkzeug.datastructures import MultiDict
+from src.models.user import db
+from src.models.vehicle import Vehicle
+from src.cache_manager import register_invalidation_listener
+
+MANIFEST_NAME = 'manifest.json'
+
+# Arquivos com hash antigos continuam disponíveis por este tempo após sair do
+# manifest (clientes/CDN que ainda usam o manifest anterior)
+SNAPSHOT_GRACE_SECONDS = 3600
+
+# Páginas renderizadas por listagem (padrão e por categoria)
+SNAPSHOT_MAX_PAGES = 20
+
+# Veículos carregados por consulta na geração completa
+SNAPSHOT_QUERY_CHUNK = 500
+
+def slugify(value):
+    """Nome de arquivo seguro para uma categoria (ex.: Conversível -> conversivel)"""
+    normalized = unicodedata.normalize('NFKD', value).encode('ascii', 'ignore').decode('ascii')
+    return ''.join(char if char.isalnum() else '-' for char in normalized.lower()).strip('-')
+
+def listing_route(page, categoria=None):
+    """Rota pública equivalente a uma página de listagem"""
+    if categoria:
+        return f"/api/vehicles?categoria={categoria}&page={page}"
+    return f"/api/vehicles?page={page}"
+
+def listing_path(page, categoria=None):
+    """Caminho do arquivo de uma página de listagem"""
+    if categoria:
+        return f"vehicles/category/{slugify(categoria)}/page-{page}.json"
+    return f"vehicles/page-{page}.json"
+
+def detail_route(vehicle_id):
+    return f"/api/vehicles/{vehicle_id}"
+
+def detail_path(vehicle_id):
+    return f"vehicles/{vehicle_id}.json"
+
+CATEGORIES_ROUTE = '/api/vehicles/categories'
+CATEGORIES_PATH = 'vehicles/categories.json'
+
+def hashed_path(path, content_hash):
+    """vehicles/12.json -> vehicles/12.<hash>.json (arquivo imutável)"""
+    base, extension = os.path.splitext(path)
+    return f"{base}.{content_hash}{extension}"
+
+def atomic_write(root, path, data):
+    """Grava o arquivo em um temporário no mesmo diretório e troca com os.replace"""
+    full_path = os.path.join(root, path)
+    directory = os.path.dirname(full_path)
+    os.makedirs(directory, exist_ok=True)
+
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as temp_file:
+            temp_file.write(data)
+        os.replace(temp_path, full_path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+def remove_file(root, path):
+    for candidate in (path, path + '.gz'):
+        try:
+            os.remove(os.path.join(root, candidate))
+        except FileNotFoundError:
+            pass
+
+class SnapshotWriter:
+    """Grava arquivos do snapshot e mantém o manifest (rota -> arquivo)"""
+
+    def __init__(self, root):
+        self.root = root
+        self.manifest = self.load_manifest()
+        self.files = self.manifest.setdefault('files', {})
+        self.written = 0
+        self.unchanged = 0
+        self.removed = 0
+
+    def load_manifest(self):
+        try:
+            with open(os.path.join(self.root, MANIFEST_NAME), 'r', encoding='utf-8') as manifest_file:
+                return json.load(manifest_file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {'files': {}}
+
+    def write(self, route, path, payload, **extra):
+        """
+        Serializa o payload e grava <path>, <path>.gz e as cópias com hash
+        Conteúdo idêntico ao do manifest atual não é regravado
+        """
+        body = current_app.json.dumps(payload).encode('utf-8')
+        content_hash = hashlib.md5(body).hexdigest()[:16]
+        versioned_path = hashed_path(path, content_hash)
+
+        entry = self.files.get(route)
+        if (entry and entry['hash'] == content_hash and entry['path'] == path
+                and os.path.exists(os.path.join(self.root, versioned_path))):
+            entry.update(extra)
+            self.unchanged += 1
+            return entry
+
+        # mtime=0: o mesmo conteúdo gera sempre o mesmo .gz
+        compressed = gzip.compress(body, compresslevel=9, mtime=0)
+
+        atomic_write(self.root, versioned_path, body)
+        atomic_write(self.root, versioned_path + '.gz', compressed)
+        atomic_write(self.root, path, body)
+        atomic_write(self.root, path + '.gz', compressed)
+
+        entry = {
+            'path': path,
+            'hashed_path': versioned_path,
+            'hash': content_hash,
+            'size': len(body),
+            'gzip_size': len(compressed),
+            **extra
+        }
+        self.files[route] = entry
+        self.written += 1
+        return entry
+
+    def remove(self, route):
+        """Remove uma rota do snapshot (o arquivo com hash expira pelo prune)"""
+        entry = self.files.pop(route, None)
+        if entry:
+            remove_file(self.root, entry['path'])
+            self.removed += 1
+
+    def routes_with_prefix(self, prefix):
+        return [route for route in self.files if route.startswith(prefix)]
+
+    def save(self):
+        """Publica o manifest (por último, depois de todos os arquivos)"""
+        self.manifest['generated_at'] = datetime.utcnow().isoformat()
+        body = json.dumps(self.manifest, ensure_ascii=False, indent=2, sort_keys=True).encode('utf-8')
+        atomic_write(self.root, MANIFEST_NAME, body)
+        self.prune()
+
+    def prune(self):
+        """Apaga arquivos com hash fora do manifest há mais de SNAPSHOT_GRACE_SECONDS"""
+        referenced = set()
+        for entry in self.files.values():
+            referenced.update((entry['path'], entry['hashed_path']))
+
+        deadline = time.time() - SNAPSHOT_GRACE_SECONDS
+        for directory, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                full_path = os.path.join(directory, filename)
+                relative = os.path.relpath(full_path, self.root).replace(os.sep, '/')
+                base = relative[:-3] if relative.endswith('.gz') else relative
+                if base == MANIFEST_NAME or base in referenced:
+                    continue
+                if os.path.getmtime(full_path) < deadline:
+                    os.remove(full_path)
+
+    def summary(self):
+        return {
+            'files': len(self.files),
+            'written': self.written,
+            'unchanged': self.unchanged,
+            'removed': self.removed
+        }
+
+def detail_payload(vehicle):
+    """Mesmo corpo de GET /api/vehicles/<id>"""
+    return {
+        'vehicle': vehicle.to_dict(),
+        'cache_info': {
+            'cached': True,
+            'cache_timeout': 7200
+        }
+    }
+
+def write_listing_pages(writer, categoria=None):
+    """Renderiza as páginas de uma listagem e remove as que deixaram de existir"""
+    from src.routes.vehicles_cached import build_vehicles_listing
+
+    page = 1
+    while True:
+        args = MultiDict({'page': str(page)})
+        if categoria:
+            args['categoria'] = categoria
+        listing = build_vehicles_listing(args)
+        writer.write(listing_route(page, categoria), listing_path(page, categoria), listing)
+
+        if not listing['pagination']['has_next'] or page >= SNAPSHOT_MAX_PAGES:
+            break
+        page += 1
+
+    # Páginas além da última atual (catálogo diminuiu)
+    prefix = listing_route(1, categoria).rsplit('page=', 1)[0] + 'page='
+    for route in writer.routes_with_prefix(prefix):
+        route_page = route.rsplit('page=', 1)[1]
+        if route_page.isdigit() and int(route_page) > page:
+            writer.remove(route)
+
+def write_categories(writer, categories):
+    """Contagem por categoria + listagens de cada categoria informada"""
+    from src.routes.vehicles_cached import build_categories
+
+    writer.write(CATEGORIES_ROUTE, CATEGORIES_PATH, build_categories())
+    for categoria in sorted(categories):
+        write_listing_pages(writer, categoria)
+
+def active_categories():
+    rows = db.session.query(Vehicle.categoria).filter(
+        Vehicle.is_active == True, Vehicle.categoria.isnot(None)
+    ).distinct()
+    return {categoria for (categoria,) in rows}
+
+def generate_full_snapshot(root):
+    """Gera o snapshot completo do catálogo ativo"""
+    writer = SnapshotWriter(root)
+    generated_ids = set()
+
+    query = Vehicle.query.filter_by(is_active=True).order_by(Vehicle.id).yield_per(SNAPSHOT_QUERY_CHUNK)
+    for vehicle in query:
+        writer.write(
+            detail_route(vehicle.id), detail_path(vehicle.id), detail_payload(vehicle),
+            categoria=vehicle.categoria
+        )
+        generated_ids.add(detail_route(vehicle.id))
+
+    # Detalhes de veículos que não estão mais ativos
+    for route in writer.routes_with_prefix('/api/vehicles/'):
+        if route.rsplit('/', 1)[1].isdigit() and route not in generated_ids:
+            writer.remove(route)
+
+    write_listing_pages(writer)
+
+    categories = active_categories()
+    write_categories(writer, categories)
+
+    # Categorias sem veículos ativos
+    for route in writer.routes_with_prefix('/api/vehicles?categoria='):
+        categoria = route.split('categoria=', 1)[1].split('&', 1)[0]
+        if categoria not in categories:
+            writer.remove(route)
+
+    writer.save()
+    return writer.summary()
+
+def generate_partial_snapshot(root, vehicle_ids):
+    """
+    Regenera apenas os arquivos afetados pelos veículos informados:
+    detalhes dos veículos, listagem padrão, contagem por categoria e as
+    listagens das categorias antigas (pelo manifest) e novas dos veículos
+    """
+    writer = SnapshotWriter(root)
+    if not writer.files:
+        # Sem snapshot anterior: não há o que atualizar parcialmente
+        return generate_full_snapshot(root)
+
+    vehicles = {
+        vehicle.id: vehicle
+        for vehicle in Vehicle.query.filter(Vehicle.id.in_(vehicle_ids)).all()
+    }
+
+    categories = set()
+    for vehicle_id in vehicle_ids:
+        route = detail_route(vehicle_id)
+        previous = writer.files.get(route)
+        if previous and previous.get('categoria'):
+            categories.add(previous['categoria'])
+
+        vehicle = vehicles.get(vehicle_id)
+        if vehicle and vehicle.is_active:
+            writer.write(route, detail_path(vehicle_id), detail_payload(vehicle), categoria=vehicle.categoria)
+            if vehicle.categoria:
+                categories.add(vehicle.categoria)
+        else:
+            writer.remove(route)
+
+    write_listing_pages(writer)
+
+    current_categories = active_categories()
+    write_categories(writer, categories & current_categories)
+
+    # Categoria que ficou sem veículos ativos
+    for categoria in categories - current_categories:
+        for route in writer.routes_with_prefix(f'/api/vehicles?categoria={categoria}&'):
+            writer.remove(route)
+
+    writer.save()
+    return writer.summary()
+
+# ==================== REGENERAÇÃO APÓS ESCRITAS ====================
+
+# Veículos pendentes (None = regeneração completa) e controle da thread
+regeneration_state = {
+    'pending': False,
+    'vehicle_ids': set(),
+    'full': False,
+    'running': False
+}
+regeneration_lock = threading.Lock()
+
+# Apenas uma geração por vez grava no diretório
+generation_lock = threading.Lock()
+
+def regenerate_snapshot(app, vehicle_ids=None):
+    """Gera o snapshot (parcial ou completo) dentro de um app context"""
+    root = app.config['SNAPSHOT_DIR']
+    with app.app_context(), generation_lock:
+        started = time.time()
+        if vehicle_ids is None:
+            summary = generate_full_snapshot(root)
+        else:
+            summary = generate_partial_snapshot(root, sorted(vehicle_ids))
+        app.logger.info(f"Snapshot estático atualizado em {time.time() - started:.2f}s: {summary}")
+        return summary
+
+def regeneration_worker(app):
+    """Processa os pedidos pendentes, agrupando rajadas de escrita"""
+    while True:
+        with regeneration_lock:
+            if not regeneration_state['pending']:
+                regeneration_state['running'] = False
+                return
+            vehicle_ids = None if regeneration_state['full'] else set(regeneration_state['vehicle_ids'])
+            regeneration_state['pending'] = False
+            regeneration_state['full'] = False
+            regeneration_state['vehicle_ids'] = set()
+
+        try:
+            regenerate_snapshot(app, vehicle_ids)
+        except Exception as e:
+            app.logger.error(f"Erro ao regenerar snapshot estático: {e}")
+
+def schedule_snapshot_regeneration(app, vehicle_ids=None):
+    """Agenda a regeneração em uma thread de fundo (no máximo uma por processo)"""
+    with regeneration_lock:
+        regeneration_state['pending'] = True
+        if vehicle_ids is None:
+            regeneration_state['full'] = True
+        else:
+            regeneration_state['vehicle_ids'].update(int(vid) for vid in vehicle_ids)
+
+        if regeneration_state['running']:
+            return
+        regeneration_state['running'] = True
+
+    thread = threading.Thread(target=regeneration_worker, args=(app,), daemon=True)
+    thread.start()
+
+def on_vehicle_cache_invalidated(vehicle_ids=None):
+    """Listener de invalidação: regenera os arquivos dos veículos alterados"""
+    if current_app.config.get('SNAPSHOT_DIR'):
+        schedule_snapshot_regeneration(current_app._get_current_object(), vehicle_ids)
+
+def init_snapshots(app):
+    """Ativa a regeneração automática quando SNAPSHOT_DIR está configurado"""
+    if not app.config.get('SNAPSHOT_DIR'):
+        return
+    register_invalidation_listener(on_vehicle_cache_invalidated)
+    app.logger.info(f"Snapshots estáticos em {app.config['SNAPSHOT_DIR']}")
@@ -0,0 +1,227 @@
+"""
+Importação em massa de veículos (NDJSON/CSV) a partir do feed do DMS
+Lê a entrada em streaming, valida em lotes com VehicleSchema(many=True)
+e faz upsert pela chave externa (external_id) com INSERT ... ON CONFLICT,
+confirmando uma transação por lote
+A invalidação do cache acontece uma única vez, ao final da importação
+"""
+import csv
+import io
+import json
+from datetime import datetime
+from marshmallow import fields, validate, ValidationError, EXCLUDE
+from sqlalchemy.dialects import postgresql, sqlite
+from src.models.user import db
+from src.models.vehicle import Vehicle
+from src.schemas import VehicleSchema
+from src.cache_manager import invalidate_vehicle_cache
+from src.event_stream import broker
+
+# Registros validados e gravados por transação
+IMPORT_CHUNK_SIZE = 500
+
+# Limite de erros detalhados no relatório (os demais são apenas contados)
+MAX_REPORTED_ERRORS = 1000
+
+# Colunas gravadas pela importação (external_id é a chave do upsert)
+IMPORT_COLUMNS = [
+    'marca', 'modelo', 'ano', 'preco', 'sob_consulta', 'descricao',
+    'combustivel', 'cambio', 'cor', 'quilometragem', 'categoria',
+    'whatsapp_link', 'imagens'
+]
+
+# Implementações de INSERT ... ON CONFLICT por dialeto
+UPSERT_DIALECTS = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert
+}
+
+class VehicleImportSchema(VehicleSchema):
+    """Schema de importação: campos do veículo + chave externa do DMS"""
+    class Meta:
+        # Colunas extras do arquivo (ex.: id, created_at de uma exportação) são ignoradas
+        unknown = EXCLUDE
+
+    external_id = fields.Str(required=True, validate=validate.Length(min=1, max=100))
+
+def iter_ndjson_records(stream):
+    """Lê registros NDJSON linha a linha; gera (linha, registro ou erro)"""
+    text_stream = io.TextIOWrapper(stream, encoding='utf-8')
+
+    for line_number, line in enumerate(text_stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield line_number, ValueError(f'JSON inválido: {e.msg}')
+            continue
+
+        if not isinstance(record, dict):
+            yield line_number, ValueError('Cada linha deve ser um objeto JSON')
+            continue
+
+        yield line_number, record
+
+def iter_csv_records(stream):
+    """Lê registros CSV com cabeçalho; gera (linha, registro)"""
+    text_stream = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+    reader = csv.DictReader(text_stream)
+
+    for row in reader:
+        # Células vazias equivalem a campos ausentes
+        record = {key: value for key, value in row.items() if key and value not in (None, '')}
+
+        # Lista de imagens serializada como JSON na célula
+        imagens = record.get('imagens')
+        if isinstance(imagens, str):
+            try:
+                record['imagens'] = json.loads(imagens)
+            except json.JSONDecodeError:
+                record['imagens'] = [url for url in imagens.split('|') if url]
+
+        # reader.line_num aponta para a linha física onde o registro termina
+        yield reader.line_num, record
+
+def iter_chunks(records, size):
+    """Agrupa o iterador de registros em listas de até size elementos"""
+    chunk = []
+    for item in records:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def build_row(data, now):
+    """Converte um registro validado na linha da tabela vehicles"""
+    row = {column: data.get(column) for column in IMPORT_COLUMNS}
+    row['external_id'] = data['external_id']
+    row['sob_consulta'] = data.get('sob_consulta', False)
+    row['quilometragem'] = data.get('quilometragem', 0)
+    row['imagens'] = json.dumps(data['imagens']) if data.get('imagens') else None
+    row['is_active'] = True
+    row['created_at'] = now
+    row['updated_at'] = now
+    return row
+
+def upsert_rows(rows):
+    """
+    Grava um lote com um único INSERT ... ON CONFLICT (executemany)
+    Retorna (criados, atualizados)
+    """
+    dialect = db.engine.dialect.name
+    insert = UPSERT_DIALECTS.get(dialect)
+    if insert is None:
+        raise RuntimeError(f'Upsert não suportado para o banco {dialect}')
+
+    # Uma consulta IN para separar criações de atualizações no relatório
+    external_ids = [row['external_id'] for row in rows]
+    existing = {
+        external_id for (external_id,) in db.session.query(Vehicle.external_id).filter(
+            Vehicle.external_id.in_(external_ids)
+        )
+    }
+
+    statement = insert(Vehicle.__table__)
+    statement = statement.on_conflict_do_update(
+        index_elements=['external_id'],
+        # is_active e created_at são preservados em veículos já existentes
+        set_={column: statement.excluded[column] for column in IMPORT_COLUMNS + ['updated_at']}
+    )
+    db.session.execute(statement, rows)
+
+    updated = len(set(external_ids) & existing)
+    return len(rows) - updated, updated
+
+def import_vehicles(stream, file_format='ndjson', chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Importa veículos de um stream binário (NDJSON ou CSV)
+    Retorna o relatório com totais e erros por linha
+    """
+    if file_format == 'csv':
+        records = iter_csv_records(stream)
+    elif file_format == 'ndjson':
+        records = iter_ndjson_records(stream)
+    else:
+        raise ValueError('Formato inválido (use ndjson ou csv)')
+
+    report = {
+        'processed': 0,
+        'created': 0,
+        'updated': 0,
+        'failed': 0,
+        'errors': []
+    }
+
+    def add_error(line_number, external_id, errors):
+        report['failed'] += 1
+        if len(report['errors']) < MAX_REPORTED_ERRORS:
+            report['errors'].append({
+                'line': line_number,
+                'external_id': external_id,
+                'errors': errors
+            })
+
+    schema = VehicleImportSchema(many=True)
+
+    for chunk in iter_chunks(records, chunk_size):
+        report['processed'] += len(chunk)
+
+        # Erros de leitura (ex.: JSON inválido) não chegam à validação
+        parsed = []
+        for line_number, record in chunk:
+            if isinstance(record, Exception):
+                add_error(line_number, None, {'_schema': [str(record)]})
+            else:
+                parsed.append((line_number, record))
+
+        if not parsed:
+            continue
+
+        try:
+            valid_data = schema.load([record for _, record in parsed])
+            messages = {}
+        except ValidationError as e:
+            valid_data = e.valid_data
+            messages = e.messages
+
+        now = datetime.utcnow()
+        rows_by_external_id = {}
+        lines_by_external_id = {}
+
+        for index, (line_number, record) in enumerate(parsed):
+            if index in messages:
+                add_error(line_number, record.get('external_id'), messages[index])
+                continue
+
+            row = build_row(valid_data[index], now)
+            # Chave repetida no mesmo lote: prevalece a última ocorrência
+            rows_by_external_id[row['external_id']] = row
+            lines_by_external_id.setdefault(row['external_id'], []).append(line_number)
+
+        if not rows_by_external_id:
+            continue
+
+        try:
+            created, updated = upsert_rows(list(rows_by_external_id.values()))
+            db.session.commit()
+            report['created'] += created
+            report['updated'] += updated
+        except Exception as e:
+            db.session.rollback()
+            for external_id, line_numbers in lines_by_external_id.items():
+                for line_number in line_numbers:
+                    add_error(line_number, external_id, {'_schema': [f'Erro ao gravar: {e}']})
+
+    # Invalidação única ao final da importação
+    if report['created'] or report['updated']:
+        invalidate_vehicle_cache()
+        broker.publish('catalog.imported', {
+            'created': report['created'],
+            'updated': report['updated']
+        })
+
+    return report
@@ -0,0 +1,169 @@
+"""
+Contadores de visualizações e cliques no WhatsApp com escrita em lote (write-behind)
+Os eventos incrementam contadores em memória de cada worker e uma thread
+de fundo grava tudo a cada poucos segundos com um único upsert multi-linha
+Assim o caminho de leitura (inclusive com cache) não faz escrita no banco
+As visualizações também são somadas em vehicles.views, na mesma transação,
+para ordenar a listagem por popularidade sem join
+"""
+import atexit
+import threading
+import time
+from datetime import datetime
+from functools import wraps
+from sqlalchemy import select, update, bindparam
+from sqlalchemy.dialects import postgresql, sqlite
+from src.models.user import db
+from src.models.vehicle import Vehicle, VehicleStats
+
+# Intervalo padrão entre gravações (segundos)
+DEFAULT_FLUSH_INTERVAL = 5
+
+COUNTER_FIELDS = ('views', 'whatsapp_clicks')
+
+# Implementações de INSERT ... ON CONFLICT por dialeto
+UPSERT_DIALECTS = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert
+}
+
+# Contadores pendentes deste worker: {vehicle_id: {'views': n, 'whatsapp_clicks': n}}
+pending_counts = {}
+pending_lock = threading.Lock()
+
+flusher_state = {'thread': None}
+
+def increment(vehicle_id, field, amount=1):
+    """Incrementa um contador em memória (custo O(1), sem acesso ao banco)"""
+    with pending_lock:
+        counts = pending_counts.get(vehicle_id)
+        if counts is None:
+            counts = pending_counts[vehicle_id] = {name: 0 for name in COUNTER_FIELDS}
+        counts[field] += amount
+
+def record_view(vehicle_id):
+    """Registra uma visualização do detalhe do veículo"""
+    increment(int(vehicle_id), 'views')
+
+def record_whatsapp_click(vehicle_id):
+    """Registra um clique no link do WhatsApp do veículo"""
+    increment(int(vehicle_id), 'whatsapp_clicks')
+
+def drain_pending():
+    """Retira e retorna todos os contadores pendentes"""
+    global pending_counts
+    with pending_lock:
+        drained = pending_counts
+        pending_counts = {}
+    return drained
+
+def restore_pending(counts):
+    """Devolve contadores não gravados para a próxima tentativa"""
+    for vehicle_id, values in counts.items():
+        for field, amount in values.items():
+            if amount:
+                increment(vehicle_id, field, amount)
+
+def flush_counters():
+    """
+    Grava os contadores pendentes com um único INSERT ... ON CONFLICT
+    Deve ser chamada dentro de um app context. Retorna a quantidade de veículos gravados
+    """
+    counts = drain_pending()
+    if not counts:
+        return 0
+
+    try:
+        # Descartar IDs inexistentes (cliques em veículos removidos) em uma consulta
+        existing = set(db.session.scalars(
+            select(Vehicle.id).where(Vehicle.id.in_(list(counts)))
+        ))
+        rows = [
+            {'vehicle_id': vehicle_id, 'updated_at': datetime.utcnow(), **values}
+            for vehicle_id, values in counts.items()
+            if vehicle_id in existing
+        ]
+        if not rows:
+            return 0
+
+        dialect = db.engine.dialect.name
+        insert = UPSERT_DIALECTS.get(dialect)
+        if insert is None:
+            raise RuntimeError(f'Upsert não suportado para o banco {dialect}')
+
+        table = VehicleStats.__table__
+        statement = insert(table).values(rows)
+        statement = statement.on_conflict_do_update(
+            index_elements=['vehicle_id'],
+            set_={
+                'views': table.c.views + statement.excluded.views,
+                'whatsapp_clicks': table.c.whatsapp_clicks + statement.excluded.whatsapp_clicks,
+                'updated_at': statement.excluded.updated_at
+            }
+        )
+        db.session.execute(statement)
+
+        # updated_at explícito: visualizações não contam como alteração do veículo
+        vehicles = Vehicle.__table__
+        view_rows = [{'row_id': row['vehicle_id'], 'added_views': row['views']} for row in rows if row['views']]
+        if view_rows:
+            db.session.execute(
+                update(vehicles)
+                .where(vehicles.c.id == bindparam('row_id'))
+                .values(views=vehicles.c.views + bindparam('added_views'), updated_at=vehicles.c.updated_at),
+                view_rows
+            )
+
+        db.session.commit()
+        return len(rows)
+
+    except Exception:
+        db.session.rollback()
+        restore_pending(counts)
+        raise
+
+def flusher_loop(app, interval):
+    """Loop da thread de gravação periódica"""
+    while True:
+        time.sleep(interval)
+        with app.app_context():
+            try:
+                flush_counters()
+            except Exception as e:
+                app.logger.error(f"Erro ao gravar contadores: {e}")
+
+def start_counter_flusher(app):
+    """Inicia a thread de gravação dos contadores (uma por processo)"""
+    if flusher_state['thread'] is not None:
+        return
+
+    interval = app.config.get('COUNTER_FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL)
+    thread = threading.Thread(target=flusher_loop, args=(app, interval), daemon=True)
+    thread.start()
+    flusher_state['thread'] = thread
+
+    # Gravar o que restar ao encerrar o processo
+    def flush_on_exit():
+        with app.app_context():
+            try:
+                flush_counters()
+            except Exception as e:
+                print(f"Erro ao gravar contadores no encerramento: {e}")
+
+    atexit.register(flush_on_exit)
+
+def track_vehicle_view(f):
+    """
+    Decorator que conta visualizações bem-sucedidas do detalhe do veículo
+    Deve ficar acima do decorator de cache para contar também os HITs
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        result = f(*args, **kwargs)
+
+        status = result[1] if isinstance(result, tuple) and len(result) > 1 else getattr(result, 'status_code', 200)
+        if status == 200:
+            record_view(kwargs.get('vehicle_id', args[0] if args else None))
+
+        return result
+    return decorated_function